@@ -3,8 +3,11 @@ from datetime import datetime
 import os
 from getcalendar import init_calendar_routes, get_calendar_service
 from directions import TravelTimeCalculator
-from flask_mail import Mail, Message
+from flask_mail import BadHeaderError, Mail, Message, sanitize_address, sanitize_addresses
+from smtp_pool import SMTPPool
 import stripe
+import resilience
+import time
 import uuid
 from email.mime.base import MIMEBase
 from email import encoders
@@ -21,6 +24,37 @@ app.config['MAIL_USERNAME'] = 'ryanchenyang@gmail.com'
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')  # Get from environment variable
 app.config['MAIL_DEFAULT_SENDER'] = ('Silentwash', 'contact@silentwashev.com')  # Tuple format for name + email
 mail = Mail(app)
+# Messages go out over pooled, kept-alive SMTP connections instead of
+# Flask-Mail's new SSL connection and login per message
+mail_pool = SMTPPool(
+    app.config['MAIL_SERVER'],
+    app.config['MAIL_PORT'],
+    username=app.config['MAIL_USERNAME'],
+    password=app.config['MAIL_PASSWORD'],
+    use_ssl=app.config['MAIL_USE_SSL'],
+    use_tls=app.config['MAIL_USE_TLS']
+)
+
+def _envelope(msg):
+    """(from, [to], bytes) for a Flask-Mail Message, checked like Connection.send()"""
+    if msg.has_bad_headers():
+        raise BadHeaderError
+    if msg.date is None:
+        msg.date = time.time()
+    return sanitize_address(msg.sender), sanitize_addresses(msg.send_to), msg.as_bytes()
+
+def send_mail(msg):
+    """Send one Message over a pooled connection"""
+    envelope = _envelope(msg)
+    if not mail.suppress:  # MAIL_SUPPRESS_SEND, or testing
+        mail_pool.send(*envelope)
+
+def send_mail_batch(messages):
+    """Send Messages back to back over one pooled connection; {index: error} for refused ones"""
+    envelopes = [_envelope(msg) for msg in messages]
+    if mail.suppress:
+        return {}
+    return mail_pool.send_batch(envelopes)
 
 # Initialize calendar routes and get service instance
 init_calendar_routes(app)
@@ -28,6 +62,10 @@ calendar_service = get_calendar_service()
 
 # Add after Flask app initialization
 stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
+# Bounded network calls; retries happen in resilience.call()
+stripe.default_http_client = stripe.new_default_http_client(timeout=resilience.TIMEOUTS['stripe'])
+stripe.max_network_retries = 0
+app.before_request(resilience.reset_retry_budget)
 temp_bookings = {}  # Temporary storage (use database in production)
 
 # Routes
@@ -172,7 +210,10 @@ def book_appointment():
             price = service_prices.get(booking_data['service_type'])
             
             # Create Stripe checkout session
-            session = stripe.checkout.Session.create(
+            session = resilience.call(
+                'stripe',
+                stripe.checkout.Session.create,
+                idempotency_key=booking_id,  # Safe to retry
                 payment_method_types=['card'],
                 line_items=[{
                     'price_data': {
@@ -260,7 +301,7 @@ Message:
 {message}
 """
         
-        mail.send(msg)
+        send_mail(msg)
         
         return jsonify({
             'status': 'success',
@@ -382,7 +423,7 @@ The SilentWash Team
         
         # Send the email
         print("\nDEBUG - Attempting to send email...")
-        mail.send(msg)
+        send_mail(msg)
         print("✓ Email sent successfully")
         
     except Exception as e:
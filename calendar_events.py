@@ -0,0 +1,123 @@
+"""
+Compact records for Google Calendar events.
+
+The Calendar API returns each event as a nested dict (start/end dicts with
+ISO strings, description, attendees, ...). Slot and routing logic only needs
+when an event happens, where and what kind it is, so fetched events are
+normalized once into CalendarEvent records: epoch-second ints, an interned
+location id and a kind flag. Everything downstream works on those.
+
+Location ids are interned per normalize_events() call: each call gets its
+own LocationTable, which its events (and widened copies) keep a reference
+to, so the table is freed with them instead of growing for the life of the
+process.
+"""
+
+import threading
+from datetime import datetime
+
+SERVICE = 0  # A customer booking (or any other busy event)
+TRAVEL = 1   # A travel block we created between bookings
+
+TRAVEL_BLOCK_SUMMARY = '🚗 Travel Time'
+NO_LOCATION = -1
+# Padding added to events served from a stale snapshot, in case they moved
+STALE_BUFFER_MINUTES = 30
+
+
+class LocationTable:
+    """Interns location strings to small ints for one batch of events"""
+
+    def __init__(self):
+        self._ids = {}
+        self._names = []
+        self._lock = threading.Lock()
+
+    def id_for(self, name):
+        if not name:
+            return NO_LOCATION
+        location_id = self._ids.get(name)
+        if location_id is None:
+            with self._lock:
+                location_id = self._ids.get(name)
+                if location_id is None:
+                    location_id = len(self._names)
+                    self._names.append(name)
+                    self._ids[name] = location_id
+        return location_id
+
+    def name(self, location_id):
+        return None if location_id == NO_LOCATION else self._names[location_id]
+
+
+class CalendarEvent:
+    """One busy interval on a calendar"""
+
+    __slots__ = ('id', 'start', 'end', 'location', 'kind', 'locations')
+
+    def __init__(self, id, start, end, location=NO_LOCATION, kind=SERVICE, locations=None):
+        self.id = id
+        self.start = start  # Epoch seconds
+        self.end = end
+        self.location = location  # Id in `locations`
+        self.kind = kind
+        self.locations = locations
+
+    @classmethod
+    def from_google(cls, item, tz, locations=None):
+        """Normalize a Calendar API event dict; all-day events span local midnights
+
+        Pass the same LocationTable for every event of a batch so equal
+        locations get equal ids; without one the event gets its own.
+        """
+        if locations is None:
+            locations = LocationTable()
+
+        def epoch(when):
+            if 'dateTime' in when:
+                return int(datetime.fromisoformat(when['dateTime']).timestamp())
+            return int(tz.localize(datetime.strptime(when['date'], '%Y-%m-%d')).timestamp())
+
+        is_travel = item.get('summary') == TRAVEL_BLOCK_SUMMARY
+        return cls(
+            item.get('id'),
+            epoch(item['start']),
+            epoch(item['end']),
+            locations.id_for(item.get('location')),
+            TRAVEL if is_travel else SERVICE,
+            locations
+        )
+
+    @property
+    def location_name(self):
+        if self.locations is None:
+            return None
+        return self.locations.name(self.location)
+
+    @property
+    def is_service(self):
+        return self.kind == SERVICE
+
+    def start_at(self, tz):
+        return datetime.fromtimestamp(self.start, tz)
+
+    def end_at(self, tz):
+        return datetime.fromtimestamp(self.end, tz)
+
+    def __repr__(self):
+        return f"CalendarEvent({self.id!r}, {self.start}-{self.end}, kind={self.kind})"
+
+
+def normalize_events(items, tz):
+    """CalendarEvents for API event dicts, ordered by start"""
+    locations = LocationTable()
+    events = [CalendarEvent.from_google(item, tz, locations) for item in items]
+    events.sort(key=lambda event: event.start)
+    return events
+
+
+def widen(events, minutes):
+    """Copies of events padded by minutes on both sides"""
+    pad = minutes * 60
+    return [CalendarEvent(e.id, e.start - pad, e.end + pad, e.location, e.kind, e.locations)
+            for e in events]
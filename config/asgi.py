@@ -2,6 +2,10 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+This is what production serves (gunicorn with uvicorn workers, see the
+Dockerfile): the availability stream only exists here, not in config.wsgi.
+Streams reach subscribers on other workers through the shared cache
+(config/caches.py), so run more than one host only with CACHE_URL set.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +17,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up
+from scheduler.streams import availability_stream_app  # noqa: E402
+
+STREAM_PREFIX = '/api/availability-stream/'
+
+
+async def application(scope, receive, send):
+    """Serve availability SSE streams directly; everything else goes to Django"""
+    if scope['type'] == 'http' and scope['path'].startswith(STREAM_PREFIX):
+        await availability_stream_app(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
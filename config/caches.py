@@ -0,0 +1,68 @@
+"""
+Cache configuration helpers.
+
+Schedule profile versions, the booking page cache, availability stream
+versions and singleflight locks must be seen by every worker, so the
+default cache is shared: CACHE_URL selects Redis or Memcached (needed once
+the app runs on more than one host), and without it a file cache every
+process on the host reads and writes.
+
+The file cache is for development only: past MAX_ENTRIES it evicts a
+random third of its entries (version keys included), and its add() isn't
+atomic. caches_from_env() requires CACHE_URL when DEBUG is off.
+"""
+
+import os
+import tempfile
+from urllib.parse import parse_qsl, urlparse
+
+from django.core.exceptions import ImproperlyConfigured
+
+BACKENDS = {
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'rediss': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+}
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'smartslot-cache')
+# Django's default of 300 would cull profile and stream version keys under
+# normal load; ?max_entries= overrides it
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def cache_from_url(url):
+    """Convert a cache URL into a Django CACHES entry
+
+    Examples:
+        redis://cache:6379/0
+        memcached://cache:11211
+        file:///var/cache/smartslot   (one host, development only)
+        locmem://?max_entries=1000    (one process only)
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in BACKENDS:
+        raise ValueError(f"Unsupported cache scheme: {parsed.scheme}")
+
+    config = {'BACKEND': BACKENDS[parsed.scheme]}
+    if parsed.scheme in ('redis', 'rediss'):
+        config['LOCATION'] = url
+    elif parsed.scheme == 'memcached':
+        config['LOCATION'] = parsed.netloc
+    elif parsed.scheme == 'file':
+        config['LOCATION'] = parsed.path
+    if parsed.scheme in ('file', 'locmem'):
+        max_entries = dict(parse_qsl(parsed.query)).get('max_entries', DEFAULT_MAX_ENTRIES)
+        config['OPTIONS'] = {'MAX_ENTRIES': int(max_entries)}
+    return config
+
+
+def caches_from_env(debug=True):
+    """CACHES setting from CACHE_URL, defaulting to a host-wide file cache in development"""
+    url = os.getenv('CACHE_URL')
+    if not url:
+        if not debug:
+            raise ImproperlyConfigured("Set CACHE_URL (e.g. redis://cache:6379/0) when DEBUG is off")
+        url = f'file://{DEFAULT_CACHE_DIR}'
+    return {'default': cache_from_url(url)}
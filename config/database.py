@@ -0,0 +1,84 @@
+"""
+Database configuration helpers.
+
+Builds Django ``DATABASES`` entries from ``DATABASE_URL``-style strings so the
+same settings module works for local SQLite and the Postgres instance supplied
+by docker-compose / Elastic Beanstalk.
+"""
+
+import os
+from urllib.parse import parse_qsl, unquote, urlparse
+
+ENGINES = {
+    'postgres': 'django.db.backends.postgresql',
+    'postgresql': 'django.db.backends.postgresql',
+    'pgsql': 'django.db.backends.postgresql',
+    'sqlite': 'django.db.backends.sqlite3',
+    'mysql': 'django.db.backends.mysql',
+}
+
+
+def database_from_url(url, conn_max_age=0, conn_health_checks=False):
+    """Convert a database URL into a Django DATABASES entry
+
+    Examples:
+        postgresql://user:pass@db:5432/smartslot
+        sqlite:///db.sqlite3          (relative path)
+        sqlite:////var/data/db.sqlite3 (absolute path)
+    """
+    parsed = urlparse(url)
+    scheme = parsed.scheme.split('+')[0]
+    if scheme not in ENGINES:
+        raise ValueError(f"Unsupported database scheme: {parsed.scheme}")
+
+    config = {
+        'ENGINE': ENGINES[scheme],
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': conn_health_checks,
+    }
+
+    if scheme == 'sqlite':
+        # Everything after "sqlite://" minus the separator slash is the path
+        config['NAME'] = unquote(url.split('://', 1)[1][1:]) or ':memory:'
+        return config
+
+    config.update({
+        'NAME': unquote(parsed.path.lstrip('/')),
+        'USER': unquote(parsed.username or ''),
+        'PASSWORD': unquote(parsed.password or ''),
+        'HOST': parsed.hostname or '',
+        'PORT': str(parsed.port or ''),
+    })
+
+    # Query string parameters (e.g. ?sslmode=require) become driver options
+    options = dict(parse_qsl(parsed.query))
+    if options:
+        config['OPTIONS'] = options
+
+    return config
+
+
+def databases_from_env(default_url):
+    """Build the DATABASES setting from DATABASE_URL / DATABASE_REPLICA_URL"""
+    conn_max_age = int(os.getenv('DATABASE_CONN_MAX_AGE', '600'))
+
+    databases = {
+        'default': database_from_url(
+            os.getenv('DATABASE_URL', default_url),
+            conn_max_age=conn_max_age,
+            conn_health_checks=True,
+        ),
+    }
+
+    replica_url = os.getenv('DATABASE_REPLICA_URL')
+    if replica_url:
+        replica = database_from_url(
+            replica_url,
+            conn_max_age=conn_max_age,
+            conn_health_checks=True,
+        )
+        # Tests run against the primary; the replica just points at it
+        replica['TEST'] = {'MIRROR': 'default'}
+        databases['replica'] = replica
+
+    return databases
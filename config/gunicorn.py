@@ -0,0 +1,94 @@
+"""
+Gunicorn settings for both web apps:
+
+    gunicorn -c config/gunicorn.py -k uvicorn_worker.UvicornWorker config.asgi:application
+    gunicorn -c config/gunicorn.py backend:app
+
+The Django app runs under ASGI (uvicorn) workers so the availability
+stream in config/asgi.py is served; the Flask app uses the default sync
+workers.
+
+The app is imported once in the master (preload_app) and the hot caches
+are warmed there, in the master's own memory: schedule profiles, the
+travel legs workers saved when they last exited, the Calendar client and
+its parsed discovery document, the road graph. gc.freeze() then moves everything
+built so far out of the collector's reach before workers fork, so workers
+share those pages copy-on-write instead of each building its own copy,
+and the first requests after a deploy don't pay for warming.
+
+Following the gc.freeze() docs, collection is off in the master from here
+on (a collection there would leave freed holes in shared pages) and back
+on in each worker.
+"""
+
+import gc
+import multiprocessing
+import os
+import sys
+
+gc.disable()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """In the master, after the app is loaded and before any worker forks"""
+    warm_caches(server.log)
+    gc.freeze()
+    server.log.info("Froze %d objects for copy-on-write sharing", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    gc.enable()
+
+
+def worker_exit(server, worker):
+    """Leave this worker's known travel legs for the next master to warm"""
+    from directions import save_known_legs
+    try:
+        save_known_legs()
+    except OSError as e:
+        server.log.warning("Could not save travel legs: %s", e)
+
+
+def warm_caches(log):
+    """Warm whatever the loaded app uses; a failed step only costs its warmth"""
+    def step(name, warm):
+        try:
+            result = warm()
+            log.info("Warmed %s%s", name, f" ({result})" if isinstance(result, (int, str)) else "")
+        except Exception as e:
+            log.warning("Could not warm %s: %s", name, e)
+
+    if 'django' in sys.modules:
+        from django.conf import settings
+        if settings.configured:
+            from django.db import connections
+            from django.urls import get_resolver
+            from scheduler.warmup import warm_caches as warm_schedule_profiles
+            # Django imports the URLconf (and so every view module) on the first request
+            step("URLconf", lambda: len(get_resolver().url_patterns))
+            step("schedule profiles", warm_schedule_profiles)
+            # Workers must open their own database connections
+            connections.close_all()
+
+    if 'getcalendar' in sys.modules:
+        from getcalendar import get_calendar_service
+        from google_clients import credentials_configured
+        if credentials_configured():
+            step("calendar client", lambda: get_calendar_service().service)
+        else:
+            log.info("Skipped warming calendar client: no Google credentials configured")
+    if 'google_clients' in sys.modules:
+        from google_clients import calendar_discovery_document
+        step("calendar discovery document", calendar_discovery_document)
+
+    # Both apps route through it; the local backend's road graph is the big one
+    from routing import get_travel_time_backend
+    step("travel time backend", lambda: get_travel_time_backend().name)
+    from directions import load_known_legs
+    step("recent travel legs", load_known_legs)
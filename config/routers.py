@@ -0,0 +1,69 @@
+"""
+Database routers.
+
+Availability and dashboard reads are the hottest read paths and tolerate a
+little replication lag, so they can be pointed at a read replica. Everything
+else (writes, and reads that must see our own writes) stays on the primary.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+REPLICA_DB_ALIAS = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def read_from_replica():
+    """Route reads of replica-safe models to the replica inside this block"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads(view_func):
+    """View decorator version of read_from_replica()"""
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        with read_from_replica():
+            return view_func(*args, **kwargs)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    """Send read-only availability/dashboard queries to the replica alias"""
+
+    replica_models = {
+        'scheduler.booking',
+        'scheduler.businesshours',
+        'scheduler.businessdailystats',
+        'scheduler.service',
+    }
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get():
+            return None
+        if model._meta.label_lower not in self.replica_models:
+            return None
+        if REPLICA_DB_ALIAS not in connections.databases:
+            return None
+        # Inside a transaction we need to see our own uncommitted writes
+        if transaction.get_connection(DEFAULT_DB_ALIAS).in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -11,8 +11,12 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
+from config.caches import cache_from_url, caches_from_env
+from config.database import databases_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -51,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'resilience.RetryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -80,12 +85,23 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# DATABASE_URL (e.g. postgresql://user:pass@db:5432/smartslot) selects the
+# primary; DATABASE_REPLICA_URL optionally adds a read replica that serves
+# availability and dashboard reads. Falls back to the local SQLite file.
+DATABASES = databases_from_env(f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
+
+DATABASE_ROUTERS = ['config.routers.PrimaryReplicaRouter']
+
+# Shared by every worker (profile versions, page cache, stream versions,
+# singleflight locks): CACHE_URL (e.g. redis://cache:6379/0) when set, else a
+# file cache all processes on the host use (development only; required
+# outside DEBUG). Never per-process LocMemCache, except that tests get a
+# private one instead of the cache a dev server (or Redis) is using.
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    CACHES = {'default': cache_from_url('locmem://')}
+else:
+    CACHES = caches_from_env(debug=DEBUG)
 
 
 # Password validation
@@ -118,6 +134,41 @@ USE_I18N = True
 
 USE_TZ = True
 
+# Local time zone businesses operate in (slot generation, booking days)
+SCHEDULER_TIME_ZONE = os.getenv('SCHEDULER_TIME_ZONE', 'America/New_York')
+
+# Memory-mapped file of day busy masks shared by the workers on a host, kept
+# current by `manage.py refresh_schedule_store` (unset: every worker computes)
+SCHEDULE_STORE_PATH = os.getenv('SCHEDULE_STORE_PATH')
+# Seconds a stored day is trusted; run the refresher with a shorter --interval
+SCHEDULE_STORE_MAX_AGE = int(os.getenv('SCHEDULE_STORE_MAX_AGE', '300'))
+
+# Booking reminders: sent this many hours before the start time by
+# `manage.py send_reminders`, through REMINDER_CHANNEL (dotted path to a
+# scheduler.reminders.Channel; the console one just logs)
+REMINDER_LEAD_HOURS = int(os.getenv('REMINDER_LEAD_HOURS', '24'))
+REMINDER_CHANNEL = os.getenv('REMINDER_CHANNEL', 'scheduler.reminders.ConsoleChannel')
+
+# Outgoing mail (e.g. REMINDER_CHANNEL=scheduler.reminders.EmailChannel) goes
+# over pooled, kept-alive SMTP connections (core.mail, smtp_pool)
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'core.mail.PooledSMTPBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '465'))
+EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL', 'True') == 'True'
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('MAIL_PASSWORD', '')
+EMAIL_TIMEOUT = 10
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', '4'))
+DEFAULT_FROM_EMAIL = 'Silentwash <contact@silentwashev.com>'
+
+# Default per-business token buckets for Google APIs, applied when a business
+# first uses one; tune individual businesses in the admin (Upstream quotas).
+# Calendar costs one token per request, Distance Matrix one per element.
+UPSTREAM_QUOTAS = {
+    'google_calendar': {'capacity': 120, 'refill_per_minute': 60},
+    'google_maps': {'capacity': 600, 'refill_per_minute': 200},
+}
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
@@ -1,5 +1,7 @@
 from django.contrib import admin
+from scheduler.admin import RecentBookingsInline
 from .models import Business, Customer
+from .pagination import EstimatedCountPaginator
 
 @admin.register(Business)
 class BusinessAdmin(admin.ModelAdmin):
@@ -24,11 +26,8 @@ class CustomerAdmin(admin.ModelAdmin):
     search_fields = ('name', 'email', 'phone')
     readonly_fields = ('created_at',)
     ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     # Add inline bookings view
-    class BookingInline(admin.TabularInline):
-        from scheduler.models import Booking
-        model = Booking
-        extra = 0
-
-    inlines = [BookingInline]
+    inlines = [RecentBookingsInline]
@@ -0,0 +1,126 @@
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery, Sum
+from django.http import Http404
+from django.utils import timezone
+from scheduler.models import Booking
+from .pagination import decode_cursor, encode_cursor
+
+PAGE_SIZE = 50
+HISTORY_PAGE_SIZE = 20
+
+
+def _customer_stats(business, now):
+    """Bookings for a business grouped per customer with lifetime stats
+
+    Every aggregate is computed in the one GROUP BY over
+    booking_customer_history_idx (business, customer, start_time); the
+    favourite service is a correlated subquery on the same index, evaluated
+    only for the customers on the page.
+    """
+    kept = ~Q(status='cancelled')
+    visited = kept & Q(start_time__lte=now)
+
+    favourite = (
+        Booking.objects
+        .filter(business=business, customer_id=OuterRef('customer_id'))
+        .filter(kept)
+        .values('service__name')
+        .annotate(times=Count('id'))
+        .order_by('-times', 'service__name')
+        .values('service__name')[:1]
+    )
+
+    return (
+        Booking.objects
+        .filter(business=business)
+        .values('customer_id', 'customer__name', 'customer__email', 'customer__phone')
+        .annotate(
+            bookings=Count('id'),
+            visit_count=Count('id', filter=visited),
+            first_visit=Min('start_time', filter=visited),
+            last_visit=Max('start_time', filter=visited),
+            next_visit=Min('start_time', filter=kept & Q(start_time__gt=now)),
+            total_spend=Sum('service__price', filter=visited),
+            cancellations=Count('id', filter=Q(status='cancelled')),
+            favourite_service=Subquery(favourite),
+        )
+        .order_by('customer_id')
+    )
+
+
+def _serialize_stats(row):
+    def iso(value):
+        return value.isoformat() if value else None
+
+    return {
+        'id': row['customer_id'],
+        'name': row['customer__name'],
+        'email': row['customer__email'],
+        'phone': row['customer__phone'],
+        'bookings': row['bookings'],
+        'visit_count': row['visit_count'],
+        'cancellations': row['cancellations'],
+        'first_visit': iso(row['first_visit']),
+        'last_visit': iso(row['last_visit']),
+        'next_visit': iso(row['next_visit']),
+        'total_spend': str(row['total_spend'] or 0),
+        'favourite_service': row['favourite_service'],
+    }
+
+
+def customer_page(business, after=None):
+    """One page of a business's customers with stats, plus the cursor for the next page
+
+    Keyset pagination on customer id: each page reads the next PAGE_SIZE
+    customers' bookings from the index and stops, however many customers
+    the business has.
+    """
+    rows = _customer_stats(business, timezone.now())
+    try:
+        rows = rows.filter(customer_id__gt=int(after))
+    except (TypeError, ValueError):
+        pass
+
+    page = list(rows[:PAGE_SIZE + 1])
+    next_cursor = str(page[PAGE_SIZE - 1]['customer_id']) if len(page) > PAGE_SIZE else None
+    return [_serialize_stats(row) for row in page[:PAGE_SIZE]], next_cursor
+
+
+def customer_history(business, customer_id, before=None):
+    """Stats and one page of booking history (newest first) for a customer
+
+    Raises Http404 if the customer has never booked with this business.
+    """
+    row = _customer_stats(business, timezone.now()).filter(customer_id=customer_id).first()
+    if row is None:
+        raise Http404("Customer has no bookings with this business")
+
+    bookings = (
+        Booking.objects
+        .filter(business=business, customer_id=customer_id)
+        .select_related('service')
+        .order_by('-start_time', '-id')
+    )
+    position = decode_cursor(before)
+    if position:
+        start_time, booking_id = position
+        bookings = bookings.filter(
+            Q(start_time__lt=start_time) | Q(start_time=start_time, id__lt=booking_id)
+        )
+
+    page = list(bookings[:HISTORY_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(page) > HISTORY_PAGE_SIZE:
+        last = page[HISTORY_PAGE_SIZE - 1]
+        next_cursor = encode_cursor(last.start_time, last.id)
+
+    history = [{
+        'id': booking.id,
+        'service': booking.service.name,
+        'price': str(booking.service.price),
+        'start_time': booking.start_time.isoformat(),
+        'end_time': booking.end_time.isoformat(),
+        'status': booking.status,
+        'notes': booking.notes,
+    } for booking in page[:HISTORY_PAGE_SIZE]]
+
+    return _serialize_stats(row), history, next_cursor
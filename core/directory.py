@@ -0,0 +1,64 @@
+import time
+from django.core.cache import cache
+from django.db.models import Q
+from django.template.loader import render_to_string
+from .models import Business
+from .pagination import decode_cursor, encode_cursor
+
+PAGE_SIZE = 24
+FRAGMENT_TIMEOUT = 60 * 15
+VERSION_KEY = 'business_directory:version'
+
+
+def invalidate_directory():
+    """Drop every cached directory page (called when a Business changes)"""
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def directory_page(cursor=None):
+    """One page of businesses, newest first, plus the cursor for the next page
+
+    Keyset pagination on (created_at, id) so every page is an index range scan,
+    however many businesses there are.
+    """
+    rows = Business.objects.order_by('-created_at', '-id').values(
+        'id', 'name', 'booking_url', 'created_at'
+    )
+    position = decode_cursor(cursor)
+    if position:
+        created_at, business_id = position
+        rows = rows.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=business_id)
+        )
+
+    page = list(rows[:PAGE_SIZE + 1])
+    next_cursor = None
+    if len(page) > PAGE_SIZE:
+        last = page[PAGE_SIZE - 1]
+        next_cursor = encode_cursor(last['created_at'], last['id'])
+    return page[:PAGE_SIZE], next_cursor
+
+
+def render_directory(cursor=None):
+    """Rendered directory HTML for a page, cached until any Business changes"""
+    position = decode_cursor(cursor)
+    page_key = encode_cursor(*position) if position else 'first'
+    key = f'business_directory:{_version()}:{page_key}'
+
+    html = cache.get(key)
+    if html is None:
+        businesses, next_cursor = directory_page(cursor)
+        html = render_to_string('core/shared/business_directory.html', {
+            'businesses': businesses,
+            'next_cursor': next_cursor,
+        })
+        cache.set(key, html, FRAGMENT_TIMEOUT)
+    return html
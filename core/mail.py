@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.message import sanitize_address
+from smtp_pool import SMTPPool
+
+_pools = {}
+
+
+def get_smtp_pool():
+    """This process's pool for the configured EMAIL_HOST"""
+    key = (settings.EMAIL_HOST, settings.EMAIL_PORT, settings.EMAIL_HOST_USER)
+    if key not in _pools:
+        _pools[key] = SMTPPool(
+            settings.EMAIL_HOST,
+            settings.EMAIL_PORT,
+            username=settings.EMAIL_HOST_USER,
+            password=settings.EMAIL_HOST_PASSWORD,
+            use_ssl=settings.EMAIL_USE_SSL,
+            use_tls=settings.EMAIL_USE_TLS,
+            size=getattr(settings, 'EMAIL_POOL_SIZE', 4),
+            timeout=settings.EMAIL_TIMEOUT or 10
+        )
+    return _pools[key]
+
+
+class PooledSMTPBackend(BaseEmailBackend):
+    """Email backend sending over pooled SMTP connections (see smtp_pool)
+
+    send_messages() sends its whole list over one connection, and
+    connections stay open between calls instead of one handshake per
+    send_mail().
+    """
+
+    def send_batch(self, email_messages):
+        """Send messages over one pooled connection; {index: error} for refused ones"""
+        indexes, envelopes = [], []
+        for i, message in enumerate(email_messages):
+            if not message.recipients():
+                continue
+            encoding = message.encoding or settings.DEFAULT_CHARSET
+            indexes.append(i)
+            envelopes.append((
+                sanitize_address(message.from_email, encoding),
+                [sanitize_address(address, encoding) for address in message.recipients()],
+                message.message().as_bytes(linesep='\r\n')
+            ))
+        if not envelopes:
+            return {}
+        refused = get_smtp_pool().send_batch(envelopes)
+        return {indexes[i]: error for i, error in refused.items()}
+
+    def send_messages(self, email_messages):
+        try:
+            refused = self.send_batch(email_messages)
+        except OSError:
+            if not self.fail_silently:
+                raise
+            return 0
+        if refused and not self.fail_silently:
+            raise next(iter(refused.values()))
+        return sum(1 for message in email_messages if message.recipients()) - len(refused)
+
+
+def send_mail_batch(email_messages, connection=None):
+    """Send EmailMessages together; {index: error} for the ones not sent
+
+    Over the pooled backend the batch shares one SMTP connection. Other
+    backends get one connection opened for the batch and a send per message.
+    """
+    connection = connection or get_connection()
+    if hasattr(connection, 'send_batch'):
+        return connection.send_batch(email_messages)
+    failed = {}
+    with connection:
+        for i, message in enumerate(email_messages):
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                failed[i] = e
+    return failed
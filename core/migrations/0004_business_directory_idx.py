@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_business_calendar_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='business',
+            index=models.Index(fields=['-created_at', '-id'], name='business_directory_idx'),
+        ),
+    ]
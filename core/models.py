@@ -20,6 +20,10 @@ class Business(models.Model):
         verbose_name = 'business'        # Singular form
         verbose_name_plural = 'businesses'  # Plural form
         ordering = ['-created_at']       # Default ordering
+        indexes = [
+            # Keyset pagination for the public directory
+            models.Index(fields=['-created_at', '-id'], name='business_directory_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.booking_url:
@@ -0,0 +1,9 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .directory import invalidate_directory
+from .models import Business
+
+
+@receiver([post_save, post_delete], sender=Business)
+def business_changed(sender, instance, **kwargs):
+    invalidate_directory()
@@ -5,4 +5,10 @@ register = template.Library()
 @register.filter
 def get_item(dictionary, key):
     """Template filter to get item from dictionary by key"""
-    return dictionary.get(key) 
\ No newline at end of file
+    return dictionary.get(key) 
+
+@register.filter
+def minutes_to_hours(minutes):
+    """Template filter to show a minute count as hours, e.g. 90 -> 1.5"""
+    hours = (minutes or 0) / 60
+    return f"{hours:.1f}".rstrip('0').rstrip('.')
@@ -1,7 +1,25 @@
-from django.test import TestCase, Client
+from django.test import TestCase, SimpleTestCase, Client, override_settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMessage, get_connection
 from django.contrib.auth.models import User
+from django.db import connections
 from django.urls import reverse
-from .models import Business
+from unittest.mock import patch
+import socketserver
+import threading
+from datetime import time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.utils import timezone
+import pytz
+from config.caches import cache_from_url, caches_from_env
+from config.database import database_from_url
+from config.routers import PrimaryReplicaRouter, read_from_replica
+from scheduler.models import Booking, BusinessDailyStats, BusinessHours, Service
+from smtp_pool import SMTPPool
+from .directory import directory_page
+from .mail import get_smtp_pool, send_mail_batch
+from .models import Business, Customer
 
 # Create your tests here.
 
@@ -44,3 +62,335 @@ class BusinessTests(TestCase):
         self.client.login(username='testuser', password='testpass123')
         response = self.client.get(reverse('core:dashboard'))
         self.assertEqual(response.status_code, 200)
+
+    def test_dashboard_analytics_window(self):
+        service = Service.objects.create(business=self.business, name='Cut', duration=30, price=Decimal('25.00'))
+        today = timezone.now().astimezone(pytz.timezone(settings.SCHEDULER_TIME_ZONE)).date()
+        for days_ago in (0, 29, 30, -1):  # Booked ahead: not revenue yet
+            BusinessDailyStats.objects.create(business=self.business, service=service,
+                                              date=today - timedelta(days=days_ago),
+                                              bookings=1, revenue=Decimal('25.00'))
+
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('core:dashboard'))
+        self.assertEqual(response.context['analytics']['bookings'], 2)
+        self.assertEqual(response.context['analytics']['revenue'], Decimal('50.00'))
+
+class DatabaseConfigTests(SimpleTestCase):
+    def test_database_from_url_postgres(self):
+        config = database_from_url(
+            'postgresql://postgres:secret@db:5432/smartslot?sslmode=require',
+            conn_max_age=600,
+            conn_health_checks=True
+        )
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(config['NAME'], 'smartslot')
+        self.assertEqual(config['USER'], 'postgres')
+        self.assertEqual(config['PASSWORD'], 'secret')
+        self.assertEqual(config['HOST'], 'db')
+        self.assertEqual(config['PORT'], '5432')
+        self.assertEqual(config['OPTIONS'], {'sslmode': 'require'})
+        self.assertEqual(config['CONN_MAX_AGE'], 600)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+
+    def test_database_from_url_sqlite(self):
+        self.assertEqual(database_from_url('sqlite:///db.sqlite3')['NAME'], 'db.sqlite3')
+        self.assertEqual(database_from_url('sqlite:////tmp/db.sqlite3')['NAME'], '/tmp/db.sqlite3')
+
+    def test_cache_from_url(self):
+        self.assertEqual(cache_from_url('redis://cache:6379/0'), {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://cache:6379/0',
+        })
+        self.assertEqual(cache_from_url('file:///var/cache/smartslot'), {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/var/cache/smartslot',
+            'OPTIONS': {'MAX_ENTRIES': 10000},  # Not Django's 300
+        })
+        self.assertEqual(cache_from_url('locmem://?max_entries=50')['OPTIONS'], {'MAX_ENTRIES': 50})
+        with patch.dict('os.environ', {}, clear=True):
+            self.assertEqual(caches_from_env()['default']['BACKEND'],
+                             'django.core.cache.backends.filebased.FileBasedCache')  # Shared by default
+            with self.assertRaises(ImproperlyConfigured):
+                caches_from_env(debug=False)
+        with self.assertRaises(ValueError):
+            cache_from_url('ftp://cache')
+
+    def test_replica_router(self):
+        from scheduler.models import Booking
+        router = PrimaryReplicaRouter()
+        replica = dict(connections.databases['default'])
+
+        with patch.dict(connections.databases, {'replica': replica}):
+            # Only reads inside read_from_replica() are sent to the replica
+            self.assertIsNone(router.db_for_read(Booking))
+            with read_from_replica():
+                self.assertEqual(router.db_for_read(Booking), 'replica')
+                self.assertIsNone(router.db_for_read(Business))
+            self.assertEqual(router.db_for_write(Booking), 'default')
+            self.assertFalse(router.allow_migrate('replica', 'scheduler'))
+
+class BusinessHoursTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.business = Business.objects.create(
+            owner=self.user,
+            name='Test Business',
+            email='test@business.com',
+            phone='1234567890'
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def post_hours(self, start):
+        data = {}
+        for day in range(7):
+            data[f'start_{day}'] = start
+            data[f'end_{day}'] = '17:00'
+            if day >= 5:
+                data[f'closed_{day}'] = 'on'
+        return self.client.post(reverse('core:business_hours'), data)
+
+    def test_save_hours_upserts(self):
+        self.assertEqual(self.post_hours('09:00').status_code, 200)
+        ids = set(BusinessHours.objects.values_list('id', flat=True))
+        self.assertEqual(len(ids), 7)
+
+        response = self.post_hours('08:00')
+        # Rows are updated in place rather than deleted and re-created
+        self.assertEqual(set(BusinessHours.objects.values_list('id', flat=True)), ids)
+        monday = BusinessHours.objects.get(business=self.business, day_of_week=0)
+        self.assertEqual(monday.start_time, time(8, 0))
+        self.assertEqual(response.context['hours'][0]['start_time'], time(8, 0))
+        self.assertTrue(response.context['hours'][6]['is_closed'])
+
+class LandingDirectoryTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            user = User.objects.create_user(username=f'owner{i}', password='testpass123')
+            Business.objects.create(
+                owner=user,
+                name=f'Business {i}',
+                email=f'owner{i}@business.com',
+                phone='1234567890'
+            )
+
+    @patch('core.directory.PAGE_SIZE', 2)
+    def test_keyset_pages_cover_all_businesses(self):
+        names = []
+        cursor = None
+        while True:
+            page, cursor = directory_page(cursor)
+            names.extend(row['name'] for row in page)
+            if not cursor:
+                break
+        self.assertEqual(names, [f'Business {i}' for i in reversed(range(5))])
+
+    def test_directory_fragment_cached_and_invalidated(self):
+        response = self.client.get(reverse('core:landing'))
+        self.assertContains(response, 'Business 4')
+
+        with self.assertNumQueries(0):
+            self.client.get(reverse('core:landing'))
+
+        user = User.objects.create_user(username='newowner', password='testpass123')
+        Business.objects.create(owner=user, name='Brand New', email='new@business.com', phone='1')
+        self.assertContains(self.client.get(reverse('core:landing')), 'Brand New')
+
+class CustomerHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='testpass123')
+        self.business = Business.objects.create(
+            owner=self.user, name='Test Business', email='test@business.com', phone='1234567890'
+        )
+        self.cut = Service.objects.create(business=self.business, name='Cut', duration=30, price=Decimal('25.00'))
+        self.color = Service.objects.create(business=self.business, name='Color', duration=60, price=Decimal('80.00'))
+        self.customers = [
+            Customer.objects.create(name=f'Customer {i}', email=f'c{i}@example.com', phone='555')
+            for i in range(3)
+        ]
+        past = timezone.now() - timedelta(days=10)
+        alice = self.customers[0]
+        self.book(alice, self.cut, past)
+        self.book(alice, self.cut, past + timedelta(days=1))
+        self.book(alice, self.color, past + timedelta(days=2))
+        self.book(alice, self.color, past + timedelta(days=3), status='cancelled')
+        self.book(alice, self.cut, timezone.now() + timedelta(days=2))
+        for customer in self.customers[1:]:
+            self.book(customer, self.color, past)
+        self.client.login(username='owner', password='testpass123')
+
+    def book(self, customer, service, start, status='confirmed'):
+        return Booking.objects.create(
+            business=self.business, service=service, customer=customer,
+            start_time=start, end_time=start + timedelta(minutes=service.duration), status=status
+        )
+
+    def test_lifetime_stats(self):
+        data = self.client.get(reverse('core:customer_list')).json()
+        alice = data['customers'][0]
+        self.assertEqual(alice['name'], 'Customer 0')
+        self.assertEqual(alice['bookings'], 5)
+        self.assertEqual(alice['visit_count'], 3)
+        self.assertEqual(alice['cancellations'], 1)
+        self.assertEqual(Decimal(alice['total_spend']), Decimal('130.00'))
+        self.assertEqual(alice['favourite_service'], 'Cut')
+        self.assertIsNotNone(alice['next_visit'])
+
+    @patch('core.customers.PAGE_SIZE', 2)
+    def test_keyset_pages(self):
+        url = reverse('core:customer_list')
+        # Session, user and business lookups, then a single stats query
+        with self.assertNumQueries(4):
+            first = self.client.get(url).json()
+        self.assertEqual(len(first['customers']), 2)
+        second = self.client.get(url, {'after': first['next']}).json()
+        self.assertIsNone(second['next'])
+        ids = [c['id'] for c in first['customers'] + second['customers']]
+        self.assertEqual(ids, [c.id for c in self.customers])
+
+    @patch('core.customers.HISTORY_PAGE_SIZE', 2)
+    def test_customer_detail_history(self):
+        url = reverse('core:customer_detail', args=[self.customers[0].id])
+        first = self.client.get(url).json()
+        self.assertEqual(first['customer']['visit_count'], 3)
+        self.assertEqual(len(first['bookings']), 2)
+        pages = [first]
+        while pages[-1]['next']:
+            pages.append(self.client.get(url, {'before': pages[-1]['next']}).json())
+        starts = [b['start_time'] for page in pages for b in page['bookings']]
+        self.assertEqual(len(starts), 5)
+        self.assertEqual(starts, sorted(starts, reverse=True))
+
+    def test_other_business_customer_not_found(self):
+        stranger = Customer.objects.create(name='Stranger', email='s@example.com', phone='1')
+        response = self.client.get(reverse('core:customer_detail', args=[stranger.id]))
+        self.assertEqual(response.status_code, 404)
+
+class LocalSMTPServer:
+    """SMTP stand-in on localhost that records connections and messages
+
+    Refuses recipients containing "refused" and, with drop_after set, hangs
+    up after that many messages on a connection.
+    """
+
+    def __init__(self, drop_after=None):
+        self.connections = 0
+        self.messages = []
+        self.drop_after = drop_after
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b'\r\n')
+
+            def handle(self):
+                server.connections += 1
+                sent = 0
+                mail_from, rcpt_to = None, []
+                self.reply('220 localhost ESMTP stand-in')
+                for line in self.rfile:
+                    command = line.decode().strip()
+                    verb = command.split(' ', 1)[0].upper()
+                    if verb in ('EHLO', 'HELO'):
+                        self.reply('250 localhost')
+                    elif verb == 'MAIL':
+                        mail_from, rcpt_to = command[10:], []
+                        self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        if 'refused' in command:
+                            self.reply('550 No such user')
+                        else:
+                            rcpt_to.append(command[8:])
+                            self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        data = b''.join(iter(self.rfile.readline, b'.\r\n'))
+                        server.messages.append((mail_from, rcpt_to, data))
+                        self.reply('250 OK')
+                        sent += 1
+                        if sent == server.drop_after:
+                            return
+                    elif verb in ('RSET', 'NOOP'):
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('502 Not implemented')
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class PooledMailTests(SimpleTestCase):
+    def envelope(self, to):
+        return 'shop@example.com', [to], b'Subject: Reminder\r\n\r\nSee you tomorrow\r\n'
+
+    def smtp_server(self, **kwargs):
+        server = LocalSMTPServer(**kwargs)
+        self.addCleanup(server.close)
+        return server
+
+    def test_batches_share_one_kept_alive_connection(self):
+        server = self.smtp_server()
+        pool = SMTPPool('127.0.0.1', server.port)
+        self.addCleanup(pool.close)
+
+        envelopes = [self.envelope(f'customer{i}@example.com') for i in range(20)]
+        envelopes[5] = self.envelope('refused@example.com')
+        refused = pool.send_batch(envelopes)
+        pool.send(*self.envelope('late@example.com'))
+
+        self.assertEqual(list(refused), [5])
+        self.assertEqual(len(server.messages), 20)
+        self.assertEqual(server.connections, 1)
+
+    def test_reconnects_when_server_hangs_up(self):
+        server = self.smtp_server(drop_after=2)
+        pool = SMTPPool('127.0.0.1', server.port)
+        self.addCleanup(pool.close)
+
+        self.assertEqual(pool.send_batch([self.envelope(f'c{i}@example.com') for i in range(4)]), {})
+        self.assertEqual([m[1] for m in server.messages], [[f'<c{i}@example.com>'] for i in range(4)])
+        self.assertEqual(server.connections, 2)
+
+        # The pooled connection was dropped while idle: NOOP notices before reuse
+        with patch('smtp_pool.KEEPALIVE_SECONDS', 0):
+            pool.send(*self.envelope('next@example.com'))
+        self.assertEqual(len(server.messages), 5)
+        self.assertEqual(server.connections, 3)
+
+    def test_django_backend_sends_over_pool(self):
+        server = self.smtp_server()
+        with override_settings(EMAIL_BACKEND='core.mail.PooledSMTPBackend', EMAIL_HOST='127.0.0.1',
+                               EMAIL_PORT=server.port, EMAIL_USE_SSL=False, EMAIL_HOST_USER=''), \
+                patch.dict('core.mail._pools', clear=True):
+            sent = get_connection().send_messages([
+                EmailMessage('Reminder', 'See you tomorrow', to=[f'customer{i}@example.com'])
+                for i in range(10)
+            ])
+            get_smtp_pool().close()
+
+        self.assertEqual(sent, 10)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(server.messages[0][0], '<contact@silentwashev.com>')
+        self.assertIn(b'See you tomorrow', server.messages[0][2])
+
+    def test_send_mail_batch_reports_refused_messages(self):
+        server = self.smtp_server()
+        to = ['a@example.com', 'refused@example.com', 'b@example.com']
+        with override_settings(EMAIL_BACKEND='core.mail.PooledSMTPBackend', EMAIL_HOST='127.0.0.1',
+                               EMAIL_PORT=server.port, EMAIL_USE_SSL=False, EMAIL_HOST_USER=''), \
+                patch.dict('core.mail._pools', clear=True):
+            failed = send_mail_batch([EmailMessage('Reminder', 'See you tomorrow', to=[address]) for address in to])
+            get_smtp_pool().close()
+
+        self.assertEqual(list(failed), [1])
+        self.assertEqual(len(server.messages), 2)
+        self.assertEqual(server.connections, 1)
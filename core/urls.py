@@ -20,4 +20,6 @@ urlpatterns = [
     path('service/<int:service_id>/edit/', views.edit_service, name='edit_service'),
     path('service/<int:service_id>/delete/', views.delete_service, name='delete_service'),
     path('update-calendar-id/', views.update_calendar_id, name='update_calendar_id'),
+    path('api/customers/', views.customer_list, name='customer_list'),
+    path('api/customers/<int:customer_id>/', views.customer_detail, name='customer_detail'),
 ] 
\ No newline at end of file
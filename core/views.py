@@ -3,13 +3,23 @@ from django.contrib.auth import login, authenticate, logout as auth_logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from .models import Business, Customer
+from .directory import render_directory
+from .customers import customer_history, customer_page
 from django.utils import timezone
 from django.contrib import messages
-from scheduler.models import Service, BusinessHours, Booking
-from datetime import time
+from scheduler.models import Service, BusinessHours, Booking, BusinessDailyStats
+from scheduler.profiles import get_schedule_profile, invalidate_schedule_profile
 from django.contrib.auth.models import User
 from django.db import transaction
+from django.db.models import Sum
+from datetime import timedelta
+import pytz
 from django.http import JsonResponse
+from django.conf import settings
+from django.utils.safestring import mark_safe
+from config.routers import replica_reads
+
+ANALYTICS_DAYS = 30
 
 def business_signup(request):
     """Business registration & onboarding"""
@@ -46,6 +56,7 @@ def business_signup(request):
     return render(request, 'core/signup.html')
 
 @login_required
+@replica_reads
 def business_dashboard(request):
     """Business owner's dashboard"""
     try:
@@ -54,22 +65,61 @@ def business_dashboard(request):
         upcoming_bookings = Booking.objects.filter(
             business=business,
             start_time__gte=timezone.now()
-        ).order_by('start_time')[:5]
+        ).select_related('service', 'customer').order_by('start_time')[:5]
+        
+        # Analytics come from the daily rollup table, not the Booking table
+        # Rollup days are local to SCHEDULER_TIME_ZONE; future bookings' days are excluded
+        today = timezone.now().astimezone(pytz.timezone(settings.SCHEDULER_TIME_ZONE)).date()
+        daily_stats = BusinessDailyStats.objects.filter(
+            business=business,
+            date__gt=today - timedelta(days=ANALYTICS_DAYS),
+            date__lte=today
+        )
+        totals = {'bookings': Sum('bookings'), 'cancellations': Sum('cancellations'),
+                  'booked_minutes': Sum('booked_minutes'), 'revenue': Sum('revenue')}
+        analytics = daily_stats.aggregate(**totals)
+        service_analytics = daily_stats.values('service__name').annotate(**totals).order_by('-revenue')
         
         return render(request, 'core/dashboard.html', {
             'business': business,
             'services': services,
             'upcoming_bookings': upcoming_bookings,
+            'analytics': analytics,
+            'analytics_days': ANALYTICS_DAYS,
+            'service_analytics': service_analytics,
         })
     except Business.DoesNotExist:
         messages.error(request, "Please create a business profile first")
         return redirect('core:signup')
 
+@login_required
+@replica_reads
+def customer_list(request):
+    """Customers of the owner's business with lifetime stats, one page at a time"""
+    business = get_object_or_404(Business, owner=request.user)
+    customers, next_cursor = customer_page(business, request.GET.get('after'))
+    return JsonResponse({
+        'customers': customers,
+        'next': next_cursor
+    })
+
+@login_required
+@replica_reads
+def customer_detail(request, customer_id):
+    """Lifetime stats and booking history for one customer of the owner's business"""
+    business = get_object_or_404(Business, owner=request.user)
+    customer, history, next_cursor = customer_history(business, customer_id, request.GET.get('before'))
+    return JsonResponse({
+        'customer': customer,
+        'bookings': history,
+        'next': next_cursor
+    })
+
 def landing_page(request):
     """Homepage showing list of businesses and signup option"""
-    businesses = Business.objects.all()
+    directory = render_directory(request.GET.get('after'))
     return render(request, 'core/landing.html', {
-        'businesses': businesses
+        'directory': mark_safe(directory)
     })
 
 @login_required
@@ -139,44 +189,41 @@ def business_hours(request):
     business = get_object_or_404(Business, owner=request.user)
     
     if request.method == 'POST':
-        # Clear existing hours
-        BusinessHours.objects.filter(business=business).delete()
-        
-        # Create new hours for each day
+        # Upsert all seven days in one statement instead of delete + re-create
+        rows = []
         for day in range(7):  # 0 = Monday, 6 = Sunday
             is_closed = request.POST.get(f'closed_{day}') == 'on'
             start = request.POST.get(f'start_{day}')
             end = request.POST.get(f'end_{day}')
             
-            # Create entry for both open and closed days
-            BusinessHours.objects.create(
+            # Store an entry for both open and closed days
+            rows.append(BusinessHours(
                 business=business,
                 day_of_week=day,
-                start_time=start if not is_closed else None,
-                end_time=end if not is_closed else None,
+                start_time=(start or None) if not is_closed else None,
+                end_time=(end or None) if not is_closed else None,
                 is_closed=is_closed
-            )
-    
-    # Get existing hours
-    hours_dict = {}
-    existing_hours = BusinessHours.objects.filter(business=business)
+            ))
+        
+        BusinessHours.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['business', 'day_of_week'],
+            update_fields=['start_time', 'end_time', 'is_closed']
+        )
+        # bulk_create doesn't send post_save, so invalidate explicitly
+        invalidate_schedule_profile(business.id)
     
-    # Create a dictionary with default values
-    for day in range(7):
-        try:
-            hour = existing_hours.get(day_of_week=day)
-            hours_dict[day] = {
-                'start_time': hour.start_time,
-                'end_time': hour.end_time,
-                'is_closed': hour.is_closed
-            }
-        except BusinessHours.DoesNotExist:
-            # Default: 9 AM to 5 PM, closed on weekends
-            hours_dict[day] = {
-                'start_time': time(9, 0),
-                'end_time': time(17, 0),
-                'is_closed': day >= 5  # Saturday and Sunday
-            }
+    # Saved hours, with defaults for days never configured
+    profile = get_schedule_profile(business.id)
+    hours_dict = {
+        day: {
+            'start_time': hours.start_time,
+            'end_time': hours.end_time,
+            'is_closed': hours.is_closed
+        }
+        for day, hours in enumerate(profile.hours)
+    }
     
     return render(request, 'core/business_hours.html', {
         'business': business,
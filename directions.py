@@ -1,57 +1,112 @@
-import googlemaps
-import os
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from functools import lru_cache
+from functools import cached_property, lru_cache
+import json
+import os
+import tempfile
+import resilience
+from routing import format_duration, get_travel_time_backend, maps_client
+
+# Drive assumed for a leg when the backend can't be asked (outage, quota)
+# and no earlier answer for it is known
+ESTIMATED_TRAVEL_SECONDS = 30 * 60
+MAX_KNOWN_LEGS = 10000
+
+# Last travel seconds seen per (origin, destination), for those fallbacks
+_known_legs = OrderedDict()
+
+# Where workers leave their known legs on exit for the next server start
+# (see config/gunicorn.py)
+KNOWN_LEGS_PATH = os.getenv('KNOWN_LEGS_PATH', os.path.join(tempfile.gettempdir(), 'smartslot-known-legs.json'))
+
+def remember_legs(origins, destinations, matrix):
+    """Record a fetched matrix in the last-known legs"""
+    for i, origin in enumerate(origins):
+        for j, dest in enumerate(destinations):
+            if matrix[i][j] is not None:
+                _known_legs[(str(origin), str(dest))] = matrix[i][j]
+                _known_legs.move_to_end((str(origin), str(dest)))
+    while len(_known_legs) > MAX_KNOWN_LEGS:
+        _known_legs.popitem(last=False)
+
+def load_known_legs(path=None):
+    """Add legs saved by save_known_legs(); returns how many are known"""
+    try:
+        with open(path or KNOWN_LEGS_PATH) as f:
+            legs = json.load(f)
+    except (OSError, ValueError):
+        return len(_known_legs)
+    # Saved legs are older than anything this process has seen itself
+    merged = OrderedDict(((origin, dest), seconds) for origin, dest, seconds in legs)
+    for leg, seconds in list(_known_legs.items()):
+        merged[leg] = seconds
+        merged.move_to_end(leg)
+    while len(merged) > MAX_KNOWN_LEGS:
+        merged.popitem(last=False)
+    _known_legs.clear()
+    _known_legs.update(merged)
+    return len(_known_legs)
+
+def save_known_legs(path=None):
+    """Write the known legs (most recent last), merged with those already saved"""
+    path = path or KNOWN_LEGS_PATH
+    load_known_legs(path)  # Keep what other workers saved
+    legs = [[origin, dest, seconds] for (origin, dest), seconds in list(_known_legs.items())]
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(legs, f)
+    os.replace(temporary, path)
+    return len(legs)
+
+def fallback_seconds(origins, destinations):
+    """Travel seconds matrix from last-known legs, else ESTIMATED_TRAVEL_SECONDS"""
+    return [
+        [
+            0 if str(origin) == str(dest)
+            else _known_legs.get((str(origin), str(dest)), ESTIMATED_TRAVEL_SECONDS)
+            for dest in destinations
+        ]
+        for origin in origins
+    ]
 
 class TravelTimeCalculator:
-    def __init__(self):
-        self.gmaps = googlemaps.Client(key=os.environ['GOOGLE_MAPS_API_KEY'])
+    def __init__(self, backend=None):
+        # Google Distance Matrix unless TRAVEL_TIME_BACKEND selects the local road graph
+        self.backend = backend or get_travel_time_backend()
+
+    @cached_property
+    def gmaps(self):
+        return maps_client()
     
     @lru_cache(maxsize=128)
     def get_travel_times(self, origins, destinations, departure_time):
-        """Batch query travel times using Distance Matrix API"""
+        """Batch query travel times from the configured backend"""
         try:
-            # Convert tuples/strings to lists for the API call
+            # Convert tuples/strings to lists for the backend call
             if isinstance(origins, (str, tuple)):
                 origins = [origins] if isinstance(origins, str) else list(origins)
             if isinstance(destinations, (str, tuple)):
-                destinations = [destinations] if backend.pyisinstance(destinations, str) else list(destinations)
-            
-            # For future dates, we need to use the time of day but set to today
-            now = datetime.now()
-            departure_hour = departure_time.hour
-            departure_minute = departure_time.minute
-            
-            # Set departure time to today at the same time
-            adjusted_departure = now.replace(
-                hour=departure_hour,
-                minute=departure_minute,
-                second=0,
-                microsecond=0
-            )
-            
-            # If the time has already passed today, set to tomorrow
-            if adjusted_departure < now:
-                adjusted_departure += timedelta(days=1)
+                destinations = [destinations] if isinstance(destinations, str) else list(destinations)
             
-            print(f"Calculating travel time using departure: {adjusted_departure.strftime('%Y-%m-%d %H:%M')}")
-            
-            result = self.gmaps.distance_matrix(
-                origins=origins,
-                destinations=destinations,
-                mode="driving",
-                departure_time=adjusted_departure
-            )
+            try:
+                matrix = self.backend.travel_seconds(origins, destinations, departure_time)
+                remember_legs(origins, destinations, matrix)
+            except resilience.UpstreamUnavailable as e:
+                # Out of quota or Maps is down: plan with what we know
+                print(f"⚠ Using cached or estimated travel times ({str(e)})")
+                matrix = fallback_seconds(origins, destinations)
             
             # Extract durations into a more usable format
             travel_times = {}
             for i, origin in enumerate(origins):
                 travel_times[str(origin)] = {}
                 for j, dest in enumerate(destinations):
-                    element = result['rows'][i]['elements'][j]
+                    seconds = matrix[i][j]
+                    if seconds is None:
+                        raise ValueError(f"No route from {origin} to {dest}")
                     travel_times[str(origin)][str(dest)] = {
-                        'text': element['duration']['text'],
-                        'minutes': element['duration']['value'] // 60  # Convert seconds to minutes
+                        'text': format_duration(seconds),
+                        'minutes': seconds // 60  # Convert seconds to minutes
                     }
             
             return travel_times
@@ -83,7 +138,7 @@ class TravelTimeCalculator:
                 if radius:
                     params['radius'] = radius
 
-            result = self.gmaps.places_autocomplete(**params)
+            result = resilience.call('google_maps', self.gmaps.places_autocomplete, **params)
             
             # Format the results
             suggestions = [{
@@ -99,6 +154,69 @@ class TravelTimeCalculator:
             print(f"✗ Error getting place suggestions: {str(e)}")
             return []
 
+class TravelMatrix:
+    """Travel times among a fixed set of places, fetched in one batched lookup
+
+    Offers the same get_travel_times() as TravelTimeCalculator, so it can
+    stand in for it wherever the places involved are known up front.
+
+    With a hub (say, a new customer's address) only the legs to and from
+    the hub are fetched, 2N elements instead of N x N; add_pairs() fetches
+    other legs as they turn out to be needed.
+    """
+
+    def __init__(self, locations, departure_time, calculator=None, hub=None):
+        self.locations = tuple(dict.fromkeys(str(location) for location in locations if location))
+        self.departure_time = departure_time
+        self.calculator = calculator
+        self.times = {}
+        if len(self.locations) < 2:
+            return
+        if hub is None:
+            self._fetch(self.locations, self.locations)
+            return
+        others = tuple(location for location in self.locations if location != str(hub))
+        if others:
+            self._fetch((str(hub),), others)
+            self._fetch(others, (str(hub),))
+
+    def _fetch(self, origins, destinations):
+        self.calculator = self.calculator or TravelTimeCalculator()
+        times = self.calculator.get_travel_times(tuple(origins), tuple(destinations), self.departure_time) or {}
+        for origin, row in times.items():
+            self.times.setdefault(origin, {}).update(row)
+
+    def add_pairs(self, pairs):
+        """Fetch the (origin, destination) legs not known yet, one lookup per origin"""
+        missing = {}
+        for origin, destination in pairs:
+            origin, destination = str(origin), str(destination)
+            if origin != destination and destination not in self.times.get(origin, {}):
+                missing.setdefault(origin, {})[destination] = None
+        for origin, destinations in missing.items():
+            self._fetch((origin,), tuple(destinations))
+
+    def minutes(self, origin, destination):
+        """Travel minutes between two places, or None if unknown"""
+        if str(origin) == str(destination):
+            return 0
+        try:
+            return self.times[str(origin)][str(destination)]['minutes']
+        except KeyError:
+            return None
+
+    def get_travel_times(self, origins, destinations, departure_time=None):
+        """Subset of the matrix in TravelTimeCalculator.get_travel_times() format"""
+        origins = [origins] if isinstance(origins, str) else list(origins)
+        destinations = [destinations] if isinstance(destinations, str) else list(destinations)
+        try:
+            return {
+                str(origin): {str(dest): self.times[str(origin)][str(dest)] for dest in destinations}
+                for origin in origins
+            }
+        except KeyError:
+            return None
+
 def calculate_travel_scenario(current_location, next_booking_location, home_location, 
                             current_booking_end, next_booking_start):
     """Calculate optimal travel scenario between bookings"""
@@ -1,54 +1,22 @@
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from datetime import datetime, timedelta
+from functools import cached_property
 import pytz
-from googleapiclient.errors import HttpError
 import json
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-import ssl
-import time
-import os
-from icalendar import Calendar, Event
+import threading
+import math
+import uuid
+import resilience
+from calendar_events import STALE_BUFFER_MINUTES, TRAVEL_BLOCK_SUMMARY, normalize_events, widen
+
+# Slots adding at most this much more driving than the best one are recommended
+MARGINAL_TRAVEL_SLACK_MINUTES = 10
+# Minimum gap kept before and after every booking
+TRAVEL_BUFFER_MINUTES = 15
+# Day snapshots kept for serving availability during Google outages
+MAX_SNAPSHOTS = 256
 
 class CalendarService:
     def __init__(self):
-        # Load credentials from environment variable or file
-        SCOPES = [
-            'https://www.googleapis.com/auth/calendar.readonly',
-            'https://www.googleapis.com/auth/calendar.events'
-        ]
-        try:
-            # Check for credentials in environment
-            if 'GOOGLE_CREDENTIALS' in os.environ:
-                # Write environment variable content to temporary file
-                temp_creds_path = '/tmp/google-credentials.json'
-                with open(temp_creds_path, 'w') as f:
-                    f.write(os.environ['GOOGLE_CREDENTIALS'])
-                
-                credentials = service_account.Credentials.from_service_account_file(
-                    temp_creds_path, scopes=SCOPES)
-                
-                # Clean up
-                os.remove(temp_creds_path)
-            else:
-                # Fall back to local file for development
-                credentials = service_account.Credentials.from_service_account_file(
-                    'silentwash-4b7a2b2c111e.json', scopes=SCOPES)
-                
-            print("✓ Credentials loaded successfully")
-        except Exception as e:
-            print(f"✗ Error loading credentials: {str(e)}")
-            raise
-
-        # Build the service
-        try:
-            self.service = build('calendar', 'v3', credentials=credentials)
-            print("✓ Calendar service built successfully")
-        except Exception as e:
-            print(f"✗ Error building calendar service: {str(e)}")
-            raise
-
         self.calendar_id = 'b6765108df1c8066b4ed2474361248caa586e63117b11f31dcf25c6d316844dd@group.calendar.google.com'
         self.timezone = pytz.timezone('America/New_York')  # Adjust to your timezone
         
@@ -62,8 +30,28 @@ class CalendarService:
         # Format: {'2024-03-20 14:00': {'expires': datetime, 'duration': timedelta}}
         self.pending_bookings = {}
         
-        # Add retry strategy
-        self.max_retries = 3
+        # Last events fetched per (calendar, period), served while Google is down
+        self._snapshots = {}
+
+    @cached_property
+    def service(self):
+        """Calendar API client, built on first use"""
+        from google_clients import build_calendar_client, load_credentials
+
+        try:
+            credentials = load_credentials()
+            print("✓ Credentials loaded successfully")
+        except Exception as e:
+            print(f"✗ Error loading credentials: {str(e)}")
+            raise
+
+        try:
+            service = build_calendar_client(credentials)
+            print("✓ Calendar service built successfully")
+        except Exception as e:
+            print(f"✗ Error building calendar service: {str(e)}")
+            raise
+        return service
         
     def _clean_expired_pending(self):
         """Remove expired pending bookings"""
@@ -75,8 +63,8 @@ class CalendarService:
         for time_slot in expired:
             del self.pending_bookings[time_slot]
 
-    def hold_slot(self, date_str, time_str, service_type):
-        """Place a temporary hold on a time slot"""
+    def hold_slot(self, date_str, time_str, service_type, business_id=None):
+        """Place a temporary hold on a time slot (for business_id's booking page, if given)"""
         try:
             self._clean_expired_pending()
             
@@ -93,7 +81,8 @@ class CalendarService:
             # Add pending booking (expires in 5 minutes)
             self.pending_bookings[slot_key] = {
                 'expires': datetime.now(self.timezone) + timedelta(minutes=5),
-                'duration': timedelta(minutes=120 if service_type == 'Premium Detail' else 60)
+                'duration': timedelta(minutes=120 if service_type == 'Premium Detail' else 60),
+                'business_id': business_id
             }
             
             return {
@@ -106,8 +95,12 @@ class CalendarService:
             print(f"✗ Error holding slot: {str(e)}")
             raise
 
-    def get_available_slots(self, date_str, service_duration, destination_address=None):
-        """Get available time slots for a given date"""
+    def get_available_slots(self, date_str, service_duration, destination_address=None, rank_by_travel=False):
+        """Get available time slots for a given date
+
+        With a destination address each slot is annotated with the extra
+        driving it adds to the day's route; rank_by_travel sorts by it.
+        """
         try:
             # Parse the date
             date_obj = datetime.strptime(date_str, '%Y-%m-%d')
@@ -130,11 +123,16 @@ class CalendarService:
             # Get existing events
             events = self._get_day_events(time_min, time_max)
             
-            # Initialize travel calculator if needed
+            # Legs between the new address and every booked location serve
+            # both the feasibility checks and the ranking
             travel_calculator = None
             if destination_address:
-                from directions import TravelTimeCalculator
-                travel_calculator = TravelTimeCalculator()
+                from directions import TravelMatrix
+                travel_calculator = TravelMatrix(
+                    [destination_address] + [event.location_name for event in events],
+                    date_obj.replace(hour=12),  # Typical midday traffic
+                    hub=destination_address
+                )
 
             # Calculate available slots
             available_slots = self._calculate_available_slots(
@@ -144,6 +142,12 @@ class CalendarService:
                 destination_address,
                 travel_calculator
             )
+
+            if travel_calculator:
+                self._score_marginal_travel(available_slots, events, date_obj, destination_address, travel_calculator)
+                if rank_by_travel:
+                    # Unknown costs last; stable, so ties stay in time order
+                    available_slots.sort(key=lambda slot: (slot['extra_travel_minutes'] is None, slot['extra_travel_minutes'] or 0))
             
             return available_slots
             
@@ -151,6 +155,62 @@ class CalendarService:
             print(f"✗ Error in get_available_slots: {str(e)}")
             raise
 
+    def get_free_intervals(self, date_str, min_duration=0, destination_address=None):
+        """Free [start, end] minute offsets (from local midnight) of at least min_duration
+
+        The complement, within business hours, of the day's merged busy list:
+        each event padded by the travel buffer plus, with an address, the
+        drive to and from it. O(events) to compute and send, where
+        get_available_slots() tries a start every 10 minutes; clients expand
+        the gaps themselves.
+        """
+        date_obj = self.timezone.localize(datetime.strptime(date_str, '%Y-%m-%d'))
+        day_start = date_obj.replace(hour=self.business_hours['start'])
+        day_end = date_obj.replace(hour=self.business_hours['end'])
+        events = self._get_day_events(day_start, day_end)
+
+        travel = None
+        if destination_address:
+            from directions import TravelMatrix
+            travel = TravelMatrix(
+                [destination_address] + [event.location_name for event in events],
+                date_obj.replace(hour=12),  # Typical midday traffic
+                hub=destination_address
+            )
+
+        midnight = date_obj.timestamp()
+
+        def offset(epoch_seconds):
+            return (epoch_seconds - midnight) / 60
+
+        busy = []
+        for event in events:
+            before = after = TRAVEL_BUFFER_MINUTES
+            location = event.location_name
+            if travel and location:
+                before += travel.minutes(destination_address, location) or 0
+                after += travel.minutes(location, destination_address) or 0
+            busy.append((offset(event.start) - before, offset(event.end) + after))
+        busy.sort()
+
+        cursor, close = offset(day_start.timestamp()), offset(day_end.timestamp())
+        now = datetime.now(self.timezone)
+        if now.date() == date_obj.date():
+            cursor = max(cursor, offset(now.timestamp()))
+
+        gaps = []
+        for start, end in busy:
+            if start > cursor:
+                gaps.append((cursor, min(start, close)))
+            cursor = max(cursor, end)
+        if cursor < close:
+            gaps.append((cursor, close))
+
+        return [
+            [math.ceil(start), math.floor(end)] for start, end in gaps
+            if math.floor(end) - math.ceil(start) >= max(min_duration, 1)
+        ]
+
     def _calculate_available_slots(self, events, date, duration_minutes, destination_address=None, travel_calculator=None):
         """Calculate available slots considering travel times from/to adjacent bookings"""
         def round_up_to_10(dt):
@@ -167,7 +227,7 @@ class CalendarService:
 
         slots = []
         duration = timedelta(minutes=duration_minutes)
-        BUFFER_MINUTES = 15
+        BUFFER_MINUTES = TRAVEL_BUFFER_MINUTES
         
         # Start and end times for the business day
         current_time = date.replace(hour=self.business_hours['start'], minute=0)
@@ -187,38 +247,35 @@ class CalendarService:
             print(f"\n{'-'*50}")
             print(f"Evaluating slot: {slot_start.strftime('%H:%M')} - {slot_end.strftime('%H:%M')}")
 
-            # Check for overlaps
-            has_overlap = any(
-                datetime.fromisoformat(event['start'].get('dateTime')).astimezone(self.timezone) < slot_end
-                and datetime.fromisoformat(event['end'].get('dateTime')).astimezone(self.timezone) > slot_start
-                for event in events
-            )
+            slot_start_ts = int(slot_start.timestamp())
+            slot_end_ts = int(slot_end.timestamp())
+
+            # Check for overlaps (travel blocks are busy too)
+            overlapping = [
+                event for event in events
+                if event.start < slot_end_ts and event.end > slot_start_ts
+            ]
 
-            if has_overlap:
+            if overlapping:
                 print("❌ Slot overlaps with existing booking")
-                current_time = max(
-                    datetime.fromisoformat(event['end'].get('dateTime')).astimezone(self.timezone)
-                    for event in events
-                    if datetime.fromisoformat(event['start'].get('dateTime')).astimezone(self.timezone) < slot_end
-                    and datetime.fromisoformat(event['end'].get('dateTime')).astimezone(self.timezone) > slot_start
-                )
+                current_time = datetime.fromtimestamp(max(event.end for event in overlapping), self.timezone)
                 continue
 
-            # Find previous and next bookings
+            # Find previous and next bookings (travel blocks are not stops)
             previous_booking = next((
                 event for event in reversed(events)
-                if datetime.fromisoformat(event['end'].get('dateTime')).astimezone(self.timezone) <= slot_start
+                if event.is_service and event.end <= slot_start_ts
             ), None)
 
             next_booking = next((
                 event for event in events
-                if datetime.fromisoformat(event['start'].get('dateTime')).astimezone(self.timezone) >= slot_end
+                if event.is_service and event.start >= slot_end_ts
             ), None)
 
             # Check travel from previous booking
             if previous_booking:
-                prev_end = datetime.fromisoformat(previous_booking['end'].get('dateTime')).astimezone(self.timezone)
-                prev_location = previous_booking.get('location')
+                prev_end = previous_booking.end_at(self.timezone)
+                prev_location = previous_booking.location_name
                 
                 print(f"\nChecking travel FROM previous booking:")
                 print(f"• Previous ends: {prev_end.strftime('%H:%M')} @ {prev_location or 'No location'}")
@@ -249,8 +306,8 @@ class CalendarService:
 
             # Check travel to next booking
             if can_schedule and next_booking:
-                next_start = datetime.fromisoformat(next_booking['start'].get('dateTime')).astimezone(self.timezone)
-                next_location = next_booking.get('location')
+                next_start = next_booking.start_at(self.timezone)
+                next_location = next_booking.location_name
                 
                 print(f"\nChecking travel TO next booking:")
                 print(f"• Next starts: {next_start.strftime('%H:%M')} @ {next_location or 'No location'}")
@@ -298,35 +355,85 @@ class CalendarService:
         print(f"Found {len(slots)} available slots")
         return slots
 
+    def _score_marginal_travel(self, slots, events, date, destination_address, travel):
+        """Annotate slots with the driving they add: prev→new + new→next − prev→next
+
+        Slots and events are both in time order, so one sweep with two
+        pointers finds each slot's neighbours: O(slots + events) on top of
+        availability. Legs to and from the new address are prefetched; the
+        prev→next legs are fetched once the sweep knows which pairs occur.
+        """
+        stops = [event for event in events if event.is_service]
+        by_end = sorted(stops, key=lambda event: event.end)
+        by_start = stops  # Already in start order
+
+        def leg(origin, destination):
+            if not origin or not destination:
+                return 0  # Nothing to drive from/to
+            return travel.minutes(origin, destination)
+
+        neighbours = []
+        previous, p, n = None, 0, 0
+        for slot in slots:
+            slot_start = self.timezone.localize(
+                datetime.strptime(f"{date.strftime('%Y-%m-%d')} {slot['start']}", '%Y-%m-%d %I:%M %p'))
+            slot_end = self.timezone.localize(
+                datetime.strptime(f"{date.strftime('%Y-%m-%d')} {slot['end']}", '%Y-%m-%d %I:%M %p'))
+
+            slot_start, slot_end = slot_start.timestamp(), slot_end.timestamp()
+            while p < len(by_end) and by_end[p].end <= slot_start:
+                previous = by_end[p]
+                p += 1
+            while n < len(by_start) and by_start[n].start < slot_end:
+                n += 1
+            following = by_start[n] if n < len(by_start) else None
+
+            neighbours.append((previous.location_name if previous else None,
+                               following.location_name if following else None))
+
+        travel.add_pairs(pair for pair in dict.fromkeys(neighbours) if all(pair))
+        for slot, (prev_location, next_location) in zip(slots, neighbours):
+            legs = (
+                leg(prev_location, destination_address),
+                leg(destination_address, next_location),
+                leg(prev_location, next_location)
+            )
+            slot['extra_travel_minutes'] = None if None in legs else legs[0] + legs[1] - legs[2]
+
+        known = [slot['extra_travel_minutes'] for slot in slots if slot['extra_travel_minutes'] is not None]
+        best = min(known, default=None)
+        for slot in slots:
+            extra = slot['extra_travel_minutes']
+            slot['recommended'] = extra is not None and extra <= best + MARGINAL_TRAVEL_SLACK_MINUTES
+        return slots
+
     def create_booking(self, booking_data):
         """Create a new calendar event for a booking, including travel time blocks"""
-        retry_count = 0
-        BUFFER_MINUTES = 15  # Buffer time for travel
+        BUFFER_MINUTES = TRAVEL_BUFFER_MINUTES  # Buffer time for travel
         
-        while retry_count < self.max_retries:
-            try:
-                # Parse the booking time
-                date_str = booking_data['date']
-                time_str = booking_data['time']
-                datetime_str = f"{date_str} {time_str}"
-                
-                # Create start time (timezone aware)
-                start_time = datetime.strptime(datetime_str, '%Y-%m-%d %I:%M %p')
-                start_time = self.timezone.localize(start_time)
-                
-                # Calculate service duration
-                service_duration = {
-                    'Essential Clean': timedelta(minutes=60),
-                    'Premium Detail': timedelta(minutes=120)
-                }.get(booking_data['service_type'])
-                
-                end_time = start_time + service_duration
+        try:
+            # Parse the booking time
+            date_str = booking_data['date']
+            time_str = booking_data['time']
+            datetime_str = f"{date_str} {time_str}"
+            
+            # Create start time (timezone aware)
+            start_time = datetime.strptime(datetime_str, '%Y-%m-%d %I:%M %p')
+            start_time = self.timezone.localize(start_time)
+            
+            # Calculate service duration
+            service_duration = {
+                'Essential Clean': timedelta(minutes=60),
+                'Premium Detail': timedelta(minutes=120)
+            }.get(booking_data['service_type'])
+            
+            end_time = start_time + service_duration
 
-                # Create main service event
-                service_event = {
-                    'summary': f"Car Detail - {booking_data['service_type']}",
-                    'location': booking_data.get('address', 'TBD'),
-                    'description': f"""
+            # Create main service event
+            service_event = {
+                'summary': f"Car Detail - {booking_data['service_type']}",
+                'location': booking_data.get('address', 'TBD'),
+                'description': f"""
 Booking Details:
 ---------------
 Customer: {booking_data['name']}
@@ -335,192 +442,205 @@ Vehicle: {booking_data.get('vehicle', 'Not specified')}
 Phone: {booking_data.get('phone', 'Not provided')}
 Email: {booking_data.get('email', 'Not provided')}
 Special Instructions: {booking_data.get('notes', 'None')}
-                    """.strip(),
-                    'start': {
-                        'dateTime': start_time.isoformat(),
-                        'timeZone': str(self.timezone),
-                    },
-                    'end': {
-                        'dateTime': end_time.isoformat(),
-                        'timeZone': str(self.timezone),
-                    },
-                    'reminders': {
-                        'useDefault': True
-                    }
+                """.strip(),
+                'start': {
+                    'dateTime': start_time.isoformat(),
+                    'timeZone': str(self.timezone),
+                },
+                'end': {
+                    'dateTime': end_time.isoformat(),
+                    'timeZone': str(self.timezone),
+                },
+                'reminders': {
+                    'useDefault': True
                 }
+            }
+
+            # Create the main service event
+            event = self._insert_event(service_event)
+            print(f"✓ Service event created: {event.get('htmlLink')}")
 
-                # Create the main service event
-                event = self.service.events().insert(
-                    calendarId=self.calendar_id,
-                    body=service_event
-                ).execute()
-                print(f"✓ Service event created: {event.get('htmlLink')}")
-
-                # Create travel blocks if address is provided
-                if booking_data.get('address'):
-                    print("\nAttempting to create travel blocks...")
-                    from directions import TravelTimeCalculator
-                    travel_calculator = TravelTimeCalculator()
+            # Create travel blocks if address is provided
+            if booking_data.get('address'):
+                print("\nAttempting to create travel blocks...")
+                from directions import TravelTimeCalculator
+                travel_calculator = TravelTimeCalculator()
+                
+                # Get adjacent bookings
+                day_start = start_time.replace(hour=self.business_hours['start'], minute=0)
+                day_end = start_time.replace(hour=self.business_hours['end'], minute=0)
+                day_events = self._get_day_events(day_start, day_end)
+                print(f"Found {len(day_events)} events for the day")
+                
+                # Find previous and next bookings
+                start_ts, end_ts = int(start_time.timestamp()), int(end_time.timestamp())
+                previous_booking = next((
+                    evt for evt in reversed(day_events)
+                    if evt.is_service and evt.end <= start_ts and evt.id != event.get('id')
+                ), None)
+
+                next_booking = next((
+                    evt for evt in day_events
+                    if evt.is_service and evt.start >= end_ts and evt.id != event.get('id')
+                ), None)
+
+                print(f"Previous booking found: {previous_booking is not None}")
+                print(f"Next booking found: {next_booking is not None}")
+
+                # Create travel block from previous booking if needed
+                if previous_booking and previous_booking.location_name:
+                    previous_location = previous_booking.location_name
+                    print(f"\nProcessing travel FROM previous booking:")
+                    print(f"From: {previous_location}")
+                    print(f"To: {booking_data['address']}")
                     
-                    # Get adjacent bookings
-                    day_start = start_time.replace(hour=self.business_hours['start'], minute=0)
-                    day_end = start_time.replace(hour=self.business_hours['end'], minute=0)
-                    day_events = self._get_day_events(day_start, day_end)
-                    print(f"Found {len(day_events)} events for the day")
+                    travel_times = travel_calculator.get_travel_times(
+                        previous_location,
+                        booking_data['address'],
+                        previous_booking.end_at(self.timezone)
+                    )
                     
-                    # Find previous and next bookings
-                    previous_booking = next((
-                        evt for evt in reversed(day_events)
-                        if datetime.fromisoformat(evt['end'].get('dateTime')).astimezone(self.timezone) <= start_time
-                        and evt.get('id') != event.get('id')
-                    ), None)
-
-                    next_booking = next((
-                        evt for evt in day_events
-                        if datetime.fromisoformat(evt['start'].get('dateTime')).astimezone(self.timezone) >= end_time
-                        and evt.get('id') != event.get('id')
-                    ), None)
-
-                    print(f"Previous booking found: {previous_booking is not None}")
-                    print(f"Next booking found: {next_booking is not None}")
-
-                    # Create travel block from previous booking if needed
-                    if previous_booking and previous_booking.get('location'):
-                        print(f"\nProcessing travel FROM previous booking:")
-                        print(f"From: {previous_booking['location']}")
-                        print(f"To: {booking_data['address']}")
-                        
-                        travel_times = travel_calculator.get_travel_times(
-                            previous_booking['location'],
-                            booking_data['address'],
-                            datetime.fromisoformat(previous_booking['end'].get('dateTime'))
-                        )
+                    if travel_times:
+                        travel_minutes = travel_times[str(previous_location)][str(booking_data['address'])]['minutes']
+                        total_travel_time = travel_minutes + BUFFER_MINUTES
                         
-                        if travel_times:
-                            travel_minutes = travel_times[str(previous_booking['location'])][str(booking_data['address'])]['minutes']
-                            total_travel_time = travel_minutes + BUFFER_MINUTES
-                            
-                            # Calculate travel block times
-                            travel_end = start_time
-                            travel_start = travel_end - timedelta(minutes=total_travel_time)
-                            
-                            travel_event = {
-                                'summary': '🚗 Travel Time',
-                                'description': f"Travel from {previous_booking['location']} to {booking_data['address']}\nEstimated: {travel_minutes} minutes",
-                                'start': {'dateTime': travel_start.isoformat(), 'timeZone': str(self.timezone)},
-                                'end': {'dateTime': travel_end.isoformat(), 'timeZone': str(self.timezone)},
-                                'colorId': '8'  # Gray
-                            }
-                            
-                            self.service.events().insert(
-                                calendarId=self.calendar_id,
-                                body=travel_event
-                            ).execute()
-                            print(f"✓ Created {total_travel_time} minute travel block from previous booking")
-
-                    # Create travel block to next booking if needed
-                    if next_booking and next_booking.get('location'):
-                        print(f"\nProcessing travel TO next booking:")
-                        print(f"From: {booking_data['address']}")
-                        print(f"To: {next_booking['location']}")
+                        # Calculate travel block times
+                        travel_end = start_time
+                        travel_start = travel_end - timedelta(minutes=total_travel_time)
                         
-                        travel_times = travel_calculator.get_travel_times(
-                            booking_data['address'],
-                            next_booking['location'],
-                            end_time
-                        )
+                        travel_event = {
+                            'summary': TRAVEL_BLOCK_SUMMARY,
+                            'description': f"Travel from {previous_location} to {booking_data['address']}\nEstimated: {travel_minutes} minutes",
+                            'start': {'dateTime': travel_start.isoformat(), 'timeZone': str(self.timezone)},
+                            'end': {'dateTime': travel_end.isoformat(), 'timeZone': str(self.timezone)},
+                            'colorId': '8'  # Gray
+                        }
                         
-                        if travel_times:
-                            travel_minutes = travel_times[str(booking_data['address'])][str(next_booking['location'])]['minutes']
-                            total_travel_time = travel_minutes + BUFFER_MINUTES
-                            
-                            # Calculate travel block times
-                            travel_start = end_time
-                            travel_end = travel_start + timedelta(minutes=total_travel_time)
-                            
-                            travel_event = {
-                                'summary': '🚗 Travel Time',
-                                'description': f"Travel from {booking_data['address']} to {next_booking['location']}\nEstimated: {travel_minutes} minutes",
-                                'start': {'dateTime': travel_start.isoformat(), 'timeZone': str(self.timezone)},
-                                'end': {'dateTime': travel_end.isoformat(), 'timeZone': str(self.timezone)},
-                                'colorId': '8'  # Gray
-                            }
-                            
-                            self.service.events().insert(
-                                calendarId=self.calendar_id,
-                                body=travel_event
-                            ).execute()
-                            print(f"✓ Created {total_travel_time} minute travel block to next booking")
-
-                # After creating the Google Calendar event, generate ICS data
-                def create_ics_data(booking_data, start_time, end_time):
-                    cal = Calendar()
-                    cal.add('prodid', '-//Silent Wash//Car Detail Booking//EN')
-                    cal.add('version', '2.0')
+                        self._insert_event(travel_event)
+                        print(f"✓ Created {total_travel_time} minute travel block from previous booking")
+
+                # Create travel block to next booking if needed
+                if next_booking and next_booking.location_name:
+                    next_location = next_booking.location_name
+                    print(f"\nProcessing travel TO next booking:")
+                    print(f"From: {booking_data['address']}")
+                    print(f"To: {next_location}")
                     
-                    event = Event()
-                    event.add('summary', f"Car Detail - {booking_data['service_type']}")
-                    event.add('dtstart', start_time)
-                    event.add('dtend', end_time)
-                    event.add('location', booking_data.get('address', 'TBD'))
-                    event.add('description', f"""
+                    travel_times = travel_calculator.get_travel_times(
+                        booking_data['address'],
+                        next_location,
+                        end_time
+                    )
+                    
+                    if travel_times:
+                        travel_minutes = travel_times[str(booking_data['address'])][str(next_location)]['minutes']
+                        total_travel_time = travel_minutes + BUFFER_MINUTES
+                        
+                        # Calculate travel block times
+                        travel_start = end_time
+                        travel_end = travel_start + timedelta(minutes=total_travel_time)
+                        
+                        travel_event = {
+                            'summary': TRAVEL_BLOCK_SUMMARY,
+                            'description': f"Travel from {booking_data['address']} to {next_location}\nEstimated: {travel_minutes} minutes",
+                            'start': {'dateTime': travel_start.isoformat(), 'timeZone': str(self.timezone)},
+                            'end': {'dateTime': travel_end.isoformat(), 'timeZone': str(self.timezone)},
+                            'colorId': '8'  # Gray
+                        }
+                        
+                        self._insert_event(travel_event)
+                        print(f"✓ Created {total_travel_time} minute travel block to next booking")
+
+            # After creating the Google Calendar event, generate ICS data
+            def create_ics_data(booking_data, start_time, end_time):
+                from icalendar import Calendar, Event
+
+                cal = Calendar()
+                cal.add('prodid', '-//Silent Wash//Car Detail Booking//EN')
+                cal.add('version', '2.0')
+                
+                event = Event()
+                event.add('summary', f"Car Detail - {booking_data['service_type']}")
+                event.add('dtstart', start_time)
+                event.add('dtend', end_time)
+                event.add('location', booking_data.get('address', 'TBD'))
+                event.add('description', f"""
 Car Detail Appointment
 ---------------------
 Service: {booking_data['service_type']}
 Vehicle: {booking_data.get('vehicle', 'Not specified')}
 Special Instructions: {booking_data.get('notes', 'None')}
-                    """.strip())
-                    
-                    cal.add_component(event)
-                    return cal.to_ical().decode('utf-8')
-
-                # Generate ICS data
-                ics_data = create_ics_data(booking_data, start_time, end_time)
+                """.strip())
                 
-                return {
-                    'status': 'success',
-                    'event_id': event['id'],
-                    'html_link': event['htmlLink'],
-                    'ics_data': ics_data  # Frontend can create downloadable .ics file
-                }
+                cal.add_component(event)
+                return cal.to_ical().decode('utf-8')
 
-            except ssl.SSLError as e:
-                retry_count += 1
-                if retry_count >= self.max_retries:
-                    error_msg = f"SSL Error after {self.max_retries} retries: {str(e)}"
-                    print(f"✗ {error_msg}")
-                    raise Exception(error_msg)
-                print(f"⚠ SSL Error, retrying ({retry_count}/{self.max_retries})...")
-                time.sleep(1)
-                
+            # Generate ICS data
+            ics_data = create_ics_data(booking_data, start_time, end_time)
+            
+            return {
+                'status': 'success',
+                'event_id': event['id'],
+                'html_link': event['htmlLink'],
+                'ics_data': ics_data  # Frontend can create downloadable .ics file
+            }
+
+        except Exception as e:
+            print(f"✗ Error creating booking: {str(e)}")
+            raise
+
+    def _insert_event(self, body):
+        """Insert an event, retrying safely: a client-chosen id makes repeats detectable"""
+        body = {**body, 'id': uuid.uuid4().hex}
+
+        def insert():
+            try:
+                return self.service.events().insert(calendarId=self.calendar_id, body=body).execute()
             except Exception as e:
-                print(f"✗ Error creating booking: {str(e)}")
-                raise
+                if getattr(getattr(e, 'resp', None), 'status', None) != 409:
+                    raise
+                # An earlier attempt went through before its response was lost
+                return self.service.events().get(calendarId=self.calendar_id, eventId=body['id']).execute()
+
+        return resilience.call('google_calendar', insert)
 
     def _get_day_events(self, time_min, time_max):
-        """Get all events for a specific day period"""
+        """Get all events for a specific day period, as CalendarEvents in start order
+
+        Falls back to the last answer for the same period, widened by
+        STALE_BUFFER_MINUTES, while Google is unreachable.
+        """
+        request = self.service.events().list(
+            calendarId=self.calendar_id,
+            timeMin=time_min.isoformat(),
+            timeMax=time_max.isoformat(),
+            singleEvents=True,
+            orderBy='startTime',
+            fields='items(id,summary,location,start,end)'  # Skip descriptions, attendees etc.
+        )
+        key = (self.calendar_id, time_min.isoformat(), time_max.isoformat())
         try:
-            events_result = self.service.events().list(
-                calendarId=self.calendar_id,
-                timeMin=time_min.isoformat(),
-                timeMax=time_max.isoformat(),
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            return events_result.get('items', [])
-            
-        except Exception as e:
-            print(f"✗ Error fetching events: {str(e)}")
-            raise
+            items = resilience.call('google_calendar', request.execute).get('items', [])
+        except resilience.UpstreamUnavailable as e:
+            if key not in self._snapshots:
+                print(f"✗ Error fetching events: {str(e)}")
+                raise
+            print(f"⚠ Serving last-known events ({str(e)})")
+            return widen(normalize_events(self._snapshots[key], self.timezone), STALE_BUFFER_MINUTES)
+
+        self._snapshots.pop(key, None)
+        self._snapshots[key] = items
+        if len(self._snapshots) > MAX_SNAPSHOTS:
+            del self._snapshots[next(iter(self._snapshots))]  # Oldest
+        return normalize_events(items, self.timezone)
 
     def get_event(self, event_id):
         """Get a specific event by ID"""
         try:
-            event = self.service.events().get(
-                calendarId=self.calendar_id,
-                eventId=event_id
-            ).execute()
+            event = resilience.call(
+                'google_calendar',
+                self.service.events().get(calendarId=self.calendar_id, eventId=event_id).execute
+            )
             
             print(f"Retrieved event: {event}")  # Debug print
             return event
@@ -562,7 +682,7 @@ def init_calendar_routes(app):
         unit = request.args.get('unit')
         
         # Construct full address
-        full_address = f"{address}{f' Unit {unit}' if unit else ''}"
+        full_address = f"{address}{f' Unit {unit}' if unit else ''}" if address else None
         
         print(f"\nAPI Request received:")
         print(f"Date: {date}")
@@ -582,11 +702,22 @@ def init_calendar_routes(app):
             return jsonify({'error': error_msg}), 400
         
         try:
+            if request.args.get('mode') == 'gaps':
+                min_duration = int(request.args.get('min_duration') or duration)
+                gaps = calendar_service.get_free_intervals(
+                    date,
+                    min_duration,
+                    destination_address=full_address
+                )
+                print(f"✓ Returning {len(gaps)} free intervals")
+                return jsonify({'date': date, 'min_duration': min_duration, 'gaps': gaps})
+
             # Pass the full_address to get_available_slots
             available_slots = calendar_service.get_available_slots(
                 date, 
                 duration,
-                destination_address=full_address  # Make sure to pass the address
+                destination_address=full_address,  # Make sure to pass the address
+                rank_by_travel=request.args.get('sort') == 'travel'
             )
             response_data = {'slots': available_slots}
             print(f"✓ Returning {len(available_slots)} slots")
@@ -670,10 +801,15 @@ def init_calendar_routes(app):
             }), 400
 
 # Export the calendar service
+_calendar_service_lock = threading.Lock()
+
 def get_calendar_service():
+    """The process-wide CalendarService, created on first use"""
     global calendar_service
     if calendar_service is None:
-        calendar_service = CalendarService()
+        with _calendar_service_lock:
+            if calendar_service is None:
+                calendar_service = CalendarService()
     return calendar_service
 
 # if __name__ == "__main__":
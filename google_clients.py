@@ -0,0 +1,67 @@
+"""
+Google API clients, built on first use.
+
+Importing this module is cheap: google-auth and googleapiclient are only
+imported once credentials or a client are actually needed, so web workers
+and manage.py commands don't load them at startup.
+
+The Calendar client is built from the discovery document bundled with
+googleapiclient, so building one never fetches it over the network, and
+credentials draw their access tokens from the host-wide cache in
+google_tokens.
+"""
+
+import json
+import os
+from functools import lru_cache
+
+CALENDAR_SCOPES = [
+    'https://www.googleapis.com/auth/calendar.readonly',
+    'https://www.googleapis.com/auth/calendar.events'
+]
+DEV_CREDENTIALS_FILE = 'silentwash-4b7a2b2c111e.json'
+
+
+def credentials_configured():
+    """Whether load_service_account() has a key to load"""
+    return 'GOOGLE_CREDENTIALS' in os.environ or os.path.exists(DEV_CREDENTIALS_FILE)
+
+
+def load_service_account(scopes=CALENDAR_SCOPES):
+    """Service account credentials from GOOGLE_CREDENTIALS (the key JSON) or the local dev key file"""
+    from google.oauth2 import service_account
+
+    if 'GOOGLE_CREDENTIALS' in os.environ:
+        info = json.loads(os.environ['GOOGLE_CREDENTIALS'])
+        return service_account.Credentials.from_service_account_info(info, scopes=scopes)
+    return service_account.Credentials.from_service_account_file(DEV_CREDENTIALS_FILE, scopes=scopes)
+
+
+@lru_cache(maxsize=None)
+def _token_provider(scopes):
+    from google_tokens import TokenProvider
+    return TokenProvider(load_service_account(list(scopes)))
+
+
+def load_credentials(scopes=CALENDAR_SCOPES):
+    """Credentials for API clients, sharing one cached access token per process and host"""
+    from google_tokens import SharedTokenCredentials
+    return SharedTokenCredentials(_token_provider(tuple(scopes)))
+
+
+@lru_cache(maxsize=None)
+def calendar_discovery_document():
+    """Parsed Calendar v3 discovery document shipped with googleapiclient"""
+    from googleapiclient.discovery_cache import get_static_doc
+    return json.loads(get_static_doc('calendar', 'v3'))
+
+
+def build_calendar_client(credentials):
+    """Calendar v3 API client, without any discovery request"""
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build_from_document
+    from resilience import TIMEOUTS
+
+    http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=TIMEOUTS['google_calendar']))
+    return build_from_document(calendar_discovery_document(), http=http)
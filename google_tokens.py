@@ -0,0 +1,102 @@
+"""
+Service account access tokens shared by every Google client on a host.
+
+Each Credentials object would otherwise do its own token exchange on first
+use and again on expiry, so every request-scoped DjangoCalendarService and
+every worker paid a round trip to Google's token endpoint, in bursts after
+deploys. Here one TokenProvider per process hands out the token, backed by
+a JSON file (GOOGLE_TOKEN_CACHE_PATH) under an flock that all processes on
+the host share: whoever finds the cached token within REFRESH_MARGIN_SECONDS
+of expiry refreshes it for everyone, and the rest wait on the lock and then
+read the new one.
+
+Imported lazily by google_clients, like google-auth itself.
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from google.auth import credentials as google_credentials
+from google.auth.transport.requests import Request
+
+REFRESH_MARGIN_SECONDS = 5 * 60  # More than google-auth's own refresh threshold
+TOKEN_CACHE_PATH = os.getenv('GOOGLE_TOKEN_CACHE_PATH') or os.path.join(
+    tempfile.gettempdir(), 'google-token-cache.json')
+
+
+class TokenProvider:
+    """Access tokens for one service account and scope set, cached in memory and in a shared file"""
+
+    def __init__(self, source, path=TOKEN_CACHE_PATH):
+        self.source = source  # Credentials that perform the actual token exchange
+        self.path = path
+        self.key = f"{source.service_account_email} {' '.join(sorted(source.scopes or ()))}"
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0
+
+    def _fresh(self, expires_at):
+        return expires_at - REFRESH_MARGIN_SECONDS > time.time()
+
+    def token(self):
+        """(access token, expiry as epoch seconds), valid for at least REFRESH_MARGIN_SECONDS"""
+        if self._token and self._fresh(self._expires_at):
+            return self._token, self._expires_at
+
+        with self._lock, self._file_lock():
+            entry = self._read().get(self.key)
+            if not entry or not self._fresh(entry['expires_at']):
+                self.source.refresh(Request())
+                entry = {
+                    'token': self.source.token,
+                    'expires_at': self.source.expiry.replace(tzinfo=timezone.utc).timestamp(),
+                }
+                self._write(entry)
+                print(f"✓ Refreshed Google access token for {self.source.service_account_email}")
+            self._token, self._expires_at = entry['token'], entry['expires_at']
+        return self._token, self._expires_at
+
+    @contextmanager
+    def _file_lock(self):
+        fd = os.open(f'{self.path}.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # Releases the lock
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, entry):
+        entries = self._read()
+        entries[self.key] = entry
+        # Readers never see a partial file: write a sibling and rename over
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entries, f)
+        os.replace(temp_path, self.path)
+
+
+class SharedTokenCredentials(google_credentials.Credentials):
+    """Credentials whose refresh() takes the token from a TokenProvider"""
+
+    def __init__(self, provider):
+        super().__init__()
+        self.provider = provider
+
+    def refresh(self, request):
+        self.token, expires_at = self.provider.token()
+        # google-auth compares naive UTC datetimes
+        self.expiry = datetime.fromtimestamp(expires_at, timezone.utc).replace(tzinfo=None)
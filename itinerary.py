@@ -0,0 +1,195 @@
+"""
+Daily route optimization for a technician's bookings.
+
+Given the day's stops (each with a service duration and a time window) and
+one N×N travel matrix, find a near-optimal visiting order: cheapest
+insertion builds a route, then 2-opt (segment reversal) and or-opt (moving
+runs of 1-3 stops) improve it until no move helps.
+
+A route is scored as travel minutes plus LATENESS_PENALTY per minute a stop
+starts after its window closes, so feasible routes always win and an
+infeasible day still gets the least-late order. Arriving early means
+waiting until the window opens.
+
+Times are minutes relative to the technician's departure (minute 0).
+"""
+
+from datetime import timedelta
+
+LATENESS_PENALTY = 1000
+OR_OPT_SEGMENTS = (1, 2, 3)
+MAX_PASSES = 50
+
+
+class Stop:
+    """A visit: where, how long, and the window its start must fall in"""
+
+    def __init__(self, key, location, duration, earliest=0, latest=None):
+        self.key = key
+        self.location = location
+        self.duration = duration
+        self.earliest = earliest
+        self.latest = latest if latest is not None else float('inf')
+
+    def __repr__(self):
+        return f"Stop({self.key!r}, {self.earliest}-{self.latest})"
+
+
+class Itinerary:
+    """An ordered day: stops with their arrival and start minutes"""
+
+    def __init__(self, stops, visits, travel_minutes, late_minutes):
+        self.stops = stops
+        self.visits = visits  # [(stop, arrival, start)] in visiting order
+        self.travel_minutes = travel_minutes
+        self.late_minutes = late_minutes
+
+    @property
+    def feasible(self):
+        return self.late_minutes == 0
+
+    @property
+    def order(self):
+        return [stop.key for stop in self.stops]
+
+
+class RouteOptimizer:
+    """Orders stops over a travel matrix; index 0 of the matrix is the depot (home)"""
+
+    def __init__(self, stops, matrix, return_to_depot=True):
+        self.stops = list(stops)
+        self.matrix = matrix
+        self.return_to_depot = return_to_depot
+        # Plain lists indexed like the matrix keep cost() cheap
+        self.earliest = [0] + [stop.earliest for stop in self.stops]
+        self.latest = [float('inf')] + [stop.latest for stop in self.stops]
+        self.duration = [0] + [stop.duration for stop in self.stops]
+
+    def cost(self, route):
+        """Travel minutes plus the lateness penalty for a route of matrix indexes"""
+        matrix, earliest, latest, duration = self.matrix, self.earliest, self.latest, self.duration
+        now = travel = late = 0
+        prev = 0
+        for i in route:
+            leg = matrix[prev][i]
+            travel += leg
+            now += leg
+            if now < earliest[i]:
+                now = earliest[i]
+            elif now > latest[i]:
+                late += now - latest[i]
+            now += duration[i]
+            prev = i
+        if self.return_to_depot:
+            travel += matrix[prev][0]
+        return travel + late * LATENESS_PENALTY
+
+    def insertion(self):
+        """Cheapest insertion, tightest windows first"""
+        pending = sorted(range(1, len(self.stops) + 1), key=lambda i: (self.latest[i], self.earliest[i]))
+        route = []
+        for i in pending:
+            route = min(
+                (route[:pos] + [i] + route[pos:] for pos in range(len(route) + 1)),
+                key=self.cost
+            )
+        return route
+
+    def improve(self, route):
+        """2-opt and or-opt until a local optimum (or MAX_PASSES)"""
+        best = self.cost(route)
+        for _ in range(MAX_PASSES):
+            improved = False
+            for candidate in self._neighbours(route):
+                cost = self.cost(candidate)
+                if cost < best:
+                    route, best, improved = candidate, cost, True
+                    break
+            if not improved:
+                break
+        return route
+
+    def _neighbours(self, route):
+        n = len(route)
+        # 2-opt: reverse route[i:j]
+        for i in range(n - 1):
+            for j in range(i + 2, n + 1):
+                yield route[:i] + route[i:j][::-1] + route[j:]
+        # or-opt: move a run of stops elsewhere
+        for length in OR_OPT_SEGMENTS:
+            for i in range(n - length + 1):
+                segment = route[i:i + length]
+                rest = route[:i] + route[i + length:]
+                for pos in range(len(rest) + 1):
+                    if pos != i:
+                        yield rest[:pos] + segment + rest[pos:]
+
+    def solve(self):
+        route = self.improve(self.insertion())
+        return self.itinerary(route)
+
+    def itinerary(self, route):
+        visits = []
+        now = travel = late = 0
+        prev = 0
+        for i in route:
+            travel += self.matrix[prev][i]
+            arrival = now + self.matrix[prev][i]
+            start = max(arrival, self.earliest[i])
+            late += max(0, start - self.latest[i])
+            visits.append((self.stops[i - 1], arrival, start))
+            now = start + self.duration[i]
+            prev = i
+        if self.return_to_depot:
+            travel += self.matrix[prev][0]
+        return Itinerary([visit[0] for visit in visits], visits, travel, late)
+
+
+def optimize_route(stops, matrix, return_to_depot=True):
+    """Near-optimal Itinerary for stops; matrix[0] is the depot, matrix[i] is stops[i-1]"""
+    return RouteOptimizer(stops, matrix, return_to_depot).solve()
+
+
+def travel_matrix(locations, departure_time, calculator=None):
+    """N×N travel minutes between locations from a single batched lookup"""
+    if calculator is None:
+        from directions import TravelTimeCalculator
+        calculator = TravelTimeCalculator()
+
+    locations = tuple(locations)
+    travel_times = calculator.get_travel_times(locations, locations, departure_time)
+    if travel_times is None:
+        raise ValueError("Travel times unavailable")
+    return [
+        [0 if origin == dest else travel_times[str(origin)][str(dest)]['minutes'] for dest in locations]
+        for origin in locations
+    ]
+
+
+def plan_day(home, bookings, departure_time, calculator=None, return_home=True):
+    """Optimize a day of bookings starting and ending at home
+
+    bookings are dicts with 'id', 'location', 'duration' (minutes) and
+    optional 'earliest'/'latest' datetimes bounding the start. Returns an
+    Itinerary whose visits carry real datetimes.
+    """
+    def offset(moment):
+        return None if moment is None else (moment - departure_time).total_seconds() / 60
+
+    stops = [
+        Stop(
+            booking['id'],
+            booking['location'],
+            booking['duration'],
+            earliest=offset(booking.get('earliest')) or 0,
+            latest=offset(booking.get('latest'))
+        )
+        for booking in bookings
+    ]
+    matrix = travel_matrix([home] + [stop.location for stop in stops], departure_time, calculator)
+    itinerary = optimize_route(stops, matrix, return_to_depot=return_home)
+    itinerary.visits = [
+        (stop, departure_time + timedelta(minutes=arrival), departure_time + timedelta(minutes=start))
+        for stop, arrival, start in itinerary.visits
+    ]
+    return itinerary
@@ -0,0 +1,234 @@
+"""
+Timeouts, retries and circuit breakers for calls to upstream services.
+
+Every call to Google Calendar, Google Maps or Stripe goes through call():
+
+- Each upstream has a socket timeout (TIMEOUTS, applied where its client
+  is built) and a deadline (DEADLINES) bounding one call including its
+  retries.
+- Transient failures (connection errors, timeouts, 429 and 5xx) are
+  retried with full-jitter exponential backoff, drawing on a retry budget
+  shared by everything one request does. A request that has already spent
+  its budget against a struggling upstream fails fast instead of adding to
+  the load.
+- Each upstream has a circuit breaker: after FAILURE_THRESHOLD
+  consecutive failures calls fail immediately with CircuitOpen for
+  RESET_SECONDS, then one trial call decides whether to close it again.
+  Breakers are per process.
+
+- Calls can be charged against a quota (see charge_quota()), e.g. a
+  business's token bucket; a call the quota refuses is never sent and
+  fails with QuotaExceeded.
+
+Callers catch UpstreamUnavailable to degrade, e.g. availability falls back
+to the last calendar snapshot it saw.
+"""
+
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+TIMEOUTS = {  # Seconds per network operation
+    'google_calendar': 5,
+    'google_maps': 5,
+    'stripe': 10,
+}
+DEADLINES = {  # Seconds per call(), retries included
+    'google_calendar': 10,
+    'google_maps': 8,
+    'stripe': 20,
+}
+MAX_ATTEMPTS = 3
+BASE_BACKOFF_SECONDS = 0.2
+MAX_BACKOFF_SECONDS = 2
+REQUEST_RETRY_BUDGET = 4
+FAILURE_THRESHOLD = 5
+RESET_SECONDS = 30
+
+# Client exceptions without an HTTP status that still mean "try again"
+TRANSIENT_ERROR_NAMES = {
+    'APIConnectionError', 'RateLimitError',  # stripe
+    'Timeout', 'TransportError',  # googlemaps
+    'ServerNotFoundError', 'RedirectMissingLocation',  # httplib2
+}
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream call failed after its retries, or wasn't attempted"""
+
+    def __init__(self, upstream, message):
+        super().__init__(f"{upstream} unavailable: {message}")
+        self.upstream = upstream
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """The upstream's breaker is open"""
+
+
+class QuotaExceeded(UpstreamUnavailable):
+    """The current quota has no budget left for the upstream"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open trial -> closed"""
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_seconds=RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def allow(self):
+        """Whether a call may go out now (a half-open breaker lets one through)"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial_running = True
+            return True
+
+    def release(self):
+        """Give back a call allow() let through that never went out"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"⚠ Circuit for {self.name} opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+breakers = {name: CircuitBreaker(name) for name in TIMEOUTS}
+
+
+class RetryBudget:
+    """Retries one request may spend across all its upstream calls"""
+
+    def __init__(self, retries=REQUEST_RETRY_BUDGET):
+        self.remaining = retries
+
+    def spend(self):
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+_budget = contextvars.ContextVar('retry_budget', default=None)
+
+
+def reset_retry_budget(retries=REQUEST_RETRY_BUDGET):
+    """Start a fresh budget for the current request (or job)"""
+    _budget.set(RetryBudget(retries))
+
+
+def _current_budget():
+    budget = _budget.get()
+    if budget is None:
+        budget = RetryBudget()
+        _budget.set(budget)
+    return budget
+
+
+_quota = contextvars.ContextVar('upstream_quota', default=None)
+
+
+@contextmanager
+def charge_quota(take):
+    """Charge upstream calls in this block to a quota
+
+    take(upstream, cost) returns whether the quota had cost units left and
+    spends them if so.
+    """
+    token = _quota.set(take)
+    try:
+        yield
+    finally:
+        _quota.reset(token)
+
+
+class RetryBudgetMiddleware:
+    """Django middleware giving every request its own retry budget"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset_retry_budget()
+        return self.get_response(request)
+
+
+def is_transient(exc):
+    """Whether a failure is worth retrying (and counts against the breaker)"""
+    status = (
+        getattr(getattr(exc, 'resp', None), 'status', None)  # googleapiclient HttpError
+        or getattr(exc, 'http_status', None)  # stripe
+        or getattr(exc, 'status_code', None)
+    )
+    if status is not None:
+        return int(status) == 429 or int(status) >= 500
+    return isinstance(exc, (OSError, TimeoutError)) or type(exc).__name__ in TRANSIENT_ERROR_NAMES
+
+
+def backoff(attempt):
+    """Full-jitter exponential delay before retry number `attempt` (1-based)"""
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def call(upstream, fn, *args, retry=True, cost=1, **kwargs):
+    """fn(*args, **kwargs) under upstream's breaker, deadline and retry policy
+
+    Raises UpstreamUnavailable (CircuitOpen while the breaker is open,
+    QuotaExceeded when the current quota can't cover `cost` units per
+    attempt) when the upstream can't be reached; other errors, like a 404
+    or a card decline, propagate unchanged. Pass retry=False for calls
+    that aren't safe to repeat.
+    """
+    breaker = breakers[upstream]
+    deadline = time.monotonic() + DEADLINES[upstream]
+    take = _quota.get()
+    attempt = 0
+    while True:
+        # Quota is only spent on attempts that actually go out
+        if not breaker.allow():
+            raise CircuitOpen(upstream, "circuit open")
+        if take is not None and not take(upstream, cost):
+            breaker.release()
+            raise QuotaExceeded(upstream, "quota exhausted")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_transient(e):
+                breaker.record_success()  # It answered
+                raise
+            breaker.record_failure()
+            attempt += 1
+            delay = backoff(attempt)
+            if (not retry or attempt >= MAX_ATTEMPTS or time.monotonic() + delay >= deadline
+                    or not _current_budget().spend()):
+                raise UpstreamUnavailable(upstream, str(e)) from e
+            print(f"⚠ {upstream} failed ({e}), retry {attempt} in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
@@ -0,0 +1,436 @@
+"""
+Travel time backends for directions.TravelTimeCalculator.
+
+GoogleMapsBackend asks the Distance Matrix API (a network round trip, billed
+per element). LocalGraphBackend answers from a road graph loaded from disk,
+e.g. an edge list exported from OpenStreetMap for the service region, so slot
+computation can run entirely in-process.
+
+Pick one with TRAVEL_TIME_BACKEND=google|local; the local backend reads its
+graph from ROAD_GRAPH_PATH.
+
+Road graph file format (CSV, blank lines and '#' comments ignored):
+
+    node,<id>,<lat>,<lng>
+    edge,<from id>,<to id>,<seconds>[,oneway]
+    alias,<node id>,<place name or address>
+
+Locations are resolved as an alias (case-insensitive), a node id, or a
+"lat,lng" string snapped to the nearest node.
+
+Queries use ALT (A*, landmarks, triangle inequality): when the graph is
+loaded, exact distances from and to a few landmark nodes on the edge of
+the region are precomputed, and give A* a lower bound on the remaining
+drive from any node. A query then settles mostly the nodes along the
+route instead of the whole disk Dijkstra would grow around the origin.
+ROAD_GRAPH_LANDMARKS sets how many (2 x 8 bytes per node each; 0 falls
+back to plain Dijkstra).
+"""
+
+import csv
+import math
+import os
+from array import array
+from datetime import datetime, timedelta
+from functools import lru_cache
+from heapq import heappop, heappush
+
+import resilience
+
+GRID_DEGREES = 0.01  # ~1km cells for nearest-node lookups
+MAX_SNAP_RINGS = 50
+MAX_MATRIX_SIDE = 25  # Distance Matrix API limits per request
+MAX_MATRIX_ELEMENTS = 100
+LANDMARKS = int(os.getenv('ROAD_GRAPH_LANDMARKS', '8'))
+# Past this many targets, one Dijkstra sweep beats an A* search per target
+MAX_ALT_TARGETS = 6
+
+
+def maps_client():
+    """googlemaps client with our timeouts; retries are left to resilience.call()"""
+    import googlemaps
+    return googlemaps.Client(
+        key=os.environ['GOOGLE_MAPS_API_KEY'],
+        timeout=resilience.TIMEOUTS['google_maps'],
+        retry_timeout=resilience.TIMEOUTS['google_maps'],
+        retry_over_query_limit=False
+    )
+
+
+class TravelTimeBackend:
+    """Answers many-to-many driving time queries"""
+
+    name = None
+
+    def travel_seconds(self, origins, destinations, departure_time):
+        """Matrix of travel seconds (one row per origin), None where unreachable"""
+        raise NotImplementedError
+
+
+class GoogleMapsBackend(TravelTimeBackend):
+    """Travel times from the Google Distance Matrix API"""
+
+    name = 'google'
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = maps_client()
+        return self._client
+
+    def travel_seconds(self, origins, destinations, departure_time):
+        # Traffic predictions need a future departure: use the same time of
+        # day, today or tomorrow
+        now = datetime.now()
+        departure = now.replace(
+            hour=departure_time.hour,
+            minute=departure_time.minute,
+            second=0,
+            microsecond=0
+        )
+        if departure < now:
+            departure += timedelta(days=1)
+
+        print(f"Calculating travel time using departure: {departure.strftime('%Y-%m-%d %H:%M')}")
+
+        # Larger matrices are fetched in blocks within the per-request limits
+        origins, destinations = list(origins), list(destinations)
+        matrix = [[] for _ in origins]
+        for d in range(0, len(destinations), MAX_MATRIX_SIDE):
+            dest_block = destinations[d:d + MAX_MATRIX_SIDE]
+            rows_per_request = max(1, min(MAX_MATRIX_SIDE, MAX_MATRIX_ELEMENTS // len(dest_block)))
+            for o in range(0, len(origins), rows_per_request):
+                origin_block = origins[o:o + rows_per_request]
+                result = resilience.call(
+                    'google_maps',
+                    self.client.distance_matrix,
+                    cost=len(origin_block) * len(dest_block),  # Billed per element
+                    origins=origin_block,
+                    destinations=dest_block,
+                    mode="driving",
+                    departure_time=departure
+                )
+                for i, row in enumerate(result['rows']):
+                    matrix[o + i].extend(
+                        element['duration']['value'] if element.get('status', 'OK') == 'OK' else None
+                        for element in row['elements']
+                    )
+        return matrix
+
+
+class RoadGraph:
+    """Directed road graph in compressed adjacency arrays, with shortest-path queries
+
+    Built once per file: node ids are mapped to dense indexes, forward and
+    reverse adjacency are packed into offset/target/weight arrays, nodes
+    are bucketed into a coordinate grid for snapping "lat,lng" locations
+    and landmark distances are precomputed for ALT queries.
+    """
+
+    def __init__(self, node_ids, coordinates, edges, aliases=None, landmarks=LANDMARKS):
+        self.node_ids = list(node_ids)
+        self.index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.coordinates = list(coordinates)
+        self.aliases = {
+            name.strip().lower(): self.index[node_id]
+            for name, node_id in (aliases or {}).items()
+        }
+
+        arcs = [(self.index[u], self.index[v], float(seconds)) for u, v, seconds in edges]
+        self._forward = self._pack(arcs)
+        self._backward = self._pack([(v, u, seconds) for u, v, seconds in arcs])
+
+        self._grid = {}
+        for i, (lat, lng) in enumerate(self.coordinates):
+            self._grid.setdefault(self._cell(lat, lng), []).append(i)
+
+        self.landmarks, self._from_landmark, self._to_landmark = self._pick_landmarks(landmarks)
+
+    @classmethod
+    def load(cls, path):
+        node_ids, coordinates, edges, aliases = [], [], [], {}
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                if not row or row[0].startswith('#'):
+                    continue
+                kind = row[0].strip()
+                if kind == 'node':
+                    node_ids.append(row[1].strip())
+                    coordinates.append((float(row[2]), float(row[3])))
+                elif kind == 'edge':
+                    u, v, seconds = row[1].strip(), row[2].strip(), float(row[3])
+                    edges.append((u, v, seconds))
+                    if len(row) < 5 or row[4].strip() != 'oneway':
+                        edges.append((v, u, seconds))
+                elif kind == 'alias':
+                    aliases[','.join(row[2:])] = row[1].strip()
+                else:
+                    raise ValueError(f"Unknown road graph record: {kind}")
+        return cls(node_ids, coordinates, edges, aliases)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def _pack(self, arcs):
+        offsets = [0] * (len(self.node_ids) + 1)
+        for u, _, _ in arcs:
+            offsets[u + 1] += 1
+        for i in range(len(self.node_ids)):
+            offsets[i + 1] += offsets[i]
+
+        targets = array('i', [0]) * len(arcs)
+        weights = array('d', [0.0]) * len(arcs)
+        fill = offsets[:-1]
+        for u, v, seconds in arcs:
+            targets[fill[u]] = v
+            weights[fill[u]] = seconds
+            fill[u] += 1
+        return array('i', offsets), targets, weights
+
+    def _distances(self, source, graph):
+        """Dijkstra over the whole graph: seconds from source to every node (inf if unreachable)"""
+        offsets, targets, weights = graph
+        dist = array('d', [math.inf]) * len(self.node_ids)
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heappop(heap)
+            if d > dist[u]:
+                continue
+            for i in range(offsets[u], offsets[u + 1]):
+                v, nd = targets[i], d + weights[i]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    heappush(heap, (nd, v))
+        return dist
+
+    def _pick_landmarks(self, count):
+        """Farthest-point landmarks with their distances from and to every node"""
+        landmarks, from_landmark, to_landmark = [], [], []
+        if not self.node_ids:
+            return landmarks, from_landmark, to_landmark
+        # Each new landmark is the node farthest from those already picked
+        nearest = self._distances(0, self._forward)
+        for _ in range(min(count, len(self.node_ids))):
+            candidate = max(
+                (i for i in range(len(nearest)) if nearest[i] < math.inf and i not in landmarks),
+                key=nearest.__getitem__,
+                default=None
+            )
+            if candidate is None:
+                break
+            landmarks.append(candidate)
+            from_landmark.append(self._distances(candidate, self._forward))
+            to_landmark.append(self._distances(candidate, self._backward))
+            nearest = array('d', map(min, nearest, from_landmark[-1]))
+        return landmarks, from_landmark, to_landmark
+
+    def _lower_bound(self, target):
+        """h(v): a lower bound on the seconds from v to target, from the landmark distances"""
+        terms = [
+            (from_l, from_l[target], to_l, to_l[target])
+            for from_l, to_l in zip(self._from_landmark, self._to_landmark)
+        ]
+
+        def bound(v):
+            best = 0.0
+            for from_l, from_target, to_l, to_target in terms:
+                # d(L,t) <= d(L,v) + d(v,t) and d(v,L) <= d(v,t) + d(t,L)
+                from_v, to_v = from_l[v], to_l[v]
+                if from_target < math.inf and from_v < math.inf and from_target - from_v > best:
+                    best = from_target - from_v
+                if to_v < math.inf and to_target < math.inf and to_v - to_target > best:
+                    best = to_v - to_target
+            return best
+        return bound
+
+    @staticmethod
+    def _cell(lat, lng):
+        return (math.floor(lat / GRID_DEGREES), math.floor(lng / GRID_DEGREES))
+
+    def nearest_node(self, lat, lng):
+        """Index of the node closest to a coordinate"""
+        row, col = self._cell(lat, lng)
+        scale = math.cos(math.radians(lat))
+        best, best_distance = None, math.inf
+        for ring in range(MAX_SNAP_RINGS):
+            for r in range(row - ring, row + ring + 1):
+                for c in range(col - ring, col + ring + 1):
+                    if max(abs(r - row), abs(c - col)) != ring:
+                        continue
+                    for i in self._grid.get((r, c), ()):
+                        node_lat, node_lng = self.coordinates[i]
+                        distance = math.hypot(node_lat - lat, (node_lng - lng) * scale)
+                        if distance < best_distance:
+                            best, best_distance = i, distance
+            # Anything in a further ring is at least `ring` cells away
+            if best is not None and best_distance <= ring * GRID_DEGREES * scale:
+                break
+        if best is None:
+            raise KeyError(f"No road graph node near {lat},{lng}")
+        return best
+
+    def resolve(self, location):
+        """Node index for an alias, node id or "lat,lng" string; KeyError if unknown"""
+        key = str(location).strip()
+        if key.lower() in self.aliases:
+            return self.aliases[key.lower()]
+        if key in self.index:
+            return self.index[key]
+        try:
+            lat, lng = (float(part) for part in key.split(','))
+        except ValueError:
+            raise KeyError(f"Unknown location for road graph: {location}")
+        return self.nearest_node(lat, lng)
+
+    def shortest_seconds(self, source, target):
+        """Seconds between two node indexes (ALT A* search); None if unreachable"""
+        if source == target:
+            return 0.0
+        if not self.landmarks:
+            return self._bidirectional_dijkstra(source, target)
+
+        bound = self._lower_bound(target)
+        offsets, targets, weights = self._forward
+        dist = {source: 0.0}
+        settled = set()
+        heap = [(bound(source), 0.0, source)]
+
+        while heap:
+            _, d, u = heappop(heap)
+            if u == target:
+                return d
+            if u in settled:
+                continue
+            settled.add(u)
+            for i in range(offsets[u], offsets[u + 1]):
+                v, nd = targets[i], d + weights[i]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    heappush(heap, (nd + bound(v), nd, v))
+        return None
+
+    def _bidirectional_dijkstra(self, source, target):
+        graphs = (self._forward, self._backward)
+        dist = ({source: 0.0}, {target: 0.0})
+        settled = (set(), set())
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best = math.inf
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            d, u = heappop(heaps[side])
+            if u in settled[side]:
+                continue
+            settled[side].add(u)
+
+            offsets, targets, weights = graphs[side]
+            mine, other = dist[side], dist[1 - side]
+            for i in range(offsets[u], offsets[u + 1]):
+                v, nd = targets[i], d + weights[i]
+                if nd < mine.get(v, math.inf):
+                    mine[v] = nd
+                    heappush(heaps[side], (nd, v))
+                if v in other and nd + other[v] < best:
+                    best = nd + other[v]
+
+        return None if best == math.inf else best
+
+    def one_to_many(self, source, targets):
+        """Seconds from one node to each target; None where unreachable
+
+        A few targets get one A* search each; for more, one Dijkstra that
+        stops once every target is settled is cheaper.
+        """
+        if self.landmarks and len(set(targets)) <= MAX_ALT_TARGETS:
+            seconds = {target: self.shortest_seconds(source, target) for target in set(targets)}
+            return [seconds[target] for target in targets]
+
+        offsets, arc_targets, weights = self._forward
+        remaining = set(targets)
+        dist = {source: 0.0}
+        settled = {}
+        heap = [(0.0, source)]
+
+        while heap and remaining:
+            d, u = heappop(heap)
+            if u in settled:
+                continue
+            settled[u] = d
+            remaining.discard(u)
+            for i in range(offsets[u], offsets[u + 1]):
+                v, nd = arc_targets[i], d + weights[i]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    heappush(heap, (nd, v))
+
+        return [settled.get(target) for target in targets]
+
+
+class LocalGraphBackend(TravelTimeBackend):
+    """Travel times from an in-process road graph (free-flow; departure time is ignored)"""
+
+    name = 'local'
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def travel_seconds(self, origins, destinations, departure_time):
+        sources = [self.graph.resolve(origin) for origin in origins]
+        targets = [self.graph.resolve(destination) for destination in destinations]
+
+        matrix = []
+        for source in sources:
+            if len(targets) == 1:
+                row = [self.graph.shortest_seconds(source, targets[0])]
+            else:
+                row = self.graph.one_to_many(source, targets)
+            matrix.append([None if seconds is None else int(round(seconds)) for seconds in row])
+        return matrix
+
+
+@lru_cache(maxsize=4)
+def load_road_graph(path):
+    """Load (once per process) the road graph at path"""
+    graph = RoadGraph.load(path)
+    print(f"✓ Loaded road graph with {len(graph)} nodes from {path}")
+    return graph
+
+
+@lru_cache(maxsize=None)
+def _backend(name, graph_path):
+    if name == 'google':
+        return GoogleMapsBackend()
+    if name == 'local':
+        if not graph_path:
+            raise ValueError("TRAVEL_TIME_BACKEND=local requires ROAD_GRAPH_PATH")
+        return LocalGraphBackend(load_road_graph(graph_path))
+    raise ValueError(f"Unknown TRAVEL_TIME_BACKEND: {name}")
+
+
+def get_travel_time_backend():
+    """Backend selected by TRAVEL_TIME_BACKEND (default google)"""
+    return _backend(
+        os.getenv('TRAVEL_TIME_BACKEND', 'google').lower(),
+        os.getenv('ROAD_GRAPH_PATH')
+    )
+
+
+def format_duration(seconds):
+    """Google-style duration text, e.g. "25 mins" or "1 hour 5 mins" """
+    minutes = max(1, int(round(seconds / 60)))
+    hours, minutes = divmod(minutes, 60)
+
+    def plural(value, unit):
+        return f"{value} {unit}{'s' if value != 1 else ''}"
+
+    if hours and minutes:
+        return f"{plural(hours, 'hour')} {plural(minutes, 'min')}"
+    if hours:
+        return plural(hours, 'hour')
+    return plural(minutes, 'min')
@@ -1,32 +1,74 @@
 from django.contrib import admin
-from .models import Service, Booking
+from django.forms.models import BaseInlineFormSet
+from core.pagination import EstimatedCountPaginator
+from .models import Service, Booking, Resource, ResourceHours, UpstreamQuota
+
+class RecentBookingsFormSet(BaseInlineFormSet):
+    """Inline formset showing only the most recent bookings"""
+    max_rows = 20
+
+    def get_queryset(self):
+        if not hasattr(self, '_recent_queryset'):
+            self._recent_queryset = super().get_queryset().order_by('-start_time')[:self.max_rows]
+        return self._recent_queryset
+
+class RecentBookingsInline(admin.TabularInline):
+    """Latest bookings for a parent object; the full list is in the Booking changelist"""
+    model = Booking
+    formset = RecentBookingsFormSet
+    extra = 0
+    verbose_name_plural = f'recent bookings (latest {RecentBookingsFormSet.max_rows})'
+    fields = ('business', 'service', 'customer', 'resource', 'start_time', 'end_time', 'status')
+    autocomplete_fields = ('business', 'service', 'customer', 'resource')
+    show_change_link = True
 
 @admin.register(Service)
 class ServiceAdmin(admin.ModelAdmin):
     list_display = ('name', 'business', 'duration', 'price', 'active')
-    list_filter = ('active', 'business', 'price')
+    list_filter = ('active', 'price')
+    list_select_related = ('business',)
     search_fields = ('name', 'business__name')
     list_editable = ('active', 'price')  # Quick edit in list view
+    autocomplete_fields = ('business',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     # Add inline bookings view
-    class BookingInline(admin.TabularInline):
-        model = Booking
+    inlines = [RecentBookingsInline]
+
+@admin.register(Resource)
+class ResourceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'business', 'calendar_id', 'active')
+    list_filter = ('active',)
+    list_select_related = ('business',)
+    search_fields = ('name', 'business__name')
+    autocomplete_fields = ('business',)
+
+    class ResourceHoursInline(admin.TabularInline):
+        model = ResourceHours
         extra = 0
-        
-    inlines = [BookingInline]
+        max_num = 7
+
+    inlines = [ResourceHoursInline, RecentBookingsInline]
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
-    list_display = ('business', 'service', 'customer', 'start_time', 'end_time', 'status')
-    list_filter = ('status', 'business', 'start_time')
+    list_display = ('business', 'service', 'customer', 'resource', 'start_time', 'end_time', 'status')
+    # No business filter: its dropdown lists every business. Search by name instead.
+    list_filter = ('status',)
+    list_select_related = ('business', 'service__business', 'customer', 'resource')
     search_fields = ('customer__name', 'customer__email', 'business__name')
-    readonly_fields = ('created_at',)
+    date_hierarchy = 'start_time'
+    readonly_fields = ('created_at', 'reminder_sent_at')
     ordering = ('-start_time',)
+    autocomplete_fields = ('business', 'service', 'customer', 'resource')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Skip the second, unfiltered COUNT(*)
     
     # Add fieldsets for better organization
     fieldsets = (
         ('Booking Info', {
-            'fields': ('business', 'service', 'customer')
+            'fields': ('business', 'service', 'customer', 'resource')
         }),
         ('Time Details', {
             'fields': ('start_time', 'end_time')
@@ -34,8 +76,39 @@ class BookingAdmin(admin.ModelAdmin):
         ('Status', {
             'fields': ('status', 'notes')
         }),
+        ('Reminder', {
+            'fields': ('next_reminder_at', 'reminder_sent_at')
+        }),
         ('System', {
             'fields': ('created_at',),
             'classes': ('collapse',)
         })
     )
+
+
+@admin.register(UpstreamQuota)
+class UpstreamQuotaAdmin(admin.ModelAdmin):
+    """Per-business Google API budgets and what has been spent/refused"""
+    list_display = ('business', 'upstream', 'capacity', 'refill_per_minute', 'available_tokens', 'consumed', 'denied')
+    list_filter = ('upstream',)
+    list_select_related = ('business',)
+    list_editable = ('capacity', 'refill_per_minute')
+    search_fields = ('business__name',)
+    autocomplete_fields = ('business',)
+    readonly_fields = ('available_tokens', 'consumed', 'denied', 'refilled_at')
+    fields = ('business', 'upstream', 'capacity', 'refill_per_minute', 'available_tokens', 'consumed', 'denied', 'refilled_at')
+    ordering = ('-denied',)
+
+    @admin.display(description='available now')
+    def available_tokens(self, obj):
+        if obj.pk is None:
+            return '-'
+        return int(obj.available())
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # Leave the balance and counters to the workers spending them
+            obj.save(update_fields=form.changed_data)
+        else:
+            obj.tokens = obj.capacity  # New buckets start full
+            obj.save()
@@ -0,0 +1,122 @@
+"""
+Bitset availability for a day.
+
+A day is cut into GRAIN_MINUTES units and a set of units is a Python int
+with bit i standing for minutes [i * GRAIN, (i + 1) * GRAIN). Busy times,
+open hours and "can start here" positions for each resource are all such
+masks, so combining resources or bookings is a handful of big-int ANDs,
+ORs and shifts instead of a scan per slot.
+"""
+
+import math
+from functools import reduce
+from operator import or_
+
+GRAIN_MINUTES = 5
+DAY_UNITS = 24 * 60 // GRAIN_MINUTES
+
+
+def units(minutes):
+    """Whole units needed to cover a duration"""
+    return math.ceil(minutes / GRAIN_MINUTES)
+
+
+def interval_mask(start_minute, end_minute):
+    """Units touched by [start_minute, end_minute) of the day, clamped to the day"""
+    first = max(0, int(start_minute // GRAIN_MINUTES))
+    last = min(DAY_UNITS, units(end_minute))
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def busy_mask(intervals):
+    """Union of (start_minute, end_minute) intervals"""
+    return reduce(or_, (interval_mask(start, end) for start, end in intervals), 0)
+
+
+def start_mask(free, length):
+    """Bit i set iff units i .. i+length-1 are all free
+
+    Doubles the run length each step, so it costs O(log length) shifts.
+    """
+    if length <= 0:
+        return free
+    starts, span = free, 1
+    while span < length:
+        step = min(span, length - span)
+        starts &= starts >> step
+        span += step
+    return starts
+
+
+def can_start(mask, minute):
+    """Whether a start mask allows starting at a minute of the day"""
+    return minute % GRAIN_MINUTES == 0 and bool(mask >> (minute // GRAIN_MINUTES) & 1)
+
+
+class Lane:
+    """Availability of one resource (None for the implicit single resource)"""
+
+    def __init__(self, resource, open_mask, busy=0):
+        self.resource = resource
+        self.open_mask = open_mask
+        self.busy = busy
+
+    @property
+    def free(self):
+        return self.open_mask & ~self.busy
+
+    def fits(self, mask):
+        return mask & self.free == mask
+
+    def starts(self, duration_minutes):
+        return start_mask(self.free, units(duration_minutes))
+
+
+def place(lanes, mask):
+    """Occupy the first lane with room for mask; returns it, or None if none fits
+
+    Used for things that need a resource but aren't assigned one yet
+    (holds, unassigned bookings).
+    """
+    for lane in lanes:
+        if lane.fits(mask):
+            lane.busy |= mask
+            return lane
+    return None
+
+
+def union_starts(lanes, duration_minutes):
+    """Start positions where at least one lane can fit the duration"""
+    return reduce(or_, (lane.starts(duration_minutes) for lane in lanes), 0)
+
+
+def runs(mask):
+    """(first, end) unit ranges of consecutive set bits, in order; O(runs) big-int ops"""
+    result = []
+    while mask:
+        low = mask & -mask
+        first = low.bit_length() - 1
+        # Adding the lowest bit carries through the run and lands just past it
+        carried = mask + low
+        end = (carried & -carried).bit_length() - 1
+        result.append((first, end))
+        mask &= ~((1 << end) - 1)
+    return result
+
+
+def free_intervals(lanes, min_minutes=0, not_before=0):
+    """[start, end] minute offsets where some lane is free for at least min_minutes
+
+    Each lane contributes its own free runs, so an interval always belongs
+    to one resource and any start leaving min_minutes before its end works.
+    """
+    intervals = set()
+    for lane in lanes:
+        for first, end in runs(lane.free):
+            start = max(first * GRAIN_MINUTES, not_before)
+            end = end * GRAIN_MINUTES
+            if end - start >= max(min_minutes, 1):
+                intervals.add((start, end))
+    return [list(interval) for interval in sorted(intervals)]
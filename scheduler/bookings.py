@@ -0,0 +1,122 @@
+from datetime import timedelta
+import pytz
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from .models import Booking, BookingDayLock
+from .profiles import get_schedule_profile
+from .services import DjangoCalendarService
+
+
+def lock_business_day(business, date):
+    """Acquire the booking lock for (business, date) until the transaction ends
+
+    Only bookings for the same business on the same day wait on each other, so
+    throughput scales with the number of distinct business-days being booked.
+    """
+    lock, _ = BookingDayLock.objects.get_or_create(business=business, date=date)
+
+    # Row lock on Postgres/MySQL. The write also takes SQLite's database lock
+    # up front, before availability is re-checked.
+    lock = BookingDayLock.objects.select_for_update().get(pk=lock.pk)
+    lock.locked_at = timezone.now()
+    lock.save(update_fields=['locked_at'])
+    return lock
+
+
+def _within(hours, start_time, end_time):
+    """Whether [start_time, end_time) falls inside open hours (None when closed)"""
+    tz = pytz.timezone(settings.SCHEDULER_TIME_ZONE)
+    local_start, local_end = start_time.astimezone(tz), end_time.astimezone(tz)
+    return bool(
+        hours
+        and hours.start_time <= local_start.time()
+        and local_end.time() <= hours.end_time
+        and local_end.date() == local_start.date()
+    )
+
+
+def assign_resource(business, start_time, end_time, profile=None, calendar=None):
+    """Pick a free resource for [start_time, end_time); call under the day lock
+
+    Returns None for businesses without resources (after checking the slot
+    is free) and raises ValidationError when nobody is available. With a
+    calendar service, resources whose own calendar is busy are skipped.
+    """
+    profile = profile or get_schedule_profile(business.id)
+    overlapping = Booking.objects.overlapping(business, start_time, end_time)
+    if not profile.resources:
+        if overlapping.for_resource(None).exists():
+            raise ValidationError("This time slot overlaps with another booking")
+        return None
+
+    local_date = start_time.astimezone(pytz.timezone(settings.SCHEDULER_TIME_ZONE)).date()
+    busy = list(overlapping.values_list('resource_id', flat=True))
+
+    free = [
+        resource for resource, hours in profile.resource_hours_for(local_date)
+        if resource.id not in busy
+        and _within(hours, start_time, end_time)
+        and (calendar is None or not resource.calendar_id
+             or calendar.is_calendar_free(start_time, end_time, resource.calendar_id))
+    ]
+    # Unassigned bookings still need someone to serve them
+    if len(free) <= busy.count(None):
+        raise ValidationError("No technician is available at this time")
+    return free[0]
+
+
+def calendar_reads(business, profile=None):
+    """Most Google Calendar reads create_booking makes to re-check a slot"""
+    profile = profile or get_schedule_profile(business.id)
+    return bool(business.calendar_id) + sum(1 for resource in profile.resources if resource.calendar_id)
+
+
+def create_booking(business, service, customer, start_time, notes='', resource=None):
+    """Create a booking after re-validating availability under the day lock
+
+    Checks opening hours and the Google Calendar busy times as well as other
+    bookings, and assigns the first free resource unless one is given. May
+    raise UpstreamUnavailable when the calendar can't be read at all.
+    Charge quota for the reads beforehand (see calendar_reads), not around
+    this call, or the quota row stays locked for the whole transaction.
+    """
+    if service.business_id != business.id:
+        raise ValidationError("Service does not belong to this business")
+
+    end_time = start_time + timedelta(minutes=service.duration)
+    local_date = start_time.astimezone(pytz.timezone(settings.SCHEDULER_TIME_ZONE)).date()
+
+    with transaction.atomic():
+        lock_business_day(business, local_date)
+
+        # Re-check inside the lock: the slot may have been taken since the
+        # customer loaded availability
+        profile = get_schedule_profile(business.id)
+        if resource is not None or not profile.resources:
+            # Resources picked by assign_resource are checked against their own hours there
+            hours = dict(profile.resource_hours_for(local_date)).get(resource)
+            if not _within(hours, start_time, end_time):
+                raise ValidationError("This time is outside business hours")
+
+        calendar = DjangoCalendarService(business, profile)
+        if not calendar.is_calendar_free(start_time, end_time):
+            raise ValidationError("This time slot is busy on the business calendar")
+
+        if resource is None:
+            resource = assign_resource(business, start_time, end_time, profile, calendar)
+        elif Booking.objects.overlapping(business, start_time, end_time).for_resource(resource).exists():
+            raise ValidationError("This time slot overlaps with another booking")
+        elif resource.calendar_id and not calendar.is_calendar_free(start_time, end_time, resource.calendar_id):
+            raise ValidationError("This time slot is busy on the resource's calendar")
+
+        return Booking.objects.create(
+            business=business,
+            service=service,
+            customer=customer,
+            resource=resource,
+            start_time=start_time,
+            end_time=end_time,
+            notes=notes
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from scheduler.rollups import backfill_daily_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild BusinessDailyStats rollups from the Booking table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business', type=int, help="Only rebuild this business id")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rows = backfill_daily_stats(options['business'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} daily stats rows"))
@@ -0,0 +1,60 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+import pytz
+from django.conf import settings
+from core.models import Business
+from resilience import UpstreamUnavailable, reset_retry_budget
+from scheduler.profiles import get_schedule_profile
+from scheduler.schedule_store import get_schedule_store
+from scheduler.services import DjangoCalendarService
+
+
+class Command(BaseCommand):
+    help = "Compute upcoming days into the shared schedule store (run one per host)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=14, help="Days ahead to keep, starting today")
+        parser.add_argument('--business', type=int, help="Only refresh this business id")
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Seconds between passes, below SCHEDULE_STORE_MAX_AGE; "
+                                 "0 runs a single pass")
+
+    def handle(self, *args, **options):
+        store = get_schedule_store()
+        if store is None:
+            raise CommandError("SCHEDULE_STORE_PATH is not set")
+
+        while True:
+            started = time.monotonic()
+            stored, skipped = self.refresh(store, options['days'], options['business'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Stored {stored} days ({skipped} skipped) in {time.monotonic() - started:.1f}s"
+            ))
+            if not options['interval']:
+                return
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
+
+    def refresh(self, store, days, business_id=None):
+        today = timezone.now().astimezone(pytz.timezone(settings.SCHEDULER_TIME_ZONE)).date()
+        businesses = Business.objects.all()
+        if business_id:
+            businesses = businesses.filter(pk=business_id)
+
+        stored = skipped = 0
+        for business in businesses.iterator():
+            reset_retry_budget()
+            service = DjangoCalendarService(business, get_schedule_profile(business.id))
+            for offset in range(days):
+                try:
+                    refreshed = service.refresh_stored_day(store, today + timedelta(days=offset))
+                except UpstreamUnavailable as e:
+                    self.stderr.write(f"Skipping {business.name}: {e}")
+                    skipped += days - offset
+                    break
+                if refreshed:
+                    stored += 1
+                else:
+                    skipped += 1
+        return stored, skipped
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from scheduler.reminders import BATCH_SIZE, dispatch_due, get_channel
+
+
+class Command(BaseCommand):
+    help = "Send booking reminders that are due (safe to run on several hosts)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help="Reminders claimed per query")
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Seconds between passes; 0 runs a single pass")
+
+    def handle(self, *args, **options):
+        channel = get_channel()
+        while True:
+            started = time.monotonic()
+            outcomes = dispatch_due(channel=channel, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Sent {outcomes['sent']} reminders via {channel.name} "
+                f"({outcomes['failed']} failed, {outcomes['skipped']} skipped) "
+                f"in {time.monotonic() - started:.1f}s"
+            ))
+            if not options['interval']:
+                return
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
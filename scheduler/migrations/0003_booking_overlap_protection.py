@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:37
+
+from django.db import migrations, models
+
+
+# Postgres only: reject overlapping active bookings for the same business at
+# insert time, so concurrent requests can't both pass Booking.clean().
+EXCLUSION_CONSTRAINT_SQL = """
+    ALTER TABLE scheduler_booking
+    ADD CONSTRAINT scheduler_booking_no_overlap
+    EXCLUDE USING gist (
+        business_id WITH =,
+        tstzrange(start_time, end_time, '[)') WITH &&
+    )
+    WHERE (status IN ('pending', 'confirmed'))
+"""
+
+
+def add_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(EXCLUSION_CONSTRAINT_SQL)
+
+
+def remove_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE scheduler_booking DROP CONSTRAINT IF EXISTS scheduler_booking_no_overlap'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0002_alter_businesshours_end_time_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['business', 'start_time', 'end_time', 'status'], name='booking_overlap_covering_idx'),
+        ),
+        migrations.RunPython(add_exclusion_constraint, remove_exclusion_constraint),
+    ]
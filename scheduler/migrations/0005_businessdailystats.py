@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_business_calendar_id'),
+        ('scheduler', '0004_bookingdaylock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusinessDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bookings', models.IntegerField(default=0, help_text='Non-cancelled bookings')),
+                ('cancellations', models.IntegerField(default=0)),
+                ('booked_minutes', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.business')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='scheduler.service')),
+            ],
+            options={
+                'verbose_name_plural': 'business daily stats',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['business', 'date'], name='scheduler_b_busines_f02cc9_idx')],
+                'unique_together': {('business', 'service', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# Postgres only: overlap protection becomes per resource. Unassigned bookings
+# (businesses without resources) still may not overlap each other.
+RESOURCE_CONSTRAINT_SQL = """
+    ALTER TABLE scheduler_booking
+    ADD CONSTRAINT scheduler_booking_no_overlap
+    EXCLUDE USING gist (
+        business_id WITH =,
+        COALESCE(resource_id, 0) WITH =,
+        tstzrange(start_time, end_time, '[)') WITH &&
+    )
+    WHERE (status IN ('pending', 'confirmed'))
+"""
+
+BUSINESS_CONSTRAINT_SQL = """
+    ALTER TABLE scheduler_booking
+    ADD CONSTRAINT scheduler_booking_no_overlap
+    EXCLUDE USING gist (
+        business_id WITH =,
+        tstzrange(start_time, end_time, '[)') WITH &&
+    )
+    WHERE (status IN ('pending', 'confirmed'))
+"""
+
+DROP_CONSTRAINT_SQL = 'ALTER TABLE scheduler_booking DROP CONSTRAINT IF EXISTS scheduler_booking_no_overlap'
+
+
+def resource_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(DROP_CONSTRAINT_SQL)
+    schema_editor.execute(RESOURCE_CONSTRAINT_SQL)
+
+
+def business_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(DROP_CONSTRAINT_SQL)
+    schema_editor.execute(BUSINESS_CONSTRAINT_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_business_directory_idx'),
+        ('scheduler', '0007_booking_start_time_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Resource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('calendar_id', models.CharField(blank=True, help_text='Google Calendar ID for this resource', max_length=255, null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['name', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResourceHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day_of_week', models.IntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('is_closed', models.BooleanField(default=False)),
+            ],
+            options={
+                'verbose_name_plural': 'resource hours',
+                'ordering': ['day_of_week'],
+            },
+        ),
+        migrations.AddField(
+            model_name='resourcehours',
+            name='resource',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hours', to='scheduler.resource'),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='business',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resources', to='core.business'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='resource',
+            field=models.ForeignKey(blank=True, help_text='Technician/vehicle assigned at creation', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='scheduler.resource'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='resourcehours',
+            unique_together={('resource', 'day_of_week')},
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['business', 'active'], name='scheduler_r_busines_f36296_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_overlap_covering_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['business', 'resource', 'start_time', 'end_time', 'status'], name='booking_overlap_covering_idx'),
+        ),
+        migrations.RunPython(resource_exclusion_constraint, business_exclusion_constraint),
+    ]
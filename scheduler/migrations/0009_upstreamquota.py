@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_business_directory_idx'),
+        ('scheduler', '0008_resources'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UpstreamQuota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upstream', models.CharField(choices=[('google_calendar', 'Google Calendar'), ('google_maps', 'Google Maps')], max_length=20)),
+                ('capacity', models.PositiveIntegerField(help_text='Burst size in tokens')),
+                ('refill_per_minute', models.FloatField(help_text='Sustained tokens per minute')),
+                ('tokens', models.FloatField(help_text='Tokens left as of refilled_at')),
+                ('refilled_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('consumed', models.PositiveBigIntegerField(default=0, help_text='Tokens spent, all time')),
+                ('denied', models.PositiveBigIntegerField(default=0, help_text='Tokens refused, all time')),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upstream_quotas', to='core.business')),
+            ],
+            options={
+                'ordering': ['business', 'upstream'],
+                'unique_together': {('business', 'upstream')},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:17
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def schedule_upcoming_reminders(apps, schema_editor):
+    """Queue reminders for active bookings whose reminder time is still ahead"""
+    Booking = apps.get_model('scheduler', 'Booking')
+    lead = timedelta(hours=settings.REMINDER_LEAD_HOURS)
+    Booking.objects.filter(
+        status__in=['pending', 'confirmed'],
+        start_time__gt=timezone.now() + lead
+    ).update(next_reminder_at=F('start_time') - lead)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0009_upstreamquota'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='next_reminder_at',
+            field=models.DateTimeField(blank=True, help_text='When the day-before reminder is due; cleared once sent', null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('next_reminder_at__isnull', False)), fields=['next_reminder_at'], name='booking_reminder_due_idx'),
+        ),
+        migrations.RunPython(schedule_upcoming_reminders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0010_booking_reminders'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='resource',
+            field=models.ForeignKey(blank=True, help_text='Technician/vehicle assigned at creation', null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='bookings', to='scheduler.resource'),
+        ),
+    ]
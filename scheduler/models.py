@@ -1,9 +1,11 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import User
 from django.utils.text import slugify
 from core.models import Customer, Business
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from datetime import time
 
 class Service(models.Model):
     business = models.ForeignKey(Business, related_name='services', on_delete=models.CASCADE)
@@ -48,6 +50,15 @@ class BusinessHours(models.Model):
         ]
         ordering = ['day_of_week']
 
+    @staticmethod
+    def default_for_day(day_of_week):
+        """Hours assumed for a day the business hasn't configured: 9-5, closed weekends"""
+        return {
+            'start_time': time(9, 0),
+            'end_time': time(17, 0),
+            'is_closed': day_of_week >= 5  # Saturday and Sunday
+        }
+
     def clean(self):
         if not self.is_closed and self.start_time >= self.end_time:
             raise ValidationError("End time must be after start time")
@@ -55,7 +66,83 @@ class BusinessHours(models.Model):
     def __str__(self):
         return f"{self.business.name} - {self.get_day_of_week_display()}"
 
+class Resource(models.Model):
+    """A technician or vehicle that serves one booking at a time
+
+    Businesses without resources are scheduled as a single implicit one
+    (bookings with no resource, the business hours and calendar). Retire a
+    resource with active=False: one with bookings can't be deleted, since
+    turning them into unassigned bookings could break the overlap constraint.
+    """
+    business = models.ForeignKey(Business, related_name='resources', on_delete=models.CASCADE)
+    name = models.CharField(max_length=100)
+    calendar_id = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        help_text="Google Calendar ID for this resource"
+    )
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business', 'active']),
+        ]
+        ordering = ['name', 'id']
+
+    def __str__(self):
+        return f"{self.business.name} - {self.name}"
+
+class ResourceHours(models.Model):
+    """Working hours for a resource; days without a row use the business hours"""
+    resource = models.ForeignKey(Resource, related_name='hours', on_delete=models.CASCADE)
+    day_of_week = models.IntegerField(choices=BusinessHours.DAYS_OF_WEEK)
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+    is_closed = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name_plural = 'resource hours'
+        unique_together = ['resource', 'day_of_week']
+        ordering = ['day_of_week']
+
+    def clean(self):
+        if not self.is_closed and self.start_time >= self.end_time:
+            raise ValidationError("End time must be after start time")
+
+    def __str__(self):
+        return f"{self.resource.name} - {self.get_day_of_week_display()}"
+
+class BookingQuerySet(models.QuerySet):
+    def active(self):
+        """Bookings that still occupy their time slot"""
+        return self.filter(status__in=Booking.ACTIVE_STATUSES)
+
+    def overlapping(self, business, start_time, end_time):
+        """Active bookings for a business that overlap [start_time, end_time)
+
+        Served entirely by booking_overlap_covering_idx, also when narrowed
+        with for_resource().
+        """
+        return self.filter(
+            business=business,
+            start_time__lt=end_time,
+            end_time__gt=start_time,
+            status__in=Booking.ACTIVE_STATUSES
+        )
+
+    def for_resource(self, resource):
+        """Bookings assigned to a resource, or unassigned ones for None"""
+        if resource is None:
+            return self.filter(resource__isnull=True)
+        return self.filter(resource=resource)
+
 class Booking(models.Model):
+    # Statuses that block the slot; mirrored by the overlap index and constraint
+    ACTIVE_STATUSES = ['pending', 'confirmed']
+    OVERLAP_CONSTRAINT = 'scheduler_booking_no_overlap'
+
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('confirmed', 'Confirmed'),
@@ -66,11 +153,27 @@ class Booking(models.Model):
     business = models.ForeignKey(Business, related_name='bookings', on_delete=models.CASCADE)
     service = models.ForeignKey(Service, related_name='bookings', on_delete=models.CASCADE)
     customer = models.ForeignKey(Customer, related_name='bookings', on_delete=models.CASCADE)
+    resource = models.ForeignKey(
+        Resource,
+        related_name='bookings',
+        on_delete=models.RESTRICT,  # Like PROTECT, but deleting the business still cascades
+        null=True,
+        blank=True,
+        help_text="Technician/vehicle assigned at creation"
+    )
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(default=timezone.now)
     notes = models.TextField(blank=True)
+    next_reminder_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the day-before reminder is due; cleared once sent"
+    )
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)
+
+    objects = BookingQuerySet.as_manager()
 
     class Meta:
         ordering = ['-start_time']
@@ -78,30 +181,160 @@ class Booking(models.Model):
             models.Index(fields=['business', 'start_time']),
             models.Index(fields=['status']),
             models.Index(fields=['customer', 'status']),
+            # Covers the (per resource) overlap check so it never touches the
+            # table. Not a partial index: SQLite can't use one when the status
+            # list is a bound parameter, which is how the ORM sends it. On
+            # Postgres the no-overlap exclusion constraint (migrations 0003,
+            # 0008) additionally enforces it at insert time.
+            models.Index(
+                fields=['business', 'resource', 'start_time', 'end_time', 'status'],
+                name='booking_overlap_covering_idx',
+            ),
+            # Admin changelist ordering and date hierarchy
+            models.Index(fields=['start_time'], name='booking_start_time_idx'),
+            # Customer history and per-customer lifetime stats
+            models.Index(
+                fields=['business', 'customer', 'start_time'],
+                name='booking_customer_history_idx',
+            ),
+            # Reminder due queue (scheduler.reminders). Partial, so it only
+            # holds pending reminders and scans stay O(due) however much
+            # booking history piles up.
+            models.Index(
+                fields=['next_reminder_at'],
+                name='booking_reminder_due_idx',
+                condition=models.Q(next_reminder_at__isnull=False),
+            ),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember stored values so daily rollups can apply just the change
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def clean(self):
         if self.start_time >= self.end_time:
             raise ValidationError("End time must be after start time")
         
         # Check for overlapping bookings
-        overlapping = Booking.objects.filter(
-            business=self.business,
-            start_time__lt=self.end_time,
-            end_time__gt=self.start_time,
-            status__in=['pending', 'confirmed']
-        ).exclude(pk=self.pk)
+        overlapping = Booking.objects.overlapping(
+            self.business, self.start_time, self.end_time
+        ).for_resource(self.resource).exclude(pk=self.pk)
         
         if overlapping.exists():
             raise ValidationError("This time slot overlaps with another booking")
 
+    def schedule_reminder(self):
+        """Point next_reminder_at at REMINDER_LEAD_HOURS before the (new) start time
+
+        Only when the booking is new, moved or reactivated; otherwise a
+        pending or already sent reminder is left alone. Inactive bookings and
+        bookings too close to start get none.
+        """
+        stored = getattr(self, '_loaded_values', {})
+        if self.status not in self.ACTIVE_STATUSES or not self.start_time:
+            self.next_reminder_at = None
+            return
+        if self.pk is not None and stored.get('start_time') == self.start_time \
+                and stored.get('status') in self.ACTIVE_STATUSES:
+            return
+        due = self.start_time - timezone.timedelta(hours=settings.REMINDER_LEAD_HOURS)
+        self.next_reminder_at = due if due > timezone.now() else None
+        self.reminder_sent_at = None
+
     def save(self, *args, **kwargs):
         if not self.end_time and self.start_time and self.service:
             # Auto-calculate end time based on service duration
             self.end_time = self.start_time + timezone.timedelta(minutes=self.service.duration)
-        super().save(*args, **kwargs)
+        self.schedule_reminder()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'start_time', 'status'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'next_reminder_at', 'reminder_sent_at'}
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError as e:
+            # Raised by the Postgres exclusion constraint on concurrent double-booking
+            # of the same resource
+            if self.OVERLAP_CONSTRAINT in str(e):
+                raise ValidationError("This time slot overlaps with another booking")
+            raise
 
     def __str__(self):
         return f"{self.business.name} - {self.service.name} - {self.start_time}"
 
+class BusinessDailyStats(models.Model):
+    """Per business, service and local day booking totals for dashboard analytics
+
+    Kept up to date incrementally from Booking saves/deletes (scheduler.rollups);
+    rebuild with `manage.py backfill_daily_stats`.
+    """
+    business = models.ForeignKey(Business, related_name='daily_stats', on_delete=models.CASCADE)
+    service = models.ForeignKey(Service, related_name='daily_stats', on_delete=models.CASCADE)
+    date = models.DateField()
+    bookings = models.IntegerField(default=0, help_text="Non-cancelled bookings")
+    cancellations = models.IntegerField(default=0)
+    booked_minutes = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'business daily stats'
+        unique_together = ['business', 'service', 'date']
+        indexes = [
+            models.Index(fields=['business', 'date']),
+        ]
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.business.name} - {self.service.name} - {self.date}"
+
+class BookingDayLock(models.Model):
+    """Lock row serializing booking creation for one business on one day"""
+    business = models.ForeignKey(Business, related_name='booking_locks', on_delete=models.CASCADE)
+    date = models.DateField()
+    locked_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['business', 'date']
+
+    def __str__(self):
+        return f"{self.business.name} - {self.date}"
+
+class UpstreamQuota(models.Model):
+    """Token bucket limiting one business's use of a Google API
+
+    Holds up to `capacity` tokens and gains `refill_per_minute` of them
+    continuously; each API call spends its cost (requests, or elements for
+    Distance Matrix) and is skipped when the bucket can't cover it. Rows are
+    created on first use with the UPSTREAM_QUOTAS defaults and are the
+    shared state every worker draws on (scheduler.quotas).
+    """
+    UPSTREAM_CHOICES = [
+        ('google_calendar', 'Google Calendar'),
+        ('google_maps', 'Google Maps'),
+    ]
+
+    business = models.ForeignKey(Business, related_name='upstream_quotas', on_delete=models.CASCADE)
+    upstream = models.CharField(max_length=20, choices=UPSTREAM_CHOICES)
+    capacity = models.PositiveIntegerField(help_text="Burst size in tokens")
+    refill_per_minute = models.FloatField(help_text="Sustained tokens per minute")
+    tokens = models.FloatField(help_text="Tokens left as of refilled_at")
+    refilled_at = models.DateTimeField(default=timezone.now)
+    consumed = models.PositiveBigIntegerField(default=0, help_text="Tokens spent, all time")
+    denied = models.PositiveBigIntegerField(default=0, help_text="Tokens refused, all time")
+
+    class Meta:
+        unique_together = ['business', 'upstream']
+        ordering = ['business', 'upstream']
+
+    def available(self, now=None):
+        """Tokens in the bucket at `now` (default: now)"""
+        elapsed = ((now or timezone.now()) - self.refilled_at).total_seconds()
+        return min(self.capacity, self.tokens + max(0, elapsed) * self.refill_per_minute / 60)
+
+    def __str__(self):
+        return f"{self.business.name} - {self.get_upstream_display()}"
+
 # Create your models here.
@@ -0,0 +1,163 @@
+import time
+from collections import defaultdict
+from django.core.cache import cache
+from core.models import Business
+from .models import BusinessHours, Resource, ResourceHours, Service
+
+PROFILE_TIMEOUT = 60 * 60  # Rebuilt at least hourly even without edits
+MAX_LOCAL_PROFILES = 10000
+
+# This process's copies of current profiles, so a hit costs one cache read
+# (the version) instead of unpickling the profile. Filled in the gunicorn
+# master by warmup, so forked workers share them copy-on-write.
+_local_profiles = {}
+
+
+def _version_key(business_id):
+    return f'schedule_profile:version:{business_id}'
+
+
+def _profile_key(business_id, version):
+    return f'schedule_profile:{business_id}:{version}'
+
+
+def _open_hours(hours):
+    if hours.is_closed or not hours.start_time or not hours.end_time:
+        return None
+    return hours
+
+
+class ScheduleProfile:
+    """Compiled schedule settings for one business
+
+    Holds the business row, the weekly hours table (one BusinessHours per day,
+    defaults filled in for days never configured), active services keyed by
+    id and active resources, each with its own weekly hours. Built once per
+    version and shared through the cache, so slot requests don't query
+    Business/Service/BusinessHours/Resource at all on a hit.
+    """
+
+    def __init__(self, business, hours, services, version, resources=()):
+        self.business = business
+        self.hours = hours
+        self.services = services
+        self.version = version
+        self.resources = tuple(resources)
+
+    @property
+    def business_id(self):
+        return self.business.id
+
+    def hours_for(self, date):
+        """Open hours for a date, or None if the business is closed"""
+        return _open_hours(self.hours[date.weekday()])
+
+    def resource_hours_for(self, date):
+        """[(resource, open hours or None)] for a date
+
+        A business without resources is one implicit resource (None) working
+        the business hours.
+        """
+        if not self.resources:
+            return [(None, self.hours_for(date))]
+        return [
+            (resource, _open_hours(resource.weekly_hours[date.weekday()]))
+            for resource in self.resources
+        ]
+
+    def get_service(self, service_id):
+        """Look up an active service, raising Service.DoesNotExist like the ORM"""
+        try:
+            return self.services[int(service_id)]
+        except (KeyError, TypeError, ValueError):
+            raise Service.DoesNotExist(f"No active service {service_id} for {self.business.name}")
+
+
+def get_profile_version(business_id):
+    """Current profile version; a timestamp so an evicted key never reuses an old value"""
+    version = cache.get(_version_key(business_id))
+    if version is None:
+        cache.add(_version_key(business_id), time.time_ns(), None)
+        version = cache.get(_version_key(business_id))
+    return version
+
+
+def invalidate_schedule_profile(business_id):
+    """Bump the version so every worker rebuilds the profile on next use"""
+    cache.set(_version_key(business_id), time.time_ns(), None)
+
+
+def build_schedule_profile(business_id, version=None):
+    """Build a profile from the database (one query each for business, hours, services, resources)"""
+    business = Business.objects.get(pk=business_id)
+
+    configured = {
+        hours.day_of_week: hours
+        for hours in BusinessHours.objects.filter(business_id=business_id)
+    }
+    hours = tuple(
+        configured.get(day) or BusinessHours(business=business, day_of_week=day, **BusinessHours.default_for_day(day))
+        for day in range(7)
+    )
+
+    services = {}
+    for service in Service.objects.filter(business_id=business_id, active=True):
+        service.business = business  # Avoid a lazy lookup from __str__
+        services[service.id] = service
+
+    resource_hours = defaultdict(dict)
+    for row in ResourceHours.objects.filter(resource__business_id=business_id, resource__active=True):
+        resource_hours[row.resource_id][row.day_of_week] = row
+
+    resources = []
+    for resource in Resource.objects.filter(business_id=business_id, active=True):
+        resource.business = business
+        # Days the resource has no hours of its own follow the business
+        resource.weekly_hours = tuple(
+            resource_hours[resource.id].get(day) or hours[day] for day in range(7)
+        )
+        resources.append(resource)
+
+    return ScheduleProfile(business, hours, services, version, resources)
+
+
+def get_schedule_profile(business_id):
+    """Return the cached profile for a business, or None if it doesn't exist"""
+    version = get_profile_version(business_id)
+    profile, expires = _local_profiles.get(business_id, (None, 0))
+    if profile is not None and profile.version == version and time.monotonic() < expires:
+        return profile
+
+    key = _profile_key(business_id, version)
+    profile = cache.get(key)
+    if profile is None:
+        try:
+            profile = build_schedule_profile(business_id, version)
+        except Business.DoesNotExist:
+            _local_profiles.pop(business_id, None)
+            return None
+        cache.set(key, profile, PROFILE_TIMEOUT)
+
+    _local_profiles.pop(business_id, None)
+    if len(_local_profiles) >= MAX_LOCAL_PROFILES:
+        _local_profiles.pop(next(iter(_local_profiles), None), None)  # Least recently refreshed
+    _local_profiles[business_id] = (profile, time.monotonic() + PROFILE_TIMEOUT)
+    return profile
+
+
+def get_profile_for_booking_url(booking_url):
+    """Resolve a public booking URL slug to a profile, or None"""
+    key = f'schedule_profile:slug:{booking_url}'
+    business_id = cache.get(key)
+    if business_id is not None:
+        profile = get_schedule_profile(business_id)
+        # The slug may have been changed or the business deleted since
+        if profile is not None and profile.business.booking_url == booking_url:
+            return profile
+
+    business_id = Business.objects.filter(booking_url=booking_url).values_list('id', flat=True).first()
+    if business_id is None:
+        cache.delete(key)
+        return None
+    cache.set(key, business_id, PROFILE_TIMEOUT)
+    return get_schedule_profile(business_id)
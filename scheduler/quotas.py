@@ -0,0 +1,57 @@
+"""
+Per-business quotas for Google API calls.
+
+The Distance Matrix and Calendar quotas belong to the whole project, so one
+busy business (or a client scraping the slot endpoints with many addresses)
+could use them up for every tenant. Slot requests therefore charge their
+upstream calls to the business's token bucket (UpstreamQuota rows, shared
+by all workers through the database); a call the bucket can't cover fails
+with resilience.QuotaExceeded before it is sent, and callers degrade the
+same way they do when Google is down: calendars fall back to their last
+snapshot, travel times to cached or estimated ones.
+"""
+
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+import resilience
+from .models import UpstreamQuota
+
+
+def take(business_id, upstream, cost=1):
+    """Spend cost tokens from a business's bucket for upstream; False if it can't cover them
+
+    Call it outside other transactions: inside one, the row lock is held
+    until the outer transaction commits, and every call for the business
+    waits on it.
+    """
+    defaults = settings.UPSTREAM_QUOTAS.get(upstream)
+    if defaults is None:
+        return True  # Not metered per business
+    now = timezone.now()
+    with transaction.atomic():
+        quota, _ = UpstreamQuota.objects.select_for_update().get_or_create(
+            business_id=business_id,
+            upstream=upstream,
+            defaults={**defaults, 'tokens': defaults['capacity'], 'refilled_at': now}
+        )
+        tokens = quota.available(now)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+            quota.consumed += cost
+        else:
+            quota.denied += cost
+        quota.tokens, quota.refilled_at = tokens, now
+        quota.save(update_fields=['tokens', 'refilled_at', 'consumed', 'denied'])
+    if not allowed:
+        print(f"⚠ Business {business_id} is out of {upstream} quota ({tokens:.0f} < {cost})")
+    return allowed
+
+
+def charged_to(business_id):
+    """Context manager charging the upstream calls made inside it to a business"""
+    return resilience.charge_quota(partial(take, business_id))
@@ -0,0 +1,167 @@
+"""
+Booking reminders: the due queue and the channels that deliver them.
+
+Bookings carry next_reminder_at (kept by Booking.schedule_reminder()), under
+a partial index holding only pending reminders, so every query here walks
+just the due part of the queue however much booking history accumulates.
+
+dispatch_due() claims due bookings in batches by pushing next_reminder_at
+out by CLAIM_SECONDS, a lease: if the worker dies mid-batch, its reminders
+come due again. Concurrent workers skip each other's rows, with SELECT ...
+FOR UPDATE SKIP LOCKED where the database supports it and a per-row
+compare-and-set on SQLite. Each claimed booking is sent through the
+configured channel (REMINDER_CHANNEL) in one send_batch() call, so email
+reminders share one SMTP connection, and then cleared, or pushed back by
+RETRY_SECONDS if the channel failed.
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+import pytz
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import connections, router, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.mail import send_mail_batch
+
+from .models import Booking
+
+BATCH_SIZE = 100
+CLAIM_SECONDS = 5 * 60
+RETRY_SECONDS = 15 * 60
+
+
+class Channel:
+    """Delivers reminders; send() raises to have the reminder retried"""
+
+    name = None
+
+    def send(self, booking):
+        raise NotImplementedError
+
+    def send_batch(self, bookings):
+        """Send reminders for bookings; {booking pk: error} for the ones that failed"""
+        failed = {}
+        for booking in bookings:
+            try:
+                self.send(booking)
+            except Exception as e:
+                failed[booking.pk] = e
+        return failed
+
+
+class ConsoleChannel(Channel):
+    """Local stand-in that logs reminders instead of sending them"""
+
+    name = 'console'
+
+    def send(self, booking):
+        print(f"🔔 Reminder to {booking.customer.email}: {reminder_text(booking)}")
+
+
+class EmailChannel(Channel):
+    """Emails the customer through Django's email backend"""
+
+    name = 'email'
+
+    def message(self, booking):
+        return EmailMessage(
+            f"Reminder: your {booking.service.name} appointment",
+            reminder_text(booking),
+            None,  # DEFAULT_FROM_EMAIL
+            [booking.customer.email]
+        )
+
+    def send(self, booking):
+        self.message(booking).send()
+
+    def send_batch(self, bookings):
+        failed = send_mail_batch([self.message(booking) for booking in bookings])
+        return {bookings[i].pk: error for i, error in failed.items()}
+
+
+def get_channel():
+    """The channel selected by REMINDER_CHANNEL"""
+    return import_string(settings.REMINDER_CHANNEL)()
+
+
+def reminder_text(booking):
+    start = booking.start_time.astimezone(pytz.timezone(settings.SCHEDULER_TIME_ZONE))
+    return (
+        f"Hi {booking.customer.name}, this is a reminder of your {booking.service.name} "
+        f"appointment with {booking.business.name} on {start.strftime('%A, %B %d')} "
+        f"at {start.strftime('%I:%M %p').lstrip('0')}."
+    )
+
+
+def claim_due(now=None, limit=BATCH_SIZE):
+    """Claim up to limit reminders due by now; (booking ids, lease they were claimed with)"""
+    now = now or timezone.now()
+    lease = now + timedelta(seconds=CLAIM_SECONDS)
+    due = Booking.objects.filter(next_reminder_at__lte=now).order_by('next_reminder_at')
+    connection = connections[router.db_for_write(Booking)]
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=connection.alias):
+            ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Booking.objects.filter(pk__in=ids).update(next_reminder_at=lease)
+        return ids, lease
+
+    # SQLite has no row locks: take each row only if nobody claimed it since we read it
+    ids = []
+    for pk, due_at in due.values_list('pk', 'next_reminder_at')[:limit]:
+        if Booking.objects.filter(pk=pk, next_reminder_at=due_at).update(next_reminder_at=lease):
+            ids.append(pk)
+    return ids, lease
+
+
+def deliver(bookings, channel, lease):
+    """Send claimed reminders as one batch and settle each claim; Counter of 'sent', 'failed', 'skipped'"""
+    outcomes = Counter()
+    # Matches nothing if the booking was moved (and its reminder rescheduled) meanwhile
+    claimed = Booking.objects.filter(next_reminder_at=lease)
+    due = []
+    for booking in bookings:
+        if booking.status not in Booking.ACTIVE_STATUSES or booking.start_time <= timezone.now():
+            claimed.filter(pk=booking.pk).update(next_reminder_at=None)
+            outcomes['skipped'] += 1
+        else:
+            due.append(booking)
+    if not due:
+        return outcomes
+
+    try:
+        failed = channel.send_batch(due)
+    except Exception as e:
+        failed = {booking.pk: e for booking in due}
+    for pk, error in failed.items():
+        print(f"✗ Reminder for booking {pk} via {channel.name} failed: {str(error)}")
+    claimed.filter(pk__in=list(failed)).update(next_reminder_at=timezone.now() + timedelta(seconds=RETRY_SECONDS))
+    sent = [booking.pk for booking in due if booking.pk not in failed]
+    claimed.filter(pk__in=sent).update(next_reminder_at=None, reminder_sent_at=timezone.now())
+    outcomes.update(sent=len(sent), failed=len(failed))
+    return outcomes
+
+
+def dispatch_due(now=None, channel=None, batch_size=BATCH_SIZE):
+    """Send every reminder due by now, a batch at a time; Counter of outcomes"""
+    channel = channel or get_channel()
+    outcomes = Counter()
+    while True:
+        ids, lease = claim_due(now, batch_size)
+        bookings = Booking.objects.filter(pk__in=ids).select_related('business', 'service', 'customer')
+        outcomes.update(deliver(list(bookings), channel, lease))
+        if len(ids) < batch_size:
+            return outcomes
+
+
+def send_reminder_now(booking, channel=None):
+    """Send a reminder for a booking right away (its scheduled one still goes out)"""
+    channel = channel or get_channel()
+    channel.send(booking)
+    sent_at = timezone.now()
+    Booking.objects.filter(pk=booking.pk).update(reminder_sent_at=sent_at)
+    return sent_at
@@ -0,0 +1,117 @@
+from collections import defaultdict
+from decimal import Decimal
+import pytz
+from django.conf import settings
+from django.db.models import F
+from .models import Booking, BusinessDailyStats, Service
+
+# Booking fields a rollup contribution depends on
+ROLLUP_FIELDS = ('business_id', 'service_id', 'start_time', 'end_time', 'status')
+
+
+def rollup_state(business_id, service_id, start_time, end_time, status):
+    """Reduce a booking to the (business, service, day, status, minutes) it counts towards"""
+    local_date = start_time.astimezone(pytz.timezone(settings.SCHEDULER_TIME_ZONE)).date()
+    minutes = int((end_time - start_time).total_seconds() // 60)
+    return (business_id, service_id, local_date, status, minutes)
+
+
+def contribution(state, price):
+    """Counter values one booking in `state` adds to its daily stats row"""
+    status, minutes = state[3], state[4]
+    if status == 'cancelled':
+        return {'bookings': 0, 'cancellations': 1, 'booked_minutes': 0, 'revenue': Decimal(0)}
+    return {'bookings': 1, 'cancellations': 0, 'booked_minutes': minutes, 'revenue': Decimal(price)}
+
+
+def apply_contribution(state, price, sign):
+    """Add (sign=1) or remove (sign=-1) one booking's contribution"""
+    business_id, service_id, date = state[:3]
+    if sign > 0:
+        BusinessDailyStats.objects.get_or_create(
+            business_id=business_id,
+            service_id=service_id,
+            date=date
+        )
+    # Removals never create rows (the row may be going away in a cascade delete)
+    BusinessDailyStats.objects.filter(
+        business_id=business_id,
+        service_id=service_id,
+        date=date
+    ).update(**{
+        field: F(field) + sign * value
+        for field, value in contribution(state, price).items()
+    })
+
+
+def _current_state(booking):
+    return rollup_state(*(getattr(booking, field) for field in ROLLUP_FIELDS))
+
+
+def _stored_state(booking):
+    """State as last read from / written to the database, or None for new bookings"""
+    if booking._state.adding:
+        return None
+    loaded = getattr(booking, '_loaded_values', {})
+    if all(field in loaded for field in ROLLUP_FIELDS):
+        return rollup_state(*(loaded[field] for field in ROLLUP_FIELDS))
+    # Deferred fields or a hand-built instance: read what's stored
+    row = Booking.objects.filter(pk=booking.pk).values_list(*ROLLUP_FIELDS).first()
+    return rollup_state(*row) if row else None
+
+
+def _price(booking, service_id):
+    if service_id == booking.service_id and Booking.service.is_cached(booking):
+        return booking.service.price
+    return Service.objects.filter(pk=service_id).values_list('price', flat=True).first() or 0
+
+
+def booking_pre_save(booking):
+    booking._rollup_old_state = _stored_state(booking)
+
+
+def booking_post_save(booking):
+    """Move a booking's contribution from its previous state to its current one"""
+    old_state = booking.__dict__.pop('_rollup_old_state', None)
+    new_state = _current_state(booking)
+    booking._loaded_values = {field: getattr(booking, field) for field in ROLLUP_FIELDS}
+
+    if old_state == new_state:
+        return
+    if old_state is not None:
+        apply_contribution(old_state, _price(booking, old_state[1]), -1)
+    apply_contribution(new_state, _price(booking, new_state[1]), 1)
+
+
+def booking_post_delete(booking):
+    state = _stored_state(booking) or _current_state(booking)
+    apply_contribution(state, _price(booking, state[1]), -1)
+
+
+def backfill_daily_stats(business_id=None):
+    """Recompute BusinessDailyStats from all bookings; returns the number of rows written"""
+    bookings = Booking.objects.order_by()
+    stats = BusinessDailyStats.objects.all()
+    if business_id is not None:
+        bookings = bookings.filter(business_id=business_id)
+        stats = stats.filter(business_id=business_id)
+
+    totals = defaultdict(lambda: {
+        'bookings': 0, 'cancellations': 0, 'booked_minutes': 0, 'revenue': Decimal(0)
+    })
+    rows = bookings.values_list(*ROLLUP_FIELDS, 'service__price')
+    for *fields, price in rows.iterator(chunk_size=2000):
+        state = rollup_state(*fields)
+        counters = totals[state[:3]]
+        for field, value in contribution(state, price).items():
+            counters[field] += value
+
+    stats.delete()
+    BusinessDailyStats.objects.bulk_create(
+        [
+            BusinessDailyStats(business_id=row_business, service_id=row_service, date=date, **counters)
+            for (row_business, row_service, date), counters in totals.items()
+        ],
+        batch_size=1000
+    )
+    return len(totals)
@@ -0,0 +1,217 @@
+"""
+Shared-memory store of per-business, per-day busy bitsets.
+
+Every worker on a host maps the same file (SCHEDULE_STORE_PATH), so a day
+computed once is visible to all of them without each keeping, or cold
+workers recomputing, its own copy. The refresh_schedule_store command is
+the one process that computes and writes days; workers only read, and
+mark a day stale when they commit a booking change to it. Days the refresher
+hasn't rewritten within SCHEDULE_STORE_MAX_AGE are ignored, so if it stops
+running workers go back to computing days (and seeing new calendar events).
+
+Layout: a small header, then CAPACITY fixed-size records in an open
+addressed table keyed by (business id, date). A record holds each
+resource's busy mask (bookings and calendar events; holds are per worker
+and applied on read) and a fingerprint of the settings it was computed
+under (resources, their hours and calendars), which readers compare with
+their own so a settings change never serves masks for the old setup.
+
+Each record starts with a generation counter used as a seqlock: a writer
+makes it odd, writes, then makes it even again, so readers never lock and
+simply retry if the counter moved under them. Writers serialize on an
+flock of the file. The counter also lets the refresher detect that a day
+was invalidated while it was computing, and drop its now-stale result.
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+from datetime import date as date_type
+
+from django.conf import settings
+
+from .availability import DAY_UNITS
+
+MAGIC = b'SLOTDAY1'
+CAPACITY = 4096
+MAX_LANES = 16
+PROBE_LIMIT = 8
+READ_RETRIES = 20
+
+FILE_HEADER = struct.Struct('<8sII')  # magic, capacity, record size
+# generation, business id, date ordinal, flags, lane count, settings fingerprint, refreshed at
+RECORD_HEADER = struct.Struct('<IIIHHqI4x')
+MASK_BYTES = (DAY_UNITS + 7) // 8
+LANE = struct.Struct(f'<I{MASK_BYTES}s')  # resource id (0 = implicit resource), busy mask
+RECORD_SIZE = RECORD_HEADER.size + MAX_LANES * LANE.size
+
+VALID = 1
+_UNCHECKED = object()
+
+
+class DayScheduleStore:
+    """Fixed-size table of day busy masks in a memory-mapped file"""
+
+    def __init__(self, path, capacity=CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = FILE_HEADER.size + capacity * RECORD_SIZE
+        with self._write_lock():
+            header = os.pread(self._fd, FILE_HEADER.size, 0)
+            if len(header) < FILE_HEADER.size or FILE_HEADER.unpack(header) != (MAGIC, capacity, RECORD_SIZE):
+                # New file or another layout: start empty
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, FILE_HEADER.pack(MAGIC, capacity, RECORD_SIZE), 0)
+        self._map = mmap.mmap(self._fd, size)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    @contextmanager
+    def _write_lock(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _offsets(self, business_id, ordinal):
+        home = (business_id * 1000003 ^ ordinal) % self.capacity
+        for probe in range(min(PROBE_LIMIT, self.capacity)):
+            yield FILE_HEADER.size + ((home + probe) % self.capacity) * RECORD_SIZE
+
+    def _find(self, business_id, ordinal):
+        for offset in self._offsets(business_id, ordinal):
+            _, stored_business, stored_ordinal, *_ = RECORD_HEADER.unpack_from(self._map, offset)
+            if (stored_business, stored_ordinal) == (business_id, ordinal):
+                return offset
+        return None
+
+    def _claim(self, business_id, ordinal):
+        """Offset for a key: its record, else an empty or past-day slot, else evict the home slot"""
+        today = date_type.today().toordinal()
+        offsets = list(self._offsets(business_id, ordinal))
+        fallback = None
+        for offset in offsets:
+            _, stored_business, stored_ordinal, *_ = RECORD_HEADER.unpack_from(self._map, offset)
+            if (stored_business, stored_ordinal) == (business_id, ordinal):
+                return offset
+            if fallback is None and (stored_business == 0 or stored_ordinal < today - 1):
+                fallback = offset
+        return fallback if fallback is not None else offsets[0]
+
+    def _read(self, offset):
+        """Consistent (header, record bytes) snapshot of a record, or None if it kept changing"""
+        for _ in range(READ_RETRIES):
+            generation = RECORD_HEADER.unpack_from(self._map, offset)[0]
+            if generation & 1:
+                continue  # Mid-write
+            record = self._map[offset:offset + RECORD_SIZE]
+            if RECORD_HEADER.unpack_from(self._map, offset)[0] == generation:
+                return RECORD_HEADER.unpack_from(record), record
+        return None
+
+    def _write(self, offset, business_id, ordinal, flags, fingerprint, lanes):
+        generation = RECORD_HEADER.unpack_from(self._map, offset)[0]
+        writing, done = (generation + 1) & 0xFFFFFFFF, (generation + 2) & 0xFFFFFFFF
+        struct.pack_into('<I', self._map, offset, writing)
+        body = b''.join(
+            LANE.pack(resource_id or 0, busy.to_bytes(MASK_BYTES, 'little'))
+            for resource_id, busy in lanes
+        )
+        self._map[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + len(body)] = body
+        RECORD_HEADER.pack_into(
+            self._map, offset, writing, business_id, ordinal, flags,
+            len(lanes), fingerprint, int(time.time())
+        )
+        struct.pack_into('<I', self._map, offset, done)
+
+    def get(self, business_id, date, fingerprint, max_age=None):
+        """{resource id or None: busy mask} stored for a day, or None if missing/stale
+
+        With max_age, records refreshed more than that many seconds ago count
+        as stale too: calendar events change without us hearing about it.
+        """
+        offset = self._find(business_id, date.toordinal())
+        snapshot = offset is not None and self._read(offset)
+        if not snapshot:
+            return None
+        (_, stored_business, stored_ordinal, flags, lane_count, stored_fingerprint, refreshed_at), record = snapshot
+        if (stored_business, stored_ordinal) != (business_id, date.toordinal()):
+            return None  # Evicted between lookup and read
+        if not flags & VALID or stored_fingerprint != fingerprint:
+            return None
+        if max_age is not None and time.time() - refreshed_at > max_age:
+            return None
+        busy = {}
+        for i in range(lane_count):
+            resource_id, mask = LANE.unpack_from(record, RECORD_HEADER.size + i * LANE.size)
+            busy[resource_id or None] = int.from_bytes(mask, 'little')
+        return busy
+
+    def generation(self, business_id, date):
+        """Token for put(): changes whenever the day is written or invalidated"""
+        offset = self._find(business_id, date.toordinal())
+        if offset is None:
+            return None
+        return offset, RECORD_HEADER.unpack_from(self._map, offset)[0]
+
+    def put(self, business_id, date, fingerprint, busy, token=_UNCHECKED):
+        """Store {resource id or None: busy mask} for a day
+
+        With a token from generation(), taken before computing, nothing is
+        written if the day changed since. Returns whether it was stored.
+        """
+        if len(busy) > MAX_LANES:
+            return False
+        ordinal = date.toordinal()
+        with self._write_lock():
+            if token is not _UNCHECKED and self.generation(business_id, date) != token:
+                return False
+            offset = self._claim(business_id, ordinal)
+            self._write(offset, business_id, ordinal, VALID, fingerprint, list(busy.items()))
+        return True
+
+    def invalidate(self, business_id, date):
+        """Mark a day stale (recording it if absent, so an in-flight put() is dropped)"""
+        ordinal = date.toordinal()
+        with self._write_lock():
+            offset = self._claim(business_id, ordinal)
+            self._write(offset, business_id, ordinal, 0, 0, [])
+
+
+_stores = {}
+
+
+def _forget_inherited_stores():
+    # A forked child shares the parent's open file, and with it the flock
+    # writers serialize on; each process opens its own instead
+    for store in _stores.values():
+        store.close()
+    _stores.clear()
+
+
+os.register_at_fork(after_in_child=_forget_inherited_stores)
+
+
+def get_schedule_store():
+    """This process's mapping of SCHEDULE_STORE_PATH, or None when the store is disabled"""
+    path = getattr(settings, 'SCHEDULE_STORE_PATH', None)
+    if not path:
+        return None
+    if path not in _stores:
+        _stores[path] = DayScheduleStore(path)
+    return _stores[path]
+
+
+def invalidate_stored_day(business_id, date):
+    """Mark a business-day stale in the shared store, if there is one"""
+    store = get_schedule_store()
+    if store:
+        store.invalidate(business_id, date)
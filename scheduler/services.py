@@ -1,158 +1,241 @@
-from datetime import datetime, timedelta
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from google.auth.transport.requests import AuthorizedSession
+from datetime import datetime, time, timedelta
+from functools import cached_property, reduce
+from operator import or_
+import hashlib
 import pytz
-import os
-from .models import BusinessHours, Service, Booking
+import resilience
+from calendar_events import STALE_BUFFER_MINUTES, normalize_events, widen
+from google_clients import build_calendar_client, load_credentials
+from .availability import GRAIN_MINUTES, Lane, can_start, free_intervals, interval_mask, place, union_starts
+from .models import Service, Booking
+from .profiles import get_schedule_profile
+from .schedule_store import get_schedule_store
+from .singleflight import SingleFlight
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
+from config.routers import read_from_replica
+
+CALENDAR_SNAPSHOT_TIMEOUT = 24 * 60 * 60  # How stale a calendar we'll still serve
+
+# Concurrent requests for the same business day share one _booked_lanes()
+day_flights = SingleFlight('booked_lanes')
 
 class DjangoCalendarService:
-    def __init__(self, business):
+    def __init__(self, business, profile=None):
         self.business = business
-        self.timezone = pytz.timezone('America/New_York')  # Consider making this dynamic based on business timezone
-        
-        # Google Calendar setup
-        SCOPES = [
-            'https://www.googleapis.com/auth/calendar.readonly',
-            'https://www.googleapis.com/auth/calendar.events'
-        ]
+        self.profile = profile or get_schedule_profile(business.id)
+        self.timezone = pytz.timezone(settings.SCHEDULER_TIME_ZONE)  # Consider making this dynamic based on business timezone
         
+        # Google Calendar client is built on first use (see service)
+        self.calendar_id = business.calendar_id
+        if not self.calendar_id:
+            print("Notice: No calendar ID set for business. Google Calendar integration disabled.")
+
+        # Dictionary to track pending bookings
+        self.pending_bookings = {}
+
+        # Set when calendar data came from a stale snapshot
+        self.degraded = False
+
+    @cached_property
+    def service(self):
+        """Calendar API client"""
         try:
-            # Load Google credentials
-            if 'GOOGLE_CREDENTIALS' in os.environ:
-                temp_creds_path = '/tmp/google-credentials.json'
-                with open(temp_creds_path, 'w') as f:
-                    f.write(os.environ['GOOGLE_CREDENTIALS'])
-                
-                credentials = service_account.Credentials.from_service_account_file(
-                    temp_creds_path, scopes=SCOPES)
-                os.remove(temp_creds_path)
-            else:
-                credentials = service_account.Credentials.from_service_account_file(
-                    'silentwash-4b7a2b2c111e.json', scopes=SCOPES)
-            
-            # Create an authorized session
-            self.session = AuthorizedSession(credentials)
-            
-            # Build the service with custom session
-            self.service = build(
-                'calendar', 
-                'v3', 
-                credentials=credentials,
-                cache_discovery=False  # Disable file cache
-            )
-            
-            # Get calendar ID from business model
-            self.calendar_id = business.calendar_id
-            if not self.calendar_id:
-                print("Notice: No calendar ID set for business. Google Calendar integration disabled.")
-            
+            return build_calendar_client(load_credentials())
         except Exception as e:
             print(f"Error initializing calendar service: {str(e)}")
             raise
 
-        # Dictionary to track pending bookings
-        self.pending_bookings = {}
-
     def get_business_hours(self, date):
         """Get business hours for a specific date"""
-        day_of_week = date.weekday()
-        try:
-            return BusinessHours.objects.get(
-                business=self.business,
-                day_of_week=day_of_week,
-                is_closed=False
-            )
-        except BusinessHours.DoesNotExist:
-            return None
+        return self.profile.hours_for(date)
 
     def get_available_slots(self, date_str, service_id, destination_address=None):
         """Get available time slots for a given date and service"""
+        with read_from_replica():
+            return self._get_available_slots(date_str, service_id, destination_address)
+
+    def _get_available_slots(self, date_str, service_id, destination_address=None):
         try:
             # Parse date and get service
             date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            service = Service.objects.get(id=service_id, business=self.business)
+            service = self.profile.get_service(service_id)
             
-            # Get business hours for the day
-            hours = self.get_business_hours(date)
-            if not hours:
+            # Availability of every resource for the day as bitsets
+            lanes = self._day_lanes(date)
+            starts = union_starts(lanes, service.duration)
+            open_any = reduce(or_, (lane.open_mask for lane in lanes), 0)
+            if not starts or not open_any:
                 return []
-            
-            # Generate time slots
-            slots = []
-            current_time = timezone.make_aware(
-                datetime.combine(date, hours.start_time),
-                timezone=self.timezone
-            )
-            end_time = timezone.make_aware(
-                datetime.combine(date, hours.end_time),
-                timezone=self.timezone
-            )
-            
-            # If it's today, start from current time
+
+            # Slots every 30 minutes from the earliest opening
+            first_minute = ((open_any & -open_any).bit_length() - 1) * GRAIN_MINUTES
+            earliest = None
             now = timezone.now().astimezone(self.timezone)
             if date == now.date():
-                rounded_now = self._round_up_to_next_slot(now)
-                current_time = max(current_time, rounded_now)
-                print(f"Today's date - adjusted start time to: {current_time}")
-                
-                # If we're past business hours, return empty list
-                if current_time >= end_time:
-                    print("Current time is past business hours")
-                    return []
-
-            while current_time + timedelta(minutes=service.duration) <= end_time:
-                slot_end = current_time + timedelta(minutes=service.duration)
-                
-                # Debug print
-                print(f"Checking slot: {current_time.strftime('%I:%M %p')} - {slot_end.strftime('%I:%M %p')}")
-                
-                if self._is_slot_available(current_time, service.duration):
-                    slots.append(current_time.strftime('%I:%M %p').lstrip('0'))
-                current_time += timedelta(minutes=30)  # 30-minute intervals
+                # If it's today, start from current time
+                earliest = self._round_up_to_next_slot(now)
+                print(f"Today's date - adjusted start time to: {earliest}")
+
+            slots = []
+            for minute in range(first_minute, 24 * 60, 30):
+                if not can_start(starts, minute):
+                    continue
+                slot_time = timezone.make_aware(
+                    datetime.combine(date, time(minute // 60, minute % 60)),
+                    timezone=self.timezone
+                )
+                if earliest and slot_time < earliest:
+                    continue
+                slots.append(slot_time.strftime('%I:%M %p').lstrip('0'))
 
+            print(f"✓ {len(slots)} slots across {len(lanes)} resource(s) on {date}")
             return slots
 
         except Exception as e:
             print(f"Error getting available slots: {str(e)}")
             raise
 
-    def _is_slot_available(self, start_time, duration):
-        """Check if a time slot is available"""
-        end_time = start_time + timedelta(minutes=duration)
-        
-        # Debug print
-        print(f"\nChecking availability for: {start_time.strftime('%I:%M %p')} - {end_time.strftime('%I:%M %p')}")
-        
-        # Check for overlapping bookings
-        overlapping_bookings = Booking.objects.filter(
-            business=self.business,
-            start_time__lt=end_time,
-            end_time__gt=start_time,
-            status__in=['pending', 'confirmed']
-        ).exists()
-        
-        if overlapping_bookings:
-            print("❌ Found overlapping booking in database")
-            return False
-        
-        # Check for overlapping Google Calendar events
-        calendar_events = self._get_calendar_events(start_time, end_time)
-        if calendar_events:
-            print(f"❌ Found {len(calendar_events)} overlapping calendar events")
-            return False
-        
-        # Check pending bookings
-        slot_key = start_time.strftime('%Y-%m-%d %H:%M')
-        is_pending = slot_key in self.pending_bookings
-        if is_pending:
-            print("❌ Slot is currently held")
-            return False
-        
-        print("✓ Slot is available")
-        return True
+    def get_free_intervals(self, date_str, min_duration=0):
+        """Free [start, end] minute offsets (from local midnight) of at least min_duration
+
+        O(busy intervals) to compute and to send, where get_available_slots()
+        enumerates every candidate start; clients expand gaps themselves.
+        """
+        with read_from_replica():
+            date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            not_before = 0
+            now = timezone.now().astimezone(self.timezone)
+            if date < now.date():
+                return []
+            if date == now.date():
+                next_slot = self._round_up_to_next_slot(now)
+                not_before = next_slot.hour * 60 + next_slot.minute if next_slot.date() == date else 24 * 60
+            return free_intervals(self._day_lanes(date), min_duration, not_before)
+
+    def _day_lanes(self, date):
+        """Open hours and busy time of each resource on a date, as bitset Lanes"""
+        lanes = self._stored_lanes(date) or self._coalesced_lanes(date)
+
+        # Held slots need a resource too
+        self._clean_expired_holds()
+        for slot_key, hold in self.pending_bookings.items():
+            held = self.timezone.localize(datetime.strptime(slot_key, '%Y-%m-%d %H:%M'))
+            if held.date() == date:
+                place(lanes, interval_mask(
+                    self._minute_of(held, date), self._minute_of(held + hold['duration'], date)))
+        return lanes
+
+    def _minute_of(self, dt, date):
+        """Minute of date's day for dt, clamped to the day"""
+        local = dt.astimezone(self.timezone)
+        if local.date() < date:
+            return 0
+        if local.date() > date:
+            return 24 * 60
+        return local.hour * 60 + local.minute + local.second / 60
+
+    def _open_lanes(self, date):
+        """A Lane per resource with its open hours on date and nothing busy yet"""
+        lanes = []
+        for resource, hours in self.profile.resource_hours_for(date):
+            open_mask = 0
+            if hours:
+                open_mask = interval_mask(
+                    hours.start_time.hour * 60 + hours.start_time.minute,
+                    hours.end_time.hour * 60 + hours.end_time.minute
+                )
+            lanes.append(Lane(resource, open_mask))
+        return lanes
+
+    def _stored_lanes(self, date):
+        """Lanes from the shared schedule store, or None if it has no current copy"""
+        store = get_schedule_store()
+        if store is None:
+            return None
+        lanes = self._open_lanes(date)
+        busy = store.get(self.business.id, date, self._lanes_fingerprint(lanes), settings.SCHEDULE_STORE_MAX_AGE)
+        if busy is None or {lane.resource.id if lane.resource else None for lane in lanes} != set(busy):
+            return None
+        for lane in lanes:
+            lane.busy = busy[lane.resource.id if lane.resource else None]
+        return lanes
+
+    def _coalesced_lanes(self, date):
+        """_booked_lanes(), computed once for every concurrent request for the day"""
+        lanes = self._open_lanes(date)
+        key = f'{self.business.id}:{date.isoformat()}:{self._lanes_fingerprint(lanes)}'
+
+        def compute():
+            computed = self._booked_lanes(date)
+            return {lane.resource.id if lane.resource else None: lane.busy for lane in computed}, self.degraded
+
+        busy, degraded = day_flights.do(key, compute)
+        self.degraded = self.degraded or degraded
+        for lane in lanes:
+            lane.busy = busy[lane.resource.id if lane.resource else None]
+        return lanes
+
+    def _booked_lanes(self, date):
+        """Lanes busy with calendar events and bookings (not holds), computed from the sources"""
+        day_start = timezone.make_aware(datetime.combine(date, time.min), timezone=self.timezone)
+        day_end = timezone.make_aware(datetime.combine(date + timedelta(days=1), time.min), timezone=self.timezone)
+
+        def minute_of(dt):
+            return self._minute_of(dt, date)
+
+        lanes = self._open_lanes(date)
+        by_resource = {lane.resource.id if lane.resource else None: lane for lane in lanes}
+
+        # Business calendar events block every resource
+        business_busy = 0
+        for event in self._get_calendar_events(day_start, day_end):
+            business_busy |= interval_mask(*self._event_minutes(event, minute_of))
+        for lane in lanes:
+            lane.busy |= business_busy
+            if lane.resource and lane.resource.calendar_id:
+                for event in self._get_calendar_events(day_start, day_end, lane.resource.calendar_id):
+                    lane.busy |= interval_mask(*self._event_minutes(event, minute_of))
+
+        # Bookings in one query; unassigned ones take whichever resource is free
+        unassigned = []
+        bookings = Booking.objects.overlapping(self.business, day_start, day_end)
+        for resource_id, start, end in bookings.values_list('resource_id', 'start_time', 'end_time'):
+            mask = interval_mask(minute_of(start), minute_of(end))
+            lane = by_resource.get(resource_id)
+            if lane:
+                lane.busy |= mask
+            else:
+                unassigned.append(mask)
+
+        for mask in unassigned:
+            place(lanes, mask)
+        return lanes
+
+    def _lanes_fingerprint(self, lanes):
+        """Stable 64-bit digest of what a day's busy masks depend on besides bookings and events"""
+        setup = [
+            (lane.resource.id, lane.resource.calendar_id, lane.open_mask) if lane.resource
+            else (None, self.calendar_id, lane.open_mask)
+            for lane in lanes
+        ]
+        digest = hashlib.blake2b(repr(setup).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little', signed=True)
+
+    def refresh_stored_day(self, store, date):
+        """Recompute a day into the shared store; False if it changed meanwhile or Google is down"""
+        token = store.generation(self.business.id, date)
+        self.degraded = False
+        lanes = self._booked_lanes(date)
+        if self.degraded:
+            return False  # Don't publish padded stale data as current
+        busy = {lane.resource.id if lane.resource else None: lane.busy for lane in lanes}
+        return store.put(self.business.id, date, self._lanes_fingerprint(lanes), busy, token)
+
+    def _event_minutes(self, event, minute_of):
+        """(start, end) minutes of the day covered by a CalendarEvent"""
+        return minute_of(event.start_at(self.timezone)), minute_of(event.end_at(self.timezone))
 
     def _round_up_to_next_slot(self, dt):
         """Round up to the next available slot time"""
@@ -169,37 +252,65 @@ class DjangoCalendarService:
         
         return rounded
 
-    def _get_calendar_events(self, start_time, end_time):
-        """Get Google Calendar events for a time period"""
+    def is_calendar_free(self, start_time, end_time, calendar_id=None):
+        """Whether no event on the calendar (business calendar by default) overlaps [start_time, end_time)"""
+        start, end = int(start_time.timestamp()), int(end_time.timestamp())
+        return not any(
+            event.start < end and start < event.end
+            for event in self._get_calendar_events(start_time, end_time, calendar_id)
+        )
+
+    def _events_request(self, calendar_id, start_time, end_time):
+        """events().list() request; UpstreamUnavailable if the client can't be built"""
         try:
-            # If no calendar ID is set, return empty list
-            if not self.calendar_id:
-                return []
-                
-            events_result = self.service.events().list(
-                calendarId=self.calendar_id,
+            return self.service.events().list(
+                calendarId=calendar_id,
                 timeMin=start_time.isoformat(),
                 timeMax=end_time.isoformat(),
                 singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            events = events_result.get('items', [])
-            
-            # Debug print
-            if events:
-                print("\nFound calendar events:")
-                for event in events:
-                    start = event['start'].get('dateTime', event['start'].get('date'))
-                    end = event['end'].get('dateTime', event['end'].get('date'))
-                    print(f"- {event.get('summary', 'No title')}: {start} - {end}")
-            
-            return events
-            
-        except Exception as e:
-            print(f"Error fetching calendar events: {str(e)}")
+                orderBy='startTime',
+                fields='items(id,summary,location,start,end)'
+            )
+        except Exception as e:  # Missing or bad credentials, unreadable discovery document
+            raise resilience.UpstreamUnavailable('google_calendar', f"client unavailable: {e}") from e
+
+    def _get_calendar_events(self, start_time, end_time, calendar_id=None):
+        """CalendarEvents for a time period (business calendar by default)
+
+        While Google is unreachable, serves the last answer for the same
+        period widened by STALE_BUFFER_MINUTES (and marks the service
+        degraded); with no earlier answer it raises UpstreamUnavailable,
+        since treating the calendar as empty would offer taken slots.
+        """
+        calendar_id = calendar_id or self.calendar_id
+        # If no calendar ID is set, return empty list
+        if not calendar_id:
             return []
 
+        snapshot_key = f'calendar_snapshot:{calendar_id}:{start_time.isoformat()}:{end_time.isoformat()}'
+        try:
+            request = self._events_request(calendar_id, start_time, end_time)
+            items = resilience.call('google_calendar', request.execute).get('items', [])
+        except resilience.UpstreamUnavailable as e:
+            items = cache.get(snapshot_key)
+            if items is None:
+                print(f"Error fetching calendar events: {str(e)}")
+                raise
+            print(f"Serving last-known calendar events ({str(e)})")
+            self.degraded = True
+            return widen(normalize_events(items, self.timezone), STALE_BUFFER_MINUTES)
+        cache.set(snapshot_key, items, CALENDAR_SNAPSHOT_TIMEOUT)
+
+        # Debug print
+        if items:
+            print("\nFound calendar events:")
+            for item in items:
+                start = item['start'].get('dateTime', item['start'].get('date'))
+                end = item['end'].get('dateTime', item['end'].get('date'))
+                print(f"- {item.get('summary', 'No title')}: {start} - {end}")
+
+        return normalize_events(items, self.timezone)
+
     def hold_slot(self, date_str, time_str, service_id):
         """Place a temporary hold on a time slot"""
         try:
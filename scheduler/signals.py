@@ -0,0 +1,94 @@
+import pytz
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from core.models import Business
+from .models import Booking, BusinessHours, Resource, ResourceHours, Service
+from .profiles import invalidate_schedule_profile
+from .schedule_store import invalidate_stored_day
+from .streams import publish_availability_change
+from . import rollups
+
+
+@receiver([post_save, post_delete], sender=Business)
+def business_changed(sender, instance, **kwargs):
+    _invalidate_profile_on_commit(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Service)
+@receiver([post_save, post_delete], sender=BusinessHours)
+@receiver([post_save, post_delete], sender=Resource)
+def schedule_settings_changed(sender, instance, **kwargs):
+    _invalidate_profile_on_commit(instance.business_id)
+
+
+@receiver([post_save, post_delete], sender=ResourceHours)
+def resource_hours_changed(sender, instance, **kwargs):
+    business_id = Resource.objects.filter(pk=instance.resource_id).values_list('business_id', flat=True).first()
+    if business_id is not None:
+        _invalidate_profile_on_commit(business_id)
+
+
+def _invalidate_profile_on_commit(business_id):
+    # Bumped before commit, a concurrent rebuild could cache the old rows
+    # under the new version
+    transaction.on_commit(lambda: invalidate_schedule_profile(business_id))
+
+
+@receiver(pre_save, sender=Booking)
+def booking_pre_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.booking_pre_save(instance)
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    old_state = getattr(instance, '_rollup_old_state', None)
+    rollups.booking_post_save(instance)
+
+    # Any saved change may move busy time; drop shared copies of the days involved
+    days = {(instance.business_id, _local_date(instance))}
+    if old_state is not None:
+        days.add((old_state[0], old_state[2]))
+
+    def invalidate_days():
+        for business_id, date in days:
+            invalidate_stored_day(business_id, date)
+
+    transaction.on_commit(invalidate_days)
+
+    # Tell open booking pages for that day, once the change is committed
+    if created:
+        change = 'booked'
+    elif instance.status == 'cancelled' and (old_state is None or old_state[3] != 'cancelled'):
+        change = 'cancelled'
+    else:
+        return
+    _publish_booking_change(instance, change)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    rollups.booking_post_delete(instance)
+    business_id, local_date = instance.business_id, _local_date(instance)
+    transaction.on_commit(lambda: invalidate_stored_day(business_id, local_date))
+    _publish_booking_change(instance, 'cancelled')
+
+
+def _local_date(booking):
+    return booking.start_time.astimezone(pytz.timezone(settings.SCHEDULER_TIME_ZONE)).date()
+
+
+def _publish_booking_change(booking, change):
+    tz = pytz.timezone(settings.SCHEDULER_TIME_ZONE)
+    details = {
+        'start': booking.start_time.astimezone(tz).isoformat(),
+        'end': booking.end_time.astimezone(tz).isoformat(),
+    }
+    local_date = _local_date(booking)
+    transaction.on_commit(
+        lambda: publish_availability_change(booking.business_id, local_date, change, **details)
+    )
@@ -0,0 +1,102 @@
+"""
+Coalescing of identical concurrent computations ("singleflight").
+
+When a booking link is shared, many customers ask for the same business
+day within a second, and on a cold day each would run the same database
+and Google Calendar work. SingleFlight.do(key, fn) runs fn once for all
+concurrent callers with the same key:
+
+- Within a process, the first caller (the leader) computes and the others
+  wait on an Event and get its result, or its exception.
+- Across workers, the leader takes a short-lived lock in the cache and
+  publishes its result under a per-flight key; a worker that finds the lock
+  held polls for that result instead of computing. If the leader fails or
+  takes longer than LOCK_TIMEOUT, the waiter computes after all.
+
+Nothing is cached beyond the flight: a request that starts after the result
+was published computes afresh. Across workers this goes through the shared
+cache (config/caches.py); the host-wide file cache has no atomic add(), so
+there two workers can occasionally both lead, which only costs a duplicate
+computation. Redis makes the lock exact.
+"""
+
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+LOCK_TIMEOUT = 15  # Seconds; longer than a calendar fetch with retries
+RESULT_TIMEOUT = 5  # Seconds waiters have to pick a published result up
+POLL_SECONDS = 0.05
+
+_MISSING = object()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls per key, in-process and through the cache"""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn):
+        """fn()'s result, computed once for all callers asking for key at the same time"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if not flight.done.wait(LOCK_TIMEOUT):
+                return fn()  # Leader stuck: don't wait forever
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._shared(key, fn)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _shared(self, key, fn):
+        """fn() unless another worker is computing key, in which case its result"""
+        lock_key = f'singleflight:{self.namespace}:{key}'
+        flight_id = uuid.uuid4().hex
+        give_up = time.monotonic() + LOCK_TIMEOUT
+        leader_id = None
+        while True:
+            if leader_id:
+                # Checked before retrying the lock: the leader publishes, then unlocks
+                result = cache.get(f'{lock_key}:{leader_id}', _MISSING)
+                if result is not _MISSING:
+                    return result
+            if cache.add(lock_key, flight_id, LOCK_TIMEOUT):
+                break
+            leader_id = cache.get(lock_key) or leader_id
+            if time.monotonic() > give_up:
+                return fn()
+            time.sleep(POLL_SECONDS)
+
+        try:
+            result = fn()
+            cache.set(f'{lock_key}:{flight_id}', result, RESULT_TIMEOUT)
+            return result
+        finally:
+            if cache.get(lock_key) == flight_id:
+                cache.delete(lock_key)
@@ -0,0 +1,154 @@
+"""
+Server-Sent Events stream of availability changes.
+
+Open booking pages subscribe to /api/availability-stream/<business_id>/<date>/
+and get a small JSON delta whenever a slot on that day is held, released,
+booked or cancelled, so they can refresh their slot list instead of polling.
+
+The stream is a plain ASGI app mounted in config/asgi.py ahead of Django:
+long-lived connections then don't hold a Django request (or a thread from
+the sync middleware adapter) open.
+
+Deltas are delivered instantly to subscribers in the same process. Each
+publish also bumps a per-(business, date) version in the cache, which every
+stream checks on its keepalive tick, so subscribers connected to another
+worker still hear about the change (as a "refresh" event) within
+KEEPALIVE_SECONDS through the shared cache (config/caches.py).
+"""
+
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+STREAM_PATH = re.compile(r'^/api/availability-stream/(?P<business_id>\d+)/(?P<date>\d{4}-\d{2}-\d{2})/$')
+KEEPALIVE_SECONDS = 15
+MAX_QUEUED_EVENTS = 100
+
+
+def _version_key(business_id, date):
+    return f'availability_stream:{business_id}:{date}'
+
+
+class AvailabilityBroker:
+    """In-process fan-out of availability deltas to SSE subscribers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # (business_id, date) -> {(loop, queue)}
+
+    def subscribe(self, business_id, date):
+        queue = asyncio.Queue(maxsize=MAX_QUEUED_EVENTS)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[(int(business_id), str(date))].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, business_id, date, subscriber):
+        key = (int(business_id), str(date))
+        with self._lock:
+            self._subscribers[key].discard(subscriber)
+            if not self._subscribers[key]:
+                del self._subscribers[key]
+
+    def publish(self, business_id, date, event):
+        """Deliver an event to local subscribers; safe to call from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers.get((int(business_id), str(date)), ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, event)
+
+    @staticmethod
+    def _offer(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A slow client only needs to know it should re-fetch
+            pass
+
+
+broker = AvailabilityBroker()
+
+
+def publish_availability_change(business_id, date, change, **details):
+    """Announce a hold/release/booked/cancelled change for a business-day"""
+    date = str(date)
+    event = {'type': change, 'business': int(business_id), 'date': date, **details}
+    cache.set(_version_key(business_id, date), time.time_ns(), KEEPALIVE_SECONDS * 8)
+    broker.publish(business_id, date, event)
+
+
+def _sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+
+
+async def availability_stream_app(scope, receive, send):
+    """ASGI app streaming availability deltas for one (business, date)"""
+    match = STREAM_PATH.match(scope['path'])
+    if scope['method'] != 'GET' or not match:
+        await send({'type': 'http.response.start', 'status': 404,
+                    'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Not found'})
+        return
+
+    business_id, date = int(match['business_id']), match['date']
+    version_key = _version_key(business_id, date)
+    get_version = sync_to_async(cache.get, thread_sensitive=False)
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),  # Don't let nginx buffer the stream
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+    subscriber = broker.subscribe(business_id, date)
+    _, queue = subscriber
+    seen_version = await get_version(version_key)
+
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        while not disconnected.done():
+            next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnected},
+                timeout=KEEPALIVE_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnected in done:
+                next_event.cancel()
+                break
+
+            if next_event in done:
+                body = _sse(next_event.result())
+                seen_version = await get_version(version_key)
+            else:
+                next_event.cancel()
+                version = await get_version(version_key)
+                if version is not None and version != seen_version:
+                    # Changed in another worker; we don't know the details
+                    seen_version = version
+                    body = _sse({'type': 'refresh', 'business': business_id, 'date': date})
+                else:
+                    body = b': keepalive\n\n'
+
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        disconnected.cancel()
+        broker.unsubscribe(business_id, date, subscriber)
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
@@ -1,15 +1,59 @@
-from django.test import TestCase, Client
+from django.test import TestCase, SimpleTestCase, Client, override_settings
 from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import RestrictedError
 from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
 from core.models import Business, Customer
-from .models import Service, Booking
-from datetime import datetime, timedelta
+import directions
+from directions import TravelMatrix, TravelTimeCalculator
+from calendar_events import SERVICE, TRAVEL, TRAVEL_BLOCK_SUMMARY, CalendarEvent, normalize_events
+from getcalendar import CalendarService, get_calendar_service
+import resilience
+from google_tokens import SharedTokenCredentials, TokenProvider
+from itinerary import RouteOptimizer, Stop, optimize_route, plan_day
+from routing import GoogleMapsBackend, LocalGraphBackend, RoadGraph, format_duration
+from core.pagination import EstimatedCountPaginator
+from .admin import RecentBookingsFormSet
+from django.core.exceptions import ValidationError
+from .availability import Lane, can_start, free_intervals, interval_mask, place, runs, start_mask, union_starts, units
+from .bookings import create_booking
+from .models import Service, Booking, BookingDayLock, BusinessHours, BusinessDailyStats, Resource, ResourceHours, UpstreamQuota
+from .profiles import get_profile_for_booking_url, get_profile_version, get_schedule_profile
+from . import quotas, reminders, schedule_store
+from .schedule_store import DayScheduleStore, get_schedule_store
+from .services import DjangoCalendarService
+from .singleflight import SingleFlight
+from .warmup import warm_caches
+from .streams import availability_stream_app, broker, publish_availability_change
+import asyncio
+import gc
+import math
+import random
+import runpy
+import struct
+import subprocess
+import sys
+import threading
+import time as time_module
+import os
+import tempfile
+from datetime import datetime, time, timedelta
+import pytz
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from unittest.mock import Mock, call, patch
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
 from django.utils import timezone
 
 # Create your tests here.
 
 class BookingTests(TestCase):
     def setUp(self):
+        cache.clear()
         # Create business
         self.user = User.objects.create_user(
             username='testuser',
@@ -79,6 +123,7 @@ class BookingTests(TestCase):
 
 class IntegrationTests(TestCase):
     def setUp(self):
+        cache.clear()
         # Setup business and service
         self.user = User.objects.create_user(
             username='testuser',
@@ -137,3 +182,1251 @@ class IntegrationTests(TestCase):
         self.client.login(username='testuser', password='testpass123')
         response = self.client.get(reverse('core:dashboard'))
         self.assertContains(response, 'Test Customer')
+
+class BookingOverlapTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='testpass123')
+        self.business = Business.objects.create(
+            owner=self.user,
+            name='Overlap Business',
+            email='overlap@business.com',
+            phone='1234567890'
+        )
+        self.service = Service.objects.create(
+            business=self.business,
+            name='Wash',
+            duration=60,
+            price=50.00
+        )
+        self.customer = Customer.objects.create(
+            name='Customer',
+            email='customer@overlap.com',
+            phone='1234567890'
+        )
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        Booking.objects.create(
+            business=self.business,
+            service=self.service,
+            customer=self.customer,
+            start_time=self.start,
+            end_time=self.start + timedelta(hours=1)
+        )
+
+    def test_overlapping_ignores_inactive_and_adjacent(self):
+        overlapping = Booking.objects.overlapping
+        self.assertTrue(overlapping(
+            self.business, self.start + timedelta(minutes=30), self.start + timedelta(hours=2)
+        ).exists())
+        # Touching end/start is not an overlap
+        self.assertFalse(overlapping(
+            self.business, self.start + timedelta(hours=1), self.start + timedelta(hours=2)
+        ).exists())
+        Booking.objects.update(status='cancelled')
+        self.assertFalse(overlapping(
+            self.business, self.start, self.start + timedelta(hours=1)
+        ).exists())
+
+    def test_overlap_query_uses_covering_index(self):
+        plan = Booking.objects.overlapping(
+            self.business, self.start, self.start + timedelta(hours=1)
+        ).for_resource(None).values('pk').order_by().explain()
+        if connection.vendor == 'sqlite':
+            self.assertIn('COVERING INDEX booking_overlap_covering_idx', plan)
+
+class BookingServiceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='testpass123')
+        self.business = Business.objects.create(
+            owner=self.user,
+            name='Locking Business',
+            email='lock@business.com',
+            phone='1234567890'
+        )
+        self.service = Service.objects.create(
+            business=self.business,
+            name='Wash',
+            duration=60,
+            price=50.00
+        )
+        self.customer = Customer.objects.create(
+            name='Customer',
+            email='customer@lock.com',
+            phone='1234567890'
+        )
+        self.start = pytz.timezone(settings.SCHEDULER_TIME_ZONE).localize(datetime(2030, 1, 7, 10))  # A Monday
+
+    def test_create_booking_takes_business_day_lock(self):
+        booking = create_booking(self.business, self.service, self.customer, self.start)
+        self.assertEqual(booking.end_time, self.start + timedelta(minutes=60))
+        self.assertEqual(BookingDayLock.objects.filter(business=self.business).count(), 1)
+
+        # Same business-day reuses the lock row
+        create_booking(self.business, self.service, self.customer, self.start + timedelta(hours=2))
+        self.assertEqual(BookingDayLock.objects.filter(business=self.business).count(), 1)
+
+    def test_create_booking_rejects_overlap(self):
+        create_booking(self.business, self.service, self.customer, self.start)
+        with self.assertRaises(ValidationError):
+            create_booking(
+                self.business, self.service, self.customer, self.start + timedelta(minutes=30)
+            )
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_create_booking_rejects_closed_hours(self):
+        for start in (self.start.replace(hour=8), self.start.replace(hour=16, minute=30),
+                      self.start + timedelta(days=5)):  # Before opening, past closing, Saturday
+            with self.assertRaises(ValidationError):
+                create_booking(self.business, self.service, self.customer, start)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_create_booking_rejects_calendar_events(self):
+        self.business.calendar_id = 'shop@example.com'
+        self.business.save()
+        item = {'id': 'e', 'summary': 'Dentist',
+                'start': {'dateTime': self.start.replace(hour=11).isoformat()},
+                'end': {'dateTime': self.start.replace(hour=12).isoformat()}}
+        with patch.object(DjangoCalendarService, '_get_calendar_events', autospec=True,
+                          side_effect=lambda svc, *args: normalize_events([item], svc.timezone)):
+            with self.assertRaises(ValidationError):
+                create_booking(self.business, self.service, self.customer, self.start + timedelta(minutes=30))
+            booking = create_booking(self.business, self.service, self.customer, self.start.replace(hour=12))
+        self.assertEqual(booking.start_time, self.start.replace(hour=12))
+
+        with patch.object(DjangoCalendarService, '_get_calendar_events',
+                          side_effect=resilience.UpstreamUnavailable('google_calendar', 'circuit is open')):
+            response = self.client.post(reverse('scheduler:create_booking'), {
+                'business': self.business.id, 'service': self.service.id, 'name': 'Customer',
+                'email': 'customer@lock.com', 'date': '2030-01-07', 'time': '2:00 PM'
+            })
+        self.assertEqual(response.status_code, 503)
+
+    @override_settings(UPSTREAM_QUOTAS={'google_calendar': {'capacity': 1, 'refill_per_minute': 0}})
+    def test_create_booking_view_charges_quota_up_front(self):
+        self.business.calendar_id = 'shop@example.com'
+        self.business.save()
+        data = {'business': self.business.id, 'service': self.service.id, 'name': 'Customer',
+                'email': 'customer@lock.com', 'date': '2030-01-07', 'time': '10:00 AM'}
+        with patch.object(DjangoCalendarService, '_get_calendar_events', return_value=[]), \
+                patch.object(resilience, 'charge_quota') as charge_quota:
+            self.assertEqual(self.client.post(reverse('scheduler:create_booking'), data).status_code, 200)
+            response = self.client.post(reverse('scheduler:create_booking'), dict(data, time='2:00 PM'))
+
+        self.assertEqual(response.status_code, 503)
+        charge_quota.assert_not_called()  # Nothing charged inside the booking transaction
+        quota = UpstreamQuota.objects.get(business=self.business, upstream='google_calendar')
+        self.assertEqual((quota.consumed, quota.denied), (1, 1))
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_create_booking_view_conflict(self):
+        data = {
+            'business': self.business.id,
+            'service': self.service.id,
+            'name': 'Test Customer',
+            'email': 'customer@test.com',
+            'phone': '1234567890',
+            'date': '2030-01-07',
+            'time': '10:00 AM'
+        }
+        response = self.client.post(reverse('scheduler:create_booking'), data)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse('scheduler:create_booking'), data)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(response.json()['success'])
+
+class ScheduleProfileTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='testpass123')
+        self.business = Business.objects.create(
+            owner=self.user,
+            name='Profile Business',
+            email='profile@business.com',
+            phone='1234567890'
+        )
+        self.service = Service.objects.create(
+            business=self.business,
+            name='Wash',
+            duration=60,
+            price=50.00
+        )
+
+    def test_profile_is_cached(self):
+        profile = get_schedule_profile(self.business.id)
+        self.assertEqual(profile.get_service(self.service.id).name, 'Wash')
+        with self.assertNumQueries(0):
+            cached = get_schedule_profile(self.business.id)
+        self.assertEqual(cached.version, profile.version)
+
+    def test_profile_defaults_and_edits(self):
+        profile = get_schedule_profile(self.business.id)
+        # Unconfigured days default to 9-5 on weekdays, closed on weekends
+        self.assertIsNotNone(profile.hours_for(datetime(2030, 1, 7).date()))  # Monday
+        self.assertIsNone(profile.hours_for(datetime(2030, 1, 5).date()))  # Saturday
+
+        version = get_profile_version(self.business.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            BusinessHours.objects.create(business=self.business, day_of_week=0, is_closed=True)
+            self.service.active = False
+            self.service.save()
+            # Bumped on commit, so nobody caches a rebuild from uncommitted rows
+            self.assertEqual(get_profile_version(self.business.id), version)
+
+        profile = get_schedule_profile(self.business.id)
+        self.assertIsNone(profile.hours_for(datetime(2030, 1, 7).date()))
+        with self.assertRaises(Service.DoesNotExist):
+            profile.get_service(self.service.id)
+
+    def test_missing_business(self):
+        self.assertIsNone(get_schedule_profile(999999))
+
+class DailyStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='testpass123')
+        self.business = Business.objects.create(
+            owner=self.user,
+            name='Stats Business',
+            email='stats@business.com',
+            phone='1234567890'
+        )
+        self.service = Service.objects.create(
+            business=self.business,
+            name='Wash',
+            duration=90,
+            price=80.00
+        )
+        self.customer = Customer.objects.create(
+            name='Customer',
+            email='customer@stats.com',
+            phone='1234567890'
+        )
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+
+    def make_booking(self, start):
+        return Booking.objects.create(
+            business=self.business,
+            service=self.service,
+            customer=self.customer,
+            start_time=start,
+            end_time=start + timedelta(minutes=90)
+        )
+
+    def stats(self):
+        return BusinessDailyStats.objects.get(business=self.business, service=self.service)
+
+    def test_rollup_tracks_booking_changes(self):
+        booking = self.make_booking(self.start)
+        self.make_booking(self.start + timedelta(hours=3))
+        stats = self.stats()
+        self.assertEqual((stats.bookings, stats.cancellations, stats.booked_minutes), (2, 0, 180))
+        self.assertEqual(stats.revenue, Decimal('160.00'))
+
+        # Reloaded instance: status change moves the booking between counters
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.status = 'cancelled'
+        booking.save()
+        stats = self.stats()
+        self.assertEqual((stats.bookings, stats.cancellations, stats.booked_minutes), (1, 1, 90))
+        self.assertEqual(stats.revenue, Decimal('80.00'))
+
+        booking.delete()
+        stats = self.stats()
+        self.assertEqual((stats.bookings, stats.cancellations), (1, 0))
+
+    def test_backfill_matches_incremental(self):
+        self.make_booking(self.start)
+        cancelled = self.make_booking(self.start + timedelta(days=1))
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        incremental = list(BusinessDailyStats.objects.order_by('date').values_list(
+            'date', 'bookings', 'cancellations', 'booked_minutes', 'revenue'
+        ))
+
+        call_command('backfill_daily_stats', stdout=StringIO())
+        backfilled = list(BusinessDailyStats.objects.order_by('date').values_list(
+            'date', 'bookings', 'cancellations', 'booked_minutes', 'revenue'
+        ))
+        self.assertEqual(backfilled, incremental)
+
+    def test_dashboard_shows_analytics(self):
+        self.make_booking(timezone.now().replace(microsecond=0) - timedelta(days=2))
+        self.client.login(username='owner', password='testpass123')
+        response = self.client.get(reverse('core:dashboard'))
+        self.assertEqual(response.context['analytics']['bookings'], 1)
+        self.assertContains(response, '$80.00')
+
+class BookingPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='testpass123')
+        self.business = Business.objects.create(
+            owner=self.user,
+            name='Cached Business',
+            email='cached@business.com',
+            phone='1234567890'
+        )
+        self.service = Service.objects.create(
+            business=self.business,
+            name='Wash',
+            duration=60,
+            price=50.00
+        )
+        self.url = reverse('scheduler:booking_page', kwargs={'booking_url': self.business.booking_url})
+
+    def test_conditional_get_returns_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('csrftoken', response.cookies)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Editing a service changes the version, so the old ETag no longer matches
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.name = 'Premium Wash'
+            self.service.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Premium Wash')
+
+    def test_holds_are_published_to_the_services_business(self):
+        other = Business.objects.create(owner=User.objects.create_user(username='other'), name='Other',
+                                        email='o@business.com', phone='1')
+        slot = {'date': '2030-01-07', 'time': '10:00 AM'}
+        self.addCleanup(get_calendar_service().pending_bookings.pop, '2030-01-07 10:00 AM', None)
+
+        with patch('scheduler.views.publish_availability_change') as publish:
+            # A client-sent business id is ignored
+            response = self.client.post(reverse('scheduler:hold_slot'), {**slot, 'service': self.service.id,
+                                        'business': other.id}, content_type='application/json')
+            self.assertEqual(response.json()['status'], 'success')
+            self.client.post(reverse('scheduler:release_slot'), {**slot, 'business': other.id},
+                             content_type='application/json')
+            self.client.post(reverse('scheduler:release_slot'), slot, content_type='application/json')
+
+        self.assertEqual(publish.call_args_list, [
+            call(self.business.id, '2030-01-07', 'hold', time='10:00 AM'),
+            call(self.business.id, '2030-01-07', 'release', time='10:00 AM'),
+        ])
+
+    def test_cached_page_skips_database(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Wash')
+
+    def test_logged_in_owner_sees_own_nav(self):
+        self.client.login(username='owner', password='testpass123')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Dashboard')
+        self.assertNotIn('ETag', response)
+
+class AvailabilityStreamTests(TestCase):
+    async def test_stream_delivers_published_changes(self):
+        sent = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/availability-stream/7/2030-01-07/'}
+        task = asyncio.ensure_future(availability_stream_app(scope, receive, send))
+        while (7, '2030-01-07') not in broker._subscribers:
+            await asyncio.sleep(0.01)
+
+        # Published from a worker thread, as the sync views do
+        await asyncio.to_thread(publish_availability_change, 7, '2030-01-07', 'booked', start='10:00')
+        while len(sent) < 3:
+            await asyncio.sleep(0.01)
+        disconnect.set()
+        await asyncio.wait_for(task, 1)
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), sent[0]['headers'])
+        self.assertTrue(sent[2]['body'].startswith(b'event: booked\n'))
+        self.assertNotIn((7, '2030-01-07'), broker._subscribers)
+
+    def test_booking_changes_are_published(self):
+        user = User.objects.create_user(username='owner', password='testpass123')
+        business = Business.objects.create(owner=user, name='Stream Business', email='s@b.com', phone='1')
+        service = Service.objects.create(business=business, name='Wash', duration=60, price=10)
+        customer = Customer.objects.create(name='Customer', email='c@stream.com', phone='1')
+        start = pytz.timezone(settings.SCHEDULER_TIME_ZONE).localize(datetime(2030, 1, 7, 10))
+
+        with patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                booking = create_booking(business, service, customer, start)
+            with self.captureOnCommitCallbacks(execute=True):
+                booking.status = 'cancelled'
+                booking.save()
+
+        changes = [call.args[2]['type'] for call in publish.call_args_list]
+        self.assertEqual(changes, ['booked', 'cancelled'])
+
+# Admin templates need static URLs without a collectstatic manifest
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AdminScalingTests(TestCase):
+    def setUp(self):
+        admin_user = User.objects.create_superuser(username='admin', password='testpass123', email='a@b.com')
+        owner = User.objects.create_user(username='owner', password='testpass123')
+        self.business = Business.objects.create(owner=owner, name='Test Business', email='t@b.com', phone='1')
+        self.service = Service.objects.create(business=self.business, name='Cut', duration=30, price=25)
+        self.customer = Customer.objects.create(name='Regular', email='regular@example.com', phone='1')
+        start = timezone.now()
+        Booking.objects.bulk_create([
+            Booking(business=self.business, service=self.service, customer=self.customer,
+                    start_time=start + timedelta(hours=i), end_time=start + timedelta(hours=i, minutes=30))
+            for i in range(30)
+        ])
+        self.client.force_login(admin_user)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:scheduler_booking_changelist')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Regular')
+
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        Booking.objects.bulk_create([
+            Booking(business=self.business, service=self.service, customer=self.customer,
+                    start_time=timezone.now() - timedelta(days=i + 1),
+                    end_time=timezone.now() - timedelta(days=i + 1) + timedelta(minutes=30))
+            for i in range(30)
+        ])
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(few), len(many))
+
+    def test_customer_inline_shows_recent_bookings_only(self):
+        response = self.client.get(reverse('admin:core_customer_change', args=[self.customer.id]))
+        self.assertEqual(response.status_code, 200)
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(len(formset.forms), RecentBookingsFormSet.max_rows)
+        shown = [form.instance.start_time for form in formset.forms]
+        self.assertEqual(shown, sorted(shown, reverse=True))
+
+    def test_estimated_count_falls_back_to_exact(self):
+        paginator = EstimatedCountPaginator(Booking.objects.all(), 10)
+        self.assertEqual(paginator.count, 30)
+
+class LocalRoutingTests(SimpleTestCase):
+    GRAPH = """# id,lat,lng
+node,a,39.000,-77.000
+node,b,39.000,-76.990
+node,c,39.010,-76.990
+node,d,39.010,-77.000
+node,island,40.000,-70.000
+edge,a,b,300
+edge,b,c,300
+edge,c,d,300
+edge,d,a,1200
+edge,a,c,900,oneway
+alias,b,"123 Main St, Bethesda, MD"
+"""
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.GRAPH)
+        self.addCleanup(os.unlink, f.name)
+        self.graph = RoadGraph.load(f.name)
+        self.calculator = TravelTimeCalculator(backend=LocalGraphBackend(self.graph))
+
+    def test_shortest_paths(self):
+        a, c, d = (self.graph.index[n] for n in 'acd')
+        self.assertEqual(self.graph.shortest_seconds(a, d), 900)  # a-b-c-d beats the direct road
+        self.assertEqual(self.graph.shortest_seconds(c, a), 600)  # a->c is one way
+        self.assertIsNone(self.graph.shortest_seconds(a, self.graph.index['island']))
+        self.assertEqual(self.graph.one_to_many(a, [c, d]), [600, 900])
+
+    def test_landmark_search_matches_dijkstra(self):
+        # A grid of blocks with random drive times, some streets one way
+        rng = random.Random(7)
+        ids = [f'{row}-{col}' for row in range(12) for col in range(12)]
+        edges = []
+        for row in range(12):
+            for col in range(12):
+                for right, down in ((0, 1), (1, 0)):
+                    if row + down < 12 and col + right < 12:
+                        u, v, seconds = f'{row}-{col}', f'{row + down}-{col + right}', rng.uniform(10, 60)
+                        edges.append((u, v, seconds))
+                        if rng.random() > 0.2:
+                            edges.append((v, u, seconds * rng.uniform(0.9, 1.2)))
+        coordinates = [(39 + i // 12 * 0.001, -77 + i % 12 * 0.001) for i in range(len(ids))]
+        alt = RoadGraph(ids, coordinates, edges, landmarks=4)
+        plain = RoadGraph(ids, coordinates, edges, landmarks=0)
+        self.assertEqual(len(alt.landmarks), 4)
+
+        for _ in range(50):
+            source, target = rng.randrange(len(ids)), rng.randrange(len(ids))
+            expected = plain.shortest_seconds(source, target)
+            if expected is None:
+                self.assertIsNone(alt.shortest_seconds(source, target))
+            else:
+                self.assertAlmostEqual(alt.shortest_seconds(source, target), expected)
+        targets = rng.sample(range(len(ids)), 3)
+        for got, expected in zip(alt.one_to_many(0, targets), plain.one_to_many(0, targets)):
+            self.assertAlmostEqual(got, expected)
+
+    def test_resolves_aliases_ids_and_coordinates(self):
+        self.assertEqual(self.graph.resolve('123 main st, bethesda, md'), self.graph.index['b'])
+        self.assertEqual(self.graph.resolve('d'), self.graph.index['d'])
+        self.assertEqual(self.graph.resolve('39.009,-77.001'), self.graph.index['d'])
+        with self.assertRaises(KeyError):
+            self.graph.resolve('Nowhere Special')
+
+    def test_calculator_uses_local_backend(self):
+        times = self.calculator.get_travel_times(('a', 'c'), ('123 Main St, Bethesda, MD', 'd'), datetime(2025, 1, 6, 9))
+        self.assertEqual(times['a']['d'], {'text': '15 mins', 'minutes': 15})
+        self.assertEqual(times['c']['123 Main St, Bethesda, MD']['minutes'], 5)
+        self.assertEqual(format_duration(3900), '1 hour 5 mins')
+
+class ItineraryTests(SimpleTestCase):
+    def line_matrix(self, positions):
+        # Depot at 0; travel time is distance along a road
+        points = [0] + positions
+        return [[abs(a - b) for b in points] for a in points]
+
+    def test_orders_stops_along_the_road(self):
+        stops = [Stop(name, None, 30) for name in 'dbca']
+        itinerary = optimize_route(stops, self.line_matrix([40, 20, 30, 10]))
+        self.assertIn(itinerary.order, (list('abcd'), list('dcba')))
+        self.assertEqual(itinerary.travel_minutes, 80)
+        self.assertTrue(itinerary.feasible)
+
+    def test_respects_time_windows(self):
+        # The far stop must be visited first despite the detour
+        stops = [
+            Stop('near', None, 30, earliest=0),
+            Stop('far', None, 30, earliest=0, latest=40),
+        ]
+        itinerary = optimize_route(stops, self.line_matrix([10, 40]))
+        self.assertEqual(itinerary.order, ['far', 'near'])
+        self.assertTrue(itinerary.feasible)
+        stop, arrival, start = itinerary.visits[1]
+        self.assertEqual((stop.key, arrival, start), ('near', 100, 100))
+
+    def test_twenty_stops_improve_on_insertion(self):
+        rng = random.Random(7)
+        points = [(rng.random() * 40, rng.random() * 40) for _ in range(21)]
+        matrix = [[round(math.dist(a, b)) for b in points] for a in points]
+        stops = [Stop(i, None, 20) for i in range(20)]
+        optimizer = RouteOptimizer(stops, matrix)
+        initial = optimizer.insertion()
+        improved = optimizer.improve(initial)
+        self.assertLessEqual(optimizer.cost(improved), optimizer.cost(initial))
+        self.assertEqual(sorted(improved), list(range(1, 21)))
+
+    def test_plan_day_fetches_one_matrix(self):
+        calculator = TravelTimeCalculator(backend=Mock(travel_seconds=Mock(return_value=[
+            [0, 600, 1200],
+            [600, 0, 600],
+            [1200, 600, 0],
+        ])))
+        departure = datetime(2025, 1, 6, 8, 0)
+        itinerary = plan_day('home', [
+            {'id': 2, 'location': 'far', 'duration': 60},
+            {'id': 1, 'location': 'near', 'duration': 60,
+             'earliest': departure + timedelta(minutes=30)},
+        ], departure, calculator)
+        self.assertEqual(itinerary.order, [1, 2])
+        self.assertEqual(itinerary.visits[0][2], departure + timedelta(minutes=30))
+        calculator.backend.travel_seconds.assert_called_once()
+
+class BitsetAvailabilityTests(SimpleTestCase):
+    def test_start_mask_needs_whole_run_free(self):
+        free = interval_mask(9 * 60, 12 * 60) & ~interval_mask(10 * 60, 10 * 60 + 30)
+        starts = start_mask(free, units(60))
+        self.assertTrue(can_start(starts, 9 * 60))
+        self.assertFalse(can_start(starts, 9 * 60 + 30))  # Runs into the 10:00 booking
+        self.assertTrue(can_start(starts, 10 * 60 + 30))
+        self.assertTrue(can_start(starts, 11 * 60))
+        self.assertFalse(can_start(starts, 11 * 60 + 5))  # Past closing
+
+    def test_union_and_placement(self):
+        lanes = [Lane('van 1', interval_mask(540, 720)), Lane('van 2', interval_mask(540, 720))]
+        booked = interval_mask(600, 660)
+        self.assertEqual(place(lanes, booked).resource, 'van 1')
+        self.assertTrue(can_start(union_starts(lanes, 60), 600))
+        self.assertFalse(can_start(lanes[0].starts(60), 600))
+        place(lanes, booked)
+        self.assertFalse(can_start(union_starts(lanes, 60), 600))
+        self.assertIsNone(place(lanes, booked))
+
+    def test_free_intervals_from_runs(self):
+        self.assertEqual(runs(0b1110011), [(0, 2), (4, 7)])
+        lanes = [
+            Lane('van 1', interval_mask(540, 720), busy=interval_mask(600, 660)),
+            Lane('van 2', interval_mask(540, 600)),
+        ]
+        self.assertEqual(free_intervals(lanes), [[540, 600], [660, 720]])
+        self.assertEqual(free_intervals(lanes, min_minutes=61), [])
+        self.assertEqual(free_intervals(lanes, not_before=570), [[570, 600], [660, 720]])
+
+class ResourceSchedulingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='testpass123')
+        self.business = Business.objects.create(
+            owner=self.user, name='Van Fleet', email='fleet@business.com', phone='1234567890'
+        )
+        self.service = Service.objects.create(business=self.business, name='Wash', duration=60, price=50)
+        self.customer = Customer.objects.create(name='Customer', email='c@fleet.com', phone='1')
+        self.vans = [Resource.objects.create(business=self.business, name=f'Van {i}') for i in (1, 2)]
+        self.date = datetime(2030, 1, 7).date()  # A Monday
+        self.tz = pytz.timezone(settings.SCHEDULER_TIME_ZONE)
+
+    def at(self, hour, minute=0):
+        return self.tz.localize(datetime.combine(self.date, datetime.min.time()).replace(hour=hour, minute=minute))
+
+    def slots(self):
+        service = DjangoCalendarService(self.business)
+        return service.get_available_slots(self.date.isoformat(), self.service.id)
+
+    def test_bookings_are_assigned_to_free_resources(self):
+        first = create_booking(self.business, self.service, self.customer, self.at(10))
+        second = create_booking(self.business, self.service, self.customer, self.at(10, 30))
+        self.assertEqual({first.resource, second.resource}, set(self.vans))
+        with self.assertRaises(ValidationError):
+            create_booking(self.business, self.service, self.customer, self.at(10, 30))
+
+    def test_availability_is_union_of_resources(self):
+        create_booking(self.business, self.service, self.customer, self.at(10))
+        self.assertIn('10:00 AM', self.slots())
+        create_booking(self.business, self.service, self.customer, self.at(10))
+        slots = self.slots()
+        self.assertNotIn('10:00 AM', slots)
+        self.assertNotIn('9:30 AM', slots)
+        self.assertIn('11:00 AM', slots)
+
+    def test_gaps_mode(self):
+        create_booking(self.business, self.service, self.customer, self.at(10))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vans[1].active = False
+            self.vans[1].save()
+        response = self.client.get(
+            reverse('scheduler:get_slots', args=[self.business.id]),
+            {'date': self.date.isoformat(), 'mode': 'gaps', 'min_duration': 45}
+        )
+        self.assertEqual(response.json()['gaps'], [[9 * 60, 10 * 60], [11 * 60, 17 * 60]])
+
+    def test_resources_with_bookings_are_retired_not_deleted(self):
+        booking = create_booking(self.business, self.service, self.customer, self.at(10))
+        with self.assertRaises(RestrictedError):
+            booking.resource.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.resource.active = False
+            booking.resource.save()
+        self.assertNotIn(booking.resource, get_schedule_profile(self.business.id).resources)
+
+        self.business.delete()  # Bookings go with their business
+        self.assertFalse(Resource.objects.exists())
+
+    def test_resource_hours_override_business_hours(self):
+        ResourceHours.objects.create(resource=self.vans[0], day_of_week=0, start_time=time(7, 0), end_time=time(11, 0))
+        self.vans[1].active = False
+        self.vans[1].save()
+        slots = self.slots()
+        self.assertEqual(slots[0], '7:00 AM')
+        self.assertEqual(slots[-1], '10:00 AM')
+        with self.assertRaises(ValidationError):
+            create_booking(self.business, self.service, self.customer, self.at(12))
+
+class ScheduleStoreTests(TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.days')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.date = datetime(2030, 1, 7).date()
+
+    def open_store(self):
+        store = DayScheduleStore(self.path, capacity=64)
+        self.addCleanup(store.close)
+        return store
+
+    def test_days_shared_between_mappings(self):
+        writer, reader = self.open_store(), self.open_store()
+        self.assertIsNone(reader.get(1, self.date, 42))
+        self.assertTrue(writer.put(1, self.date, 42, {None: 0b1100, 7: 1 << 200}))
+
+        self.assertEqual(reader.get(1, self.date, 42), {None: 0b1100, 7: 1 << 200})
+        self.assertIsNone(reader.get(1, self.date, 43))  # Other settings
+        self.assertIsNone(reader.get(2, self.date, 42))
+        reader.invalidate(1, self.date)
+        self.assertIsNone(writer.get(1, self.date, 42))
+
+    def test_old_days_expire(self):
+        store = self.open_store()
+        store.put(1, self.date, 42, {None: 1})
+        self.assertEqual(store.get(1, self.date, 42, max_age=300), {None: 1})
+        with patch('scheduler.schedule_store.time.time', return_value=time_module.time() + 301):
+            self.assertIsNone(store.get(1, self.date, 42, max_age=300))  # Refresher stopped
+            self.assertEqual(store.get(1, self.date, 42), {None: 1})
+
+    def test_refresh_dropped_if_day_changed_meanwhile(self):
+        store = self.open_store()
+        token = store.generation(1, self.date)
+        store.invalidate(1, self.date)  # A booking commits while the refresher computes
+        self.assertFalse(store.put(1, self.date, 42, {None: 1}, token))
+        self.assertTrue(store.put(1, self.date, 42, {None: 1}, store.generation(1, self.date)))
+        self.assertEqual(store.get(1, self.date, 42), {None: 1})
+
+    def test_readers_never_see_half_written_days(self):
+        store = self.open_store()
+        store.put(1, self.date, 42, {None: 1})
+        offset, generation = store.generation(1, self.date)
+        struct.pack_into('<I', store._map, offset, generation + 1)  # Writer mid-update
+        self.assertIsNone(store.get(1, self.date, 42))
+        struct.pack_into('<I', store._map, offset, generation + 2)
+        self.assertEqual(store.get(1, self.date, 42), {None: 1})
+
+    def test_workers_read_refreshed_days(self):
+        user = User.objects.create_user(username='owner', password='testpass123')
+        business = Business.objects.create(owner=user, name='Shared', email='s@business.com', phone='1')
+        service = Service.objects.create(business=business, name='Wash', duration=60, price=50)
+        customer = Customer.objects.create(name='Customer', email='c@shared.com', phone='1')
+        tz = pytz.timezone(settings.SCHEDULER_TIME_ZONE)
+        at_ten = tz.localize(datetime.combine(self.date, time(10)))
+
+        with override_settings(SCHEDULE_STORE_PATH=self.path):
+            self.addCleanup(lambda: schedule_store._stores.pop(self.path).close())
+            calendar = DjangoCalendarService(business)
+            self.assertTrue(calendar.refresh_stored_day(get_schedule_store(), self.date))
+
+            # Written behind the store's back (no signals): still served from the store
+            Booking.objects.bulk_create([Booking(
+                business=business, service=service, customer=customer, start_time=at_ten,
+                end_time=at_ten + timedelta(hours=1), status='confirmed'
+            )])
+            with CaptureQueriesContext(connection) as queries:
+                slots = calendar.get_available_slots(self.date.isoformat(), service.id)
+            self.assertIn('10:00 AM', slots)
+            self.assertFalse([q for q in queries.captured_queries if 'scheduler_booking' in q['sql']])
+
+            # A committed booking invalidates the day, so it's computed again
+            with self.captureOnCommitCallbacks(execute=True):
+                create_booking(business, service, customer, at_ten + timedelta(hours=2))
+            slots = calendar.get_available_slots(self.date.isoformat(), service.id)
+            self.assertNotIn('10:00 AM', slots)
+            self.assertNotIn('12:00 PM', slots)
+
+            out = StringIO()
+            call_command('refresh_schedule_store', '--days', '1', stdout=out)
+            self.assertIn('Stored 1 days', out.getvalue())
+
+class StartupImportTests(SimpleTestCase):
+    HEAVY_MODULES = ('googleapiclient', 'google.oauth2', 'google.auth', 'googlemaps', 'icalendar')
+
+    def test_views_import_without_api_clients(self):
+        # -X importtime lists every module loaded while importing the URLconf
+        code = 'import django; django.setup(); import config.urls, scheduler.views, getcalendar, directions'
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings'}
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        imported = {line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines() if line.startswith('import time:')}
+        self.assertFalse({name for name in imported if name.startswith(self.HEAVY_MODULES)})
+
+    def test_calendar_client_built_from_bundled_discovery_document(self):
+        from google.auth.credentials import AnonymousCredentials
+        from google_clients import build_calendar_client
+        with patch('httplib2.Http.request', side_effect=AssertionError("network used")):
+            client = build_calendar_client(AnonymousCredentials())
+        self.assertTrue(hasattr(client.events(), 'list'))
+
+class WarmupTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='owner', password='testpass123')
+        self.business = Business.objects.create(owner=user, name='Warm Wash', email='w@business.com', phone='1')
+        Service.objects.create(business=self.business, name='Wash', duration=60, price=50)
+        cache.clear()
+
+    def test_profiles_warmed_into_cache(self):
+        self.assertEqual(warm_caches(), 1)
+        with self.assertNumQueries(0):
+            profile = get_profile_for_booking_url(self.business.booking_url)
+        self.assertEqual(len(profile.services), 1)
+        # Held in this process too, so forked workers share the master's copy
+        self.assertIs(get_schedule_profile(self.business.id), profile)
+
+    @patch.dict('directions._known_legs', clear=True)
+    def test_known_legs_survive_restarts(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'legs.json')
+        directions.remember_legs(['A'], ['B', 'C'], [[600, 900]])
+        self.assertEqual(directions.save_known_legs(path), 2)
+
+        directions._known_legs.clear()
+        directions.remember_legs(['A'], ['B'], [[660]])  # Seen since: newer than the saved leg
+        self.assertEqual(directions.load_known_legs(path), 2)
+        self.assertEqual(directions.fallback_seconds(['A'], ['B', 'C']), [[660, 900]])
+        self.assertEqual(directions.load_known_legs(path + '.missing'), 2)
+
+    def test_gunicorn_master_warms_then_freezes(self):
+        self.addCleanup(gc.enable)  # The config module disables collection for the master
+        config = runpy.run_path(os.path.join(settings.BASE_DIR, 'config', 'gunicorn.py'))
+        self.assertTrue(config['preload_app'])
+
+        # Independent of local secrets: without credentials the client step is skipped
+        environ = {k: v for k, v in os.environ.items() if k != 'GOOGLE_CREDENTIALS'}
+        server = Mock()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with patch('gc.freeze') as freeze, patch.dict(os.environ, environ, clear=True), \
+                patch('google_clients.DEV_CREDENTIALS_FILE', os.path.join(tempfile.gettempdir(), 'missing-key.json')), \
+                patch('directions.KNOWN_LEGS_PATH', os.path.join(directory.name, 'legs.json')), \
+                patch.dict('directions._known_legs', clear=True):
+            config['when_ready'](server)
+            config['worker_exit'](server, Mock())
+            self.assertTrue(os.path.exists(directions.KNOWN_LEGS_PATH))
+        freeze.assert_called_once()
+        self.assertFalse(server.log.warning.called, server.log.warning.call_args)
+        self.assertIn(call('Warmed %s%s', 'schedule profiles', ' (1)'), server.log.info.call_args_list)
+
+class SharedTokenTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'tokens.json')
+        self.exchanges = []
+
+    def service_account(self, lifetime=timedelta(hours=1)):
+        source = Mock(service_account_email='sa@project.iam', scopes=['calendar'], token=None, expiry=None)
+        def refresh(request):
+            self.exchanges.append(source)
+            source.token = f'token-{len(self.exchanges)}'
+            source.expiry = datetime.utcnow() + lifetime
+        source.refresh.side_effect = refresh
+        return source
+
+    def test_workers_share_one_token_exchange(self):
+        first = TokenProvider(self.service_account(), self.path)
+        second = TokenProvider(self.service_account(), self.path)  # Another worker
+        self.assertEqual(first.token()[0], 'token-1')
+        self.assertEqual(second.token()[0], 'token-1')
+        self.assertEqual(first.token()[0], 'token-1')
+        self.assertEqual(len(self.exchanges), 1)
+
+    def test_refreshed_before_expiry(self):
+        provider = TokenProvider(self.service_account(lifetime=timedelta(minutes=4)), self.path)
+        provider.token()
+        self.assertEqual(provider.token()[0], 'token-2')  # Inside the refresh margin already
+
+    def test_credentials_take_token_from_provider(self):
+        credentials = SharedTokenCredentials(TokenProvider(self.service_account(), self.path))
+        headers = {}
+        credentials.before_request(None, 'GET', 'https://www.googleapis.com/calendar/v3', headers)
+        credentials.before_request(None, 'GET', 'https://www.googleapis.com/calendar/v3', headers)
+        self.assertEqual(headers['authorization'], 'Bearer token-1')
+        self.assertTrue(credentials.valid)
+        self.assertEqual(len(self.exchanges), 1)
+
+class ResilienceTests(TestCase):
+    def setUp(self):
+        breakers = {name: resilience.CircuitBreaker(name, failure_threshold=3) for name in resilience.TIMEOUTS}
+        patcher = patch.dict(resilience.breakers, breakers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sleep = patch('resilience.time.sleep')
+        self.sleeps = sleep.start()
+        self.addCleanup(sleep.stop)
+        resilience.reset_retry_budget()
+
+    def flaky(self, *outcomes):
+        def fn():
+            outcome = outcomes[fn.calls]
+            fn.calls += 1
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        fn.calls = 0
+        return fn
+
+    def test_transient_failures_retried_with_backoff(self):
+        fn = self.flaky(OSError('reset'), TimeoutError(), 'ok')
+        self.assertEqual(resilience.call('google_calendar', fn), 'ok')
+        self.assertEqual(fn.calls, 3)
+        self.assertEqual(self.sleeps.call_count, 2)
+        self.assertTrue(all(0 <= c.args[0] <= resilience.MAX_BACKOFF_SECONDS for c in self.sleeps.call_args_list))
+
+    def test_retry_budget_shared_by_a_request(self):
+        resilience.reset_retry_budget(1)
+        self.assertEqual(resilience.call('stripe', self.flaky(OSError(), 'ok')), 'ok')
+        fn = self.flaky(OSError(), 'ok')
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            resilience.call('google_maps', fn)
+        self.assertEqual(fn.calls, 1)
+
+    def test_client_errors_propagate_without_retry(self):
+        not_found = Exception('not found')
+        not_found.resp = Mock(status=404)
+        fn = self.flaky(not_found)
+        with self.assertRaises(Exception) as raised:
+            resilience.call('google_calendar', fn)
+        self.assertIs(raised.exception, not_found)
+        self.assertFalse(resilience.breakers['google_calendar'].is_open)
+
+    def test_breaker_fails_fast_then_recovers(self):
+        breaker = resilience.breakers['google_calendar']
+        for _ in range(3):
+            with self.assertRaises(resilience.UpstreamUnavailable):
+                resilience.call('google_calendar', self.flaky(OSError()), retry=False)
+        self.assertTrue(breaker.is_open)
+
+        fn = self.flaky('ok')
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.call('google_calendar', fn)
+        self.assertEqual(fn.calls, 0)
+
+        breaker.reset_seconds = 0  # Half-open: one trial call goes through
+        self.assertEqual(resilience.call('google_calendar', fn), 'ok')
+        self.assertFalse(breaker.is_open)
+
+    def test_missing_credentials_answer_503(self):
+        user = User.objects.create_user(username='owner', password='testpass123')
+        business = Business.objects.create(owner=user, name='Cal', email='c@b.com', phone='1', calendar_id='cal@group')
+        service = Service.objects.create(business=business, name='Wash', duration=60, price=50)
+        cache.clear()
+
+        with patch('scheduler.services.load_credentials', side_effect=FileNotFoundError('dev-key.json')):
+            response = self.client.get(reverse('scheduler:get_slots', args=[business.id]),
+                                       {'date': '2030-01-07', 'service': service.id})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('client unavailable', response.json()['error'])
+
+    def test_availability_served_from_padded_snapshot(self):
+        user = User.objects.create_user(username='owner', password='testpass123')
+        business = Business.objects.create(owner=user, name='Cal', email='c@b.com', phone='1', calendar_id='cal@group')
+        service = Service.objects.create(business=business, name='Wash', duration=60, price=50)
+        tz = pytz.timezone(settings.SCHEDULER_TIME_ZONE)
+        date = datetime(2030, 1, 7).date()
+        cache.clear()
+
+        calendar = DjangoCalendarService(business)
+        calendar.service = Mock()
+        execute = calendar.service.events.return_value.list.return_value.execute
+        execute.side_effect = OSError('no route to host')
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            calendar.get_available_slots(date.isoformat(), service.id)
+
+        resilience.breakers['google_calendar'].record_success()  # Google is back
+        resilience.reset_retry_budget()
+        execute.side_effect = None
+        execute.return_value = {'items': [{
+            'id': 'e1', 'summary': 'Busy',
+            'start': {'dateTime': tz.localize(datetime.combine(date, time(12))).isoformat()},
+            'end': {'dateTime': tz.localize(datetime.combine(date, time(13))).isoformat()},
+        }]}
+        fresh = calendar.get_available_slots(date.isoformat(), service.id)
+        self.assertIn('11:00 AM', fresh)
+        self.assertIn('1:00 PM', fresh)
+
+        resilience.reset_retry_budget()
+        execute.side_effect = OSError('no route to host')
+        stale = calendar.get_available_slots(date.isoformat(), service.id)
+        self.assertTrue(calendar.degraded)
+        self.assertNotIn('11:00 AM', stale)  # Padded by STALE_BUFFER_MINUTES
+        self.assertNotIn('1:00 PM', stale)
+        self.assertIn('1:30 PM', stale)
+
+@override_settings(UPSTREAM_QUOTAS={
+    'google_calendar': {'capacity': 3, 'refill_per_minute': 60},
+    'google_maps': {'capacity': 4, 'refill_per_minute': 0},
+})
+class UpstreamQuotaTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='owner', password='testpass123')
+        self.business = Business.objects.create(owner=user, name='Busy', email='b@b.com', phone='1')
+        resilience.reset_retry_budget()
+
+    def test_bucket_spends_refills_and_counts(self):
+        self.assertTrue(all(quotas.take(self.business.id, 'google_calendar') for _ in range(3)))
+        self.assertFalse(quotas.take(self.business.id, 'google_calendar'))
+        self.assertTrue(quotas.take(self.business.id, 'stripe'))  # Not metered
+
+        quota = UpstreamQuota.objects.get(business=self.business, upstream='google_calendar')
+        self.assertEqual((quota.consumed, quota.denied), (3, 1))
+        UpstreamQuota.objects.filter(pk=quota.pk).update(refilled_at=timezone.now() - timedelta(seconds=2))
+        self.assertTrue(quotas.take(self.business.id, 'google_calendar', cost=2))  # 1/s refill
+        self.assertFalse(quotas.take(self.business.id, 'google_calendar'))
+
+    def test_only_calls_that_go_out_are_charged(self):
+        breaker = resilience.breakers['google_calendar']
+        self.addCleanup(breaker.record_success)
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        fn = Mock(return_value='ok')
+
+        with quotas.charged_to(self.business.id):
+            with self.assertRaises(resilience.CircuitOpen):
+                resilience.call('google_calendar', fn)
+            self.assertFalse(UpstreamQuota.objects.filter(business=self.business).exists())
+
+            # Half-open, but over quota: the trial slot is given back, not used up
+            breaker._opened_at -= breaker.reset_seconds
+            UpstreamQuota.objects.create(business=self.business, upstream='google_calendar', capacity=3,
+                                         refill_per_minute=0, tokens=0, refilled_at=timezone.now())
+            with self.assertRaises(resilience.QuotaExceeded):
+                resilience.call('google_calendar', fn)
+            self.assertTrue(breaker.allow())
+        fn.assert_not_called()
+
+    @patch.dict('directions._known_legs', clear=True)
+    def test_over_quota_travel_times_fall_back_without_calling_maps(self):
+        client = Mock()
+        client.distance_matrix.return_value = {'rows': [
+            {'elements': [{'duration': {'value': 0}}, {'duration': {'value': 600}}]},
+            {'elements': [{'duration': {'value': 660}}, {'duration': {'value': 0}}]},
+        ]}
+        backend = GoogleMapsBackend(client)
+        departure = datetime(2030, 1, 7, 12)
+
+        with quotas.charged_to(self.business.id):
+            TravelTimeCalculator(backend).get_travel_times(('A', 'B'), ('A', 'B'), departure)
+            # 9 more elements don't fit in what's left of the bucket
+            times = TravelTimeCalculator(backend).get_travel_times(('A', 'B', 'C'), ('A', 'B', 'C'), departure)
+
+        self.assertEqual(client.distance_matrix.call_count, 1)
+        self.assertEqual(times['A']['B']['minutes'], 10)  # Last known
+        self.assertEqual(times['A']['C']['minutes'], directions.ESTIMATED_TRAVEL_SECONDS // 60)
+        self.assertEqual(times['C']['C']['minutes'], 0)
+        quota = UpstreamQuota.objects.get(business=self.business, upstream='google_maps')
+        self.assertEqual((quota.consumed, quota.denied), (4, 9))
+
+@override_settings(REMINDER_CHANNEL='scheduler.reminders.EmailChannel', REMINDER_LEAD_HOURS=24)
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.business = Business.objects.create(owner=self.owner, name='Wash Co', email='w@b.com', phone='1')
+        self.service = Service.objects.create(business=self.business, name='Wash', duration=60, price=50)
+        self.customer = Customer.objects.create(name='Dana', email='dana@example.com', phone='2')
+
+    def book(self, start_time):
+        return Booking.objects.create(
+            business=self.business, service=self.service, customer=self.customer, start_time=start_time
+        )
+
+    def test_reminder_follows_start_time_and_status(self):
+        start = timezone.now() + timedelta(days=3)
+        booking = self.book(start)
+        self.assertEqual(booking.next_reminder_at, start - timedelta(hours=24))
+
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.start_time = start + timedelta(days=1)
+        booking.save(update_fields=['start_time'])
+        booking.refresh_from_db()
+        self.assertEqual(booking.next_reminder_at, start)
+
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertIsNone(Booking.objects.get(pk=booking.pk).next_reminder_at)
+        self.assertIsNone(self.book(timezone.now() + timedelta(hours=2)).next_reminder_at)  # Too close
+
+    def test_dispatch_sends_due_reminders_once(self):
+        now = timezone.now()
+        due = [self.book(now + timedelta(days=1, hours=i)) for i in range(3)]
+        later = self.book(now + timedelta(days=5))
+        Booking.objects.filter(pk__in=[b.pk for b in due]).update(next_reminder_at=now - timedelta(minutes=1))
+
+        outcomes = reminders.dispatch_due(batch_size=2)
+        self.assertEqual(outcomes['sent'], 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('Wash Co', mail.outbox[0].body)
+        self.assertFalse(Booking.objects.filter(pk__in=[b.pk for b in due], next_reminder_at__isnull=False).exists())
+        self.assertFalse(Booking.objects.filter(pk__in=[b.pk for b in due], reminder_sent_at__isnull=True).exists())
+        self.assertIsNotNone(Booking.objects.get(pk=later.pk).next_reminder_at)
+        self.assertEqual(reminders.dispatch_due()['sent'], 0)
+
+        # A failed send comes back after RETRY_SECONDS
+        Booking.objects.filter(pk=later.pk).update(next_reminder_at=now)
+        channel = Mock()
+        channel.name = 'sms'
+        channel.send_batch.side_effect = OSError('gateway down')
+        self.assertEqual(reminders.dispatch_due(channel=channel)['failed'], 1)
+        self.assertGreater(Booking.objects.get(pk=later.pk).next_reminder_at, now + timedelta(minutes=10))
+
+    def test_dispatch_emails_a_batch_together(self):
+        now = timezone.now()
+        due = [self.book(now + timedelta(days=1, hours=i)) for i in range(3)]
+        Booking.objects.filter(pk__in=[b.pk for b in due]).update(next_reminder_at=now - timedelta(minutes=1))
+
+        with patch('scheduler.reminders.send_mail_batch', return_value={1: OSError('refused')}) as batch:
+            outcomes = reminders.dispatch_due()
+        batch.assert_called_once()
+        self.assertEqual(len(batch.call_args.args[0]), 3)
+        self.assertEqual((outcomes['sent'], outcomes['failed']), (2, 1))
+        refused = Booking.objects.get(pk=due[1].pk)
+        self.assertIsNone(refused.reminder_sent_at)
+        self.assertGreater(refused.next_reminder_at, now + timedelta(minutes=10))
+
+    def test_due_scan_uses_partial_index(self):
+        plan = Booking.objects.filter(next_reminder_at__lte=timezone.now()).order_by('next_reminder_at').explain()
+        if connection.vendor == 'sqlite':
+            self.assertIn('booking_reminder_due_idx', plan)
+
+    def test_send_reminder_endpoint(self):
+        booking = self.book(timezone.now() + timedelta(days=2))
+        url = reverse('scheduler:send_reminder', kwargs={'booking_id': booking.pk})
+
+        User.objects.create_user(username='stranger', password='testpass123')
+        self.client.login(username='stranger', password='testpass123')
+        self.assertEqual(self.client.post(url).status_code, 403)
+
+        self.client.login(username='owner', password='testpass123')
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['dana@example.com'])
+        booking.refresh_from_db()
+        self.assertIsNotNone(booking.reminder_sent_at)
+        self.assertIsNotNone(booking.next_reminder_at)  # The day-before one still goes out
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.flights = SingleFlight('test')
+
+    def test_concurrent_callers_share_one_computation(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'busy': 42}
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(self.flights.do('1:2030-01-07', compute)))
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(target=lambda: results.append(self.flights.do('1:2030-01-07', compute)))
+            for _ in range(5)
+        ]
+        for follower in followers:
+            follower.start()
+        time_module.sleep(0.05)  # Let them queue behind the leader
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'busy': 42}] * 6)
+        self.assertEqual(self.flights.do('1:2030-01-07', lambda: 'fresh'), 'fresh')  # Nothing kept
+
+    def test_waits_for_result_of_another_worker(self):
+        lock_key = 'singleflight:test:1:2030-01-07'
+        cache.add(lock_key, 'other-worker')
+
+        def other_worker_finishes():
+            time_module.sleep(0.1)
+            cache.set(f'{lock_key}:other-worker', 'theirs')
+            cache.delete(lock_key)
+
+        threading.Thread(target=other_worker_finishes).start()
+        compute = Mock(return_value='mine')
+        self.assertEqual(self.flights.do('1:2030-01-07', compute), 'theirs')
+        compute.assert_not_called()
+
+        # A leader that fails leaves no result: the waiter computes itself
+        cache.add(lock_key, 'crashed')
+        threading.Timer(0.1, cache.delete, [lock_key]).start()
+        self.assertEqual(self.flights.do('1:2030-01-07', compute), 'mine')
+
+class MarginalTravelTests(SimpleTestCase):
+    def setUp(self):
+        self.calendar = CalendarService.__new__(CalendarService)
+        self.calendar.timezone = pytz.timezone('America/New_York')
+        self.calendar.business_hours = {'start': 8, 'end': 18}
+        self.date = self.calendar.timezone.localize(datetime(2030, 1, 7))
+
+    def event(self, start_hour, end_hour, location, summary='Booking'):
+        return CalendarEvent.from_google({
+            'id': f'{start_hour}-{end_hour}',
+            'summary': summary,
+            'start': {'dateTime': self.date.replace(hour=start_hour).isoformat()},
+            'end': {'dateTime': self.date.replace(hour=end_hour).isoformat()},
+            'location': location,
+        }, self.calendar.timezone)
+
+    def test_slots_scored_from_destination_legs(self):
+        # Places on a line: west -- new -- east, 20 minutes apart; far is 60 from everything
+        minutes = {('west', 'new'): 20, ('new', 'east'): 20, ('west', 'east'): 40}
+        def seconds(origins, destinations, departure):
+            def between(a, b):
+                if a == b:
+                    return 0
+                if 'far' in (a, b):
+                    return 3600
+                return 60 * minutes.get((a, b), minutes.get((b, a)))
+            return [[between(a, b) for b in destinations] for a in origins]
+        backend = Mock(travel_seconds=Mock(side_effect=seconds))
+        events = [self.event(9, 10, 'west'), self.event(12, 13, 'east'), self.event(15, 16, 'far')]
+        travel = TravelMatrix(['new'] + [e.location_name for e in events], self.date,
+                              TravelTimeCalculator(backend=backend), hub='new')
+        slots = [{'start': '10:30 AM', 'end': '11:30 AM'}, {'start': '1:30 PM', 'end': '2:30 PM'},
+                 {'start': '4:30 PM', 'end': '5:30 PM'}]
+
+        self.calendar._score_marginal_travel(slots, events, self.date, 'new', travel)
+        self.assertEqual([slot['extra_travel_minutes'] for slot in slots], [0, 20 + 60 - 60, 60])
+        self.assertEqual([slot['recommended'] for slot in slots], [True, False, False])
+        # 3 legs from and 3 to the new address, plus west→east and east→far; not 4 x 4
+        billed = [len(args[0]) * len(args[1]) for args, _ in backend.travel_seconds.call_args_list]
+        self.assertEqual(sum(billed), 8)
+        self.assertEqual(travel.get_travel_times('west', 'new')['west']['new']['minutes'], 20)
+
+    def test_events_normalized_once(self):
+        tz = self.calendar.timezone
+        items = [
+            {'id': 'b', 'summary': TRAVEL_BLOCK_SUMMARY, 'location': '12 Elm St',
+             'start': {'dateTime': '2030-01-07T11:30:00-05:00'}, 'end': {'dateTime': '2030-01-07T12:00:00-05:00'}},
+            {'id': 'a', 'summary': 'Detail', 'location': '12 Elm St',
+             'start': {'dateTime': '2030-01-07T12:00:00-05:00'}, 'end': {'dateTime': '2030-01-07T13:00:00-05:00'}},
+            {'id': 'c', 'summary': 'Closed', 'start': {'date': '2030-01-06'}, 'end': {'date': '2030-01-07'}},
+        ]
+        closed, travel, booking = normalize_events(items, tz)
+
+        self.assertEqual((booking.start, booking.end), (int(self.date.replace(hour=12).timestamp()),
+                                                        int(self.date.replace(hour=13).timestamp())))
+        self.assertEqual(booking.start_at(tz), self.date.replace(hour=12))
+        self.assertEqual((booking.kind, travel.kind), (SERVICE, TRAVEL))
+        self.assertEqual(booking.location, travel.location)  # Interned
+        self.assertEqual(booking.location_name, '12 Elm St')
+        self.assertIsNone(closed.location_name)
+        self.assertEqual(closed.end_at(tz), self.date)  # All-day events end at local midnight
+        # Each call interns into its own table, kept alive by its events
+        [other] = normalize_events([dict(items[1], location='9 Oak Ave')], tz)
+        self.assertIsNot(other.locations, booking.locations)
+        self.assertEqual((other.location_name, booking.location_name), ('9 Oak Ave', '12 Elm St'))
+        with self.assertRaises(AttributeError):
+            booking.description = 'no room for this'
+
+    def test_travel_blocks_are_busy_but_not_stops(self):
+        def travel_times(origins, destinations, departure):
+            return {o: {d: {'minutes': 10} for d in destinations} for o in origins}
+        calculator = Mock(get_travel_times=Mock(side_effect=travel_times))
+        events = [self.event(8, 10, 'client'), self.event(10, 11, None, summary=TRAVEL_BLOCK_SUMMARY)]
+
+        with patch.object(CalendarService, '_get_day_events', create=True, return_value=events), \
+                patch('directions.TravelTimeCalculator', return_value=calculator):
+            slots = self.calendar.get_available_slots('2030-01-07', 60, destination_address='new')
+
+        # The block fills 10-11; the drive is measured from the booking before it
+        self.assertEqual(slots[0]['start'], '11:00 AM')
+        self.assertEqual(slots[0]['extra_travel_minutes'], 10)
+
+    def test_free_intervals_from_merged_busy_list(self):
+        events = [self.event(9, 10, None), self.event(9, 11, None), self.event(14, 15, None)]
+        with patch.object(CalendarService, '_get_day_events', create=True, return_value=events):
+            gaps = self.calendar.get_free_intervals('2030-01-07', min_duration=60)
+        # Buffers pad each merged busy block; 8:00-8:45 is too short
+        self.assertEqual(gaps, [[11 * 60 + 15, 13 * 60 + 45], [15 * 60 + 15, 18 * 60]])
@@ -1,58 +1,119 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, Http404
+from django.http import HttpResponse, JsonResponse, Http404
+from django.contrib import messages
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.csrf import ensure_csrf_cookie
 from core.models import Business, Customer
 from .models import Service, Booking, BusinessHours
 from datetime import datetime, timedelta
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 import pytz
 import json
-from getcalendar import CalendarService
+from getcalendar import get_calendar_service
+from resilience import QuotaExceeded, UpstreamUnavailable
 from .services import DjangoCalendarService
+from . import bookings as booking_service
+from . import reminders
+from .profiles import get_schedule_profile, get_profile_for_booking_url
+from .quotas import charged_to, take as take_quota
+from .streams import publish_availability_change
 
 
 # Create your views here.
 
-# Initialize calendar service
-calendar_service = CalendarService()
+BOOKING_PAGE_TIMEOUT = 60 * 60
 
+@ensure_csrf_cookie
 def booking_page(request, booking_url):
     """Public booking page for customers"""
-    business = get_object_or_404(Business, booking_url=booking_url)
-    services = Service.objects.filter(business=business, active=True)
+    profile = get_profile_for_booking_url(booking_url)
+    if profile is None:
+        raise Http404("Business not found")
     
-    return render(request, 'scheduler/booking_page.html', {
-        'business': business,
-        'services': services,
-    })
+    context = {
+        'business': profile.business,
+        'services': list(profile.services.values()),
+        'profile_version': profile.version,
+    }
+    
+    # Logged-in users and pending messages change the page chrome; render
+    # those normally (the services list is still a cached fragment)
+    if request.user.is_authenticated or len(messages.get_messages(request)):
+        return render(request, 'scheduler/booking_page.html', context)
+    
+    # Anonymous visitors all get the same page, which only changes when the
+    # profile version does: answer conditional GETs with 304 and serve the
+    # rendered page from cache otherwise
+    etag = f'"booking-{profile.business_id}-{profile.version}"'
+    last_modified = profile.version // 1_000_000_000
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        key = f'booking_page:{profile.business_id}:{profile.version}'
+        html = cache.get(key)
+        if html is None:
+            html = render_to_string('scheduler/booking_page.html', context, request=request)
+            cache.set(key, html, BOOKING_PAGE_TIMEOUT)
+        response = HttpResponse(html)
+    
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True)
+    return response
 
 def get_available_slots(request, business_id):
     """API endpoint to get available time slots"""
-    business = get_object_or_404(Business, id=business_id)
+    profile = get_schedule_profile(business_id)
+    if profile is None:
+        raise Http404("Business not found")
     date_str = request.GET.get('date')
     service_id = request.GET.get('service')
     address = request.GET.get('address')
     unit = request.GET.get('unit')
     
-    if not service_id:
+    gaps_mode = request.GET.get('mode') == 'gaps'
+    if not service_id and not (gaps_mode and request.GET.get('min_duration')):
         return JsonResponse({'error': 'Service ID is required'}, status=400)
     
     try:
         # Initialize calendar service with business
-        calendar_service = DjangoCalendarService(business)
+        calendar_service = DjangoCalendarService(profile.business, profile=profile)
+        
+        if gaps_mode:
+            # Free intervals as minute offsets instead of enumerated slots
+            if request.GET.get('min_duration'):
+                min_duration = int(request.GET['min_duration'])
+            else:
+                min_duration = profile.get_service(service_id).duration
+            with charged_to(business_id):
+                gaps = calendar_service.get_free_intervals(date_str, min_duration)
+            return JsonResponse({
+                'date': date_str,
+                'min_duration': min_duration,
+                'gaps': gaps
+            })
         
         # Construct full address if provided
         full_address = f"{address}{f' Unit {unit}' if unit else ''}" if address else None
         
-        # Get available slots
-        available_slots = calendar_service.get_available_slots(
-            date_str,
-            service_id,
-            destination_address=full_address
-        )
+        # Get available slots (Google calls count against the business's quota)
+        with charged_to(business_id):
+            available_slots = calendar_service.get_available_slots(
+                date_str,
+                service_id,
+                destination_address=full_address
+            )
         
-        return JsonResponse({'slots': available_slots})
+        return JsonResponse({'slots': available_slots, 'degraded': calendar_service.degraded})
         
+    except UpstreamUnavailable as e:
+        # No calendar data at all, not even a stale copy
+        return JsonResponse({'error': str(e)}, status=503)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
@@ -61,8 +122,70 @@ def create_booking(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     
-    # ... booking creation logic to be implemented ...
-    return JsonResponse({'success': True})
+    # Accept both form posts and JSON bodies
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    else:
+        data = request.POST
+    
+    required_fields = ['business', 'service', 'name', 'email', 'date', 'time']
+    missing_fields = [field for field in required_fields if not data.get(field)]
+    if missing_fields:
+        return JsonResponse(
+            {'error': f'Missing required fields: {", ".join(missing_fields)}'},
+            status=400
+        )
+    
+    business = get_object_or_404(Business, id=data['business'])
+    service = get_object_or_404(Service, id=data['service'], business=business, active=True)
+    
+    # Slots are shown as "9:00 AM"; also accept 24-hour "09:00"
+    start_time = None
+    for time_format in ('%H:%M', '%I:%M %p'):
+        try:
+            start_time = datetime.strptime(f"{data['date']} {data['time']}", f'%Y-%m-%d {time_format}')
+            break
+        except ValueError:
+            continue
+    if start_time is None:
+        return JsonResponse({'error': 'Invalid date or time'}, status=400)
+    start_time = pytz.timezone(settings.SCHEDULER_TIME_ZONE).localize(start_time)
+    
+    customer, _ = Customer.objects.get_or_create(
+        email=data['email'],
+        defaults={
+            'name': data['name'],
+            'phone': data.get('phone', '')
+        }
+    )
+    
+    try:
+        # Re-checking the calendar counts against the business's quota. Charged
+        # up front so the quota row isn't locked for the booking transaction
+        reads = booking_service.calendar_reads(business)
+        if reads and not take_quota(business.id, 'google_calendar', cost=reads):
+            raise QuotaExceeded('google_calendar', "quota exhausted")
+        booking = booking_service.create_booking(
+            business,
+            service,
+            customer,
+            start_time,
+            notes=data.get('notes', '')
+        )
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'error': ' '.join(e.messages)}, status=409)
+    except UpstreamUnavailable as e:
+        # Can't tell whether the calendar is free
+        return JsonResponse({'success': False, 'error': str(e)}, status=503)
+    
+    return JsonResponse({
+        'success': True,
+        'booking_id': booking.id,
+        'resource': booking.resource.name if booking.resource else None
+    })
 
 @login_required
 def cancel_booking(request, booking_id):
@@ -83,6 +206,28 @@ def cancel_booking(request, booking_id):
     
     return JsonResponse({'success': True})
 
+@login_required
+def send_reminder(request, booking_id):
+    """Send a booking's customer a reminder now"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    booking = get_object_or_404(
+        Booking.objects.select_related('business', 'service', 'customer'), id=booking_id
+    )
+    if request.user != booking.business.owner:
+        return JsonResponse({'error': 'Not authorized'}, status=403)
+    if booking.status not in Booking.ACTIVE_STATUSES or booking.start_time <= timezone.now():
+        return JsonResponse({'error': 'Booking is not upcoming'}, status=400)
+
+    try:
+        sent_at = reminders.send_reminder_now(booking)
+    except Exception as e:
+        print(f"✗ Error sending reminder: {str(e)}")
+        return JsonResponse({'error': 'Reminder could not be sent'}, status=502)
+
+    return JsonResponse({'success': True, 'sent_at': sent_at.isoformat()})
+
 @login_required
 def business_hours(request):
     """Set business operating hours"""
@@ -96,11 +241,21 @@ def hold_slot(request):
     
     try:
         data = json.loads(request.body)
-        result = calendar_service.hold_slot(
+        # Booking pages name the service; its business (not a client-sent id)
+        # is whose availability stream hears about the hold
+        service = None
+        if data.get('service'):
+            service = Service.objects.filter(id=data['service'], active=True).only('name', 'business_id').first()
+            if service is None:
+                return JsonResponse({'error': 'Service not found'}, status=404)
+        result = get_calendar_service().hold_slot(
             data['date'],
             data['time'],
-            data['service_type']
+            service.name if service else data['service_type'],
+            business_id=service.business_id if service else None
         )
+        if result.get('status') == 'success' and service:
+            publish_availability_change(service.business_id, data['date'], 'hold', time=data['time'])
         return JsonResponse(result)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
@@ -120,16 +275,33 @@ def get_calendar_slots(request):
         service = Service.objects.get(id=service_id)
         
         # Construct full address
-        full_address = f"{address}{f' Unit {unit}' if unit else ''}"
+        full_address = f"{address}{f' Unit {unit}' if unit else ''}" if address else None
+        calendar_service = get_calendar_service()
         
-        available_slots = calendar_service.get_available_slots(
-            date, 
-            service.duration,  # Use duration from service model
-            destination_address=full_address
-        )
+        if request.GET.get('mode') == 'gaps':
+            # Free intervals as minute offsets instead of enumerated slots
+            min_duration = int(request.GET.get('min_duration') or service.duration)
+            with charged_to(service.business_id):
+                gaps = calendar_service.get_free_intervals(date, min_duration, destination_address=full_address)
+            return JsonResponse({
+                'date': date,
+                'min_duration': min_duration,
+                'gaps': gaps
+            })
+        
+        # Calendar and Distance Matrix calls count against the business's quota
+        with charged_to(service.business_id):
+            available_slots = calendar_service.get_available_slots(
+                date, 
+                service.duration,  # Use duration from service model
+                destination_address=full_address,
+                rank_by_travel=request.GET.get('sort') == 'travel'
+            )
         return JsonResponse({'slots': available_slots})
     except Service.DoesNotExist:
         return JsonResponse({'error': 'Service not found'}, status=404)
+    except UpstreamUnavailable as e:
+        return JsonResponse({'error': str(e)}, status=503)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -162,7 +334,7 @@ def create_calendar_booking(request):
         booking_data['duration'] = service.duration
 
         # Create the booking
-        result = calendar_service.create_booking(booking_data)
+        result = get_calendar_service().create_booking(booking_data)
         return JsonResponse(result)
 
     except Exception as e:
@@ -182,10 +354,13 @@ def release_slot(request):
             }, status=400)
 
         slot_key = f"{data['date']} {data['time']}"
+        calendar_service = get_calendar_service()
         
-        # Remove the hold if it exists
-        if slot_key in calendar_service.pending_bookings:
-            del calendar_service.pending_bookings[slot_key]
+        # Remove the hold if it exists, telling the page it was placed from
+        hold = calendar_service.pending_bookings.pop(slot_key, None)
+        if hold is not None:
+            if hold.get('business_id'):
+                publish_availability_change(hold['business_id'], data['date'], 'release', time=data['time'])
             return JsonResponse({
                 'status': 'success',
                 'message': 'Hold released successfully'
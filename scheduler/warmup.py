@@ -0,0 +1,22 @@
+"""
+Cache warming for a preforking server (see config/gunicorn.py).
+
+Runs in the gunicorn master once the app is loaded, so what it builds is
+ready for every worker: schedule profiles (with their active services,
+hours and resources) and booking URL lookups. Profiles are cached both in
+the shared cache and in the master's memory, which forked workers share
+until the profile changes.
+"""
+
+from core.models import Business
+from .profiles import get_profile_for_booking_url
+
+
+def warm_caches():
+    """Build every business's schedule profile; returns how many were cached"""
+    profiles = 0
+    for booking_url in Business.objects.values_list('booking_url', flat=True).iterator():
+        # Caches the slug -> business lookup and the profile itself
+        if get_profile_for_booking_url(booking_url) is not None:
+            profiles += 1
+    return profiles
@@ -0,0 +1,187 @@
+"""
+Pooled SMTP connections for outbound mail.
+
+Flask-Mail's mail.send() and Django's default email backend open a new
+connection for every message: TCP connect, TLS handshake and AUTH with the
+mail server, seconds per message before anything is sent. SMTPPool keeps up
+to `size` authenticated connections open and lends them out, so a message
+costs one SMTP transaction, and send_batch() sends a whole batch over one
+connection.
+
+- Connections idle for more than KEEPALIVE_SECONDS are checked with NOOP
+  before reuse, and reopened if the server has dropped them.
+- A connection that breaks mid-send is discarded and the message retried
+  once on a fresh one.
+- Connections are recycled after MAX_MESSAGES_PER_CONNECTION messages,
+  under the per-connection limits providers like Gmail enforce.
+- Pools are per process: a forked worker starts without connections.
+
+Messages are (from address, [recipient addresses], message bytes) envelopes,
+so both Flask-Mail (backend.py) and Django (core.mail) can send through it.
+"""
+
+import os
+import smtplib
+import ssl
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+POOL_SIZE = 4
+TIMEOUT_SECONDS = 10
+KEEPALIVE_SECONDS = 30
+MAX_MESSAGES_PER_CONNECTION = 100
+
+# Errors after which a connection can't be trusted for another message
+# (smtplib's own exceptions are OSErrors too)
+BROKEN_CONNECTION_ERRORS = (OSError,)
+
+
+class _Connection:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """Bounded pool of open, logged-in SMTP connections to one server"""
+
+    def __init__(self, host, port, username=None, password=None, use_ssl=False, use_tls=False,
+                 size=POOL_SIZE, timeout=TIMEOUT_SECONDS):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = deque()
+        _pools.add(self)
+
+    def _open(self):
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.use_tls:
+                smtp.starttls(context=ssl.create_default_context())
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        print(f"✓ Opened SMTP connection to {self.host}:{self.port}")
+        return _Connection(smtp)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.smtp.quit()
+        except OSError:
+            connection.smtp.close()
+
+    def _alive(self, connection):
+        if time.monotonic() - connection.last_used < KEEPALIVE_SECONDS:
+            return True
+        try:
+            return connection.smtp.noop()[0] == 250
+        except BROKEN_CONNECTION_ERRORS:
+            return False
+
+    def _take(self):
+        """An idle connection that still works, else a new one"""
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None  # Most recently used first
+            if connection is None:
+                return self._open()
+            if self._alive(connection):
+                return connection
+            self._close(connection)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; it goes back to the pool unless it broke"""
+        self._slots.acquire()
+        connection = None
+        try:
+            connection = self._take()
+            yield connection
+        except BROKEN_CONNECTION_ERRORS:
+            if connection is not None:
+                connection.smtp.close()
+                connection = None
+            raise
+        finally:
+            if connection is not None:
+                connection.last_used = time.monotonic()
+                if connection.sent >= MAX_MESSAGES_PER_CONNECTION:
+                    self._close(connection)
+                else:
+                    with self._lock:
+                        self._idle.append(connection)
+            self._slots.release()
+
+    def send_batch(self, envelopes):
+        """Send (from, [to], bytes) envelopes over one connection
+
+        Returns {index: error} for messages the server refused; a lost
+        connection is reopened and the message retried once before its
+        error is raised.
+        """
+        envelopes = list(envelopes)
+        refused = {}
+        i = 0
+        while i < len(envelopes):
+            retried = False
+            with self.connection() as connection:
+                while i < len(envelopes):
+                    if connection.sent >= MAX_MESSAGES_PER_CONNECTION:
+                        break  # Recycled on return; continue on a fresh one
+                    from_addr, to_addrs, message = envelopes[i]
+                    try:
+                        connection.smtp.sendmail(from_addr, to_addrs, message)
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                            smtplib.SMTPDataError) as e:
+                        refused[i] = e  # sendmail() has reset the session; carry on
+                    except BROKEN_CONNECTION_ERRORS:
+                        if retried:
+                            raise
+                        retried = True
+                        print(f"⚠ SMTP connection to {self.host} lost, reconnecting")
+                        connection.smtp.close()
+                        connection.smtp = self._open().smtp
+                        connection.sent = 0
+                        continue
+                    connection.sent += 1
+                    retried = False
+                    i += 1
+        return refused
+
+    def send(self, from_addr, to_addrs, message):
+        """Send one message over a pooled connection; raises if the server refuses it"""
+        refused = self.send_batch([(from_addr, to_addrs, message)])
+        if refused:
+            raise refused[0]
+
+    def close(self):
+        """Quit every idle connection"""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection in idle:
+            self._close(connection)
+
+
+_pools = weakref.WeakSet()
+
+
+def _forget_inherited_connections():
+    # A forked child must not talk over the parent's sockets
+    for pool in list(_pools):
+        pool._idle.clear()
+
+
+os.register_at_fork(after_in_child=_forget_inherited_connections)